@@ -0,0 +1,130 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+import numpy as np
+
+class OllamaEmbedder:
+    """Embeds text with a local Ollama embedding model for semantic cache lookups"""
+
+    def __init__(self, model_name: str = "nomic-embed-text", base_url: str = "http://localhost:11434",
+                 timeout: float = 10.0):
+        self.model_name = model_name
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def __call__(self, text: str) -> Optional[np.ndarray]:
+        """Return the embedding of text, or None if the embedding model is unavailable"""
+        import requests
+        try:
+            response = requests.post(
+                f"{self.base_url}/api/embeddings",
+                json={"model": self.model_name, "prompt": text},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            return np.asarray(response.json()["embedding"], dtype=np.float32)
+        except Exception as e:
+            print(f"Embedding error: {str(e)}")
+            return None
+
+class AnswerCache:
+    """LRU cache of answers keyed by dataset hash, normalized question and visualization flag
+
+    Exact matches are a dictionary lookup on the normalized question. When an
+    embed_fn is given, a miss falls back to the most similar cached question for
+    the same dataset and flag, accepted only above similarity_threshold.
+    """
+
+    def __init__(self, max_entries: int = 512, embed_fn: Optional[Callable[[str], Optional[np.ndarray]]] = None,
+                 similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._embeddings = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """Lowercase, drop punctuation and collapse whitespace"""
+        question = re.sub(r"[^\w\s]", " ", question.lower())
+        return " ".join(question.split())
+
+    def _key(self, dataset_hash: str, question: str, include_visualization: bool) -> tuple:
+        return (dataset_hash, self.normalize_question(question), bool(include_visualization))
+
+    def get(self, dataset_hash: str, question: str, include_visualization: bool):
+        """Return the cached value for the question, or None"""
+        key = self._key(dataset_hash, question, include_visualization)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        match = self._semantic_lookup(key)
+        with self._lock:
+            if match is not None and match in self._entries:
+                self._entries.move_to_end(match)
+                self.semantic_hits += 1
+                return self._entries[match]
+            self.misses += 1
+        return None
+
+    def _semantic_lookup(self, key: tuple) -> Optional[tuple]:
+        if self.embed_fn is None:
+            return None
+        with self._lock:
+            candidates = [(k, v) for k, v in self._embeddings.items() if k[0] == key[0] and k[2] == key[2]]
+        if not candidates:
+            return None
+        query = self._embed(key[1])
+        if query is None:
+            return None
+        matrix = np.stack([embedding for _, embedding in candidates])
+        similarities = matrix @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            return candidates[best][0]
+        return None
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        embedding = self.embed_fn(text)
+        if embedding is None:
+            return None
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else None
+
+    def put(self, dataset_hash: str, question: str, include_visualization: bool, value) -> None:
+        """Store a value, evicting the least recently used entries beyond max_entries"""
+        key = self._key(dataset_hash, question, include_visualization)
+        embedding = self._embed(key[1]) if self.embed_fn is not None else None
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if embedding is not None:
+                self._embeddings[key] = embedding
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._embeddings.pop(evicted, None)
+
+    def invalidate(self, dataset_hash: str) -> None:
+        """Drop every entry for a dataset"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == dataset_hash]:
+                del self._entries[key]
+                self._embeddings.pop(key, None)
+
+    def stats(self) -> dict:
+        """Entry count and hit/miss counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+            }
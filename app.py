@@ -1,56 +1,513 @@
-import gradio as gr
+import asyncio
+import os
+import threading
+import time
 from csv_handler import CSVHandler
-from llm_processor import LLMProcessor
-from visualization import VisualizationGenerator
+from columnar_cache import ColumnarCache
+from query_engine import QueryEngine
+from session_store import SessionStore, DEFAULT_SESSION
+from table_registry import TableRegistry
+from answer_cache import AnswerCache, OllamaEmbedder
+from intent_matcher import IntentMatcher
 from models import VisualizationParams
+from instrumentation import Instrumentation
+import instrumentation
 
 class CSVAnalysisApp:
     """Main application class integrating all modules"""
     
-    def __init__(self):
-        """Initialize the application components"""
-        self.csv_handler = CSVHandler()
-        self.llm_processor = LLMProcessor()
-        self.viz_generator = VisualizationGenerator()
-        self.current_df = None
+    def __init__(self, use_query_engine: bool = True, max_llm_concurrency: int = 2, max_llm_queue: int = 32,
+                 memory_budget_bytes: int = 4 << 30, session_ttl_seconds: float = 3600,
+                 answer_cache_size: int = 512, semantic_cache: bool = False, stream_answers: bool = True,
+                 llm_model=None, trace_log=None, metrics_port=None, use_fast_path: bool = True,
+                 approximate_profiles: bool = False, ingest_workers: int = 1):
+        """Initialize the application components
+        
+        The LLM processor and the visualization generator are created on first
+        use, so callers that never reach them do not import pydantic-ai or matplotlib.
+        llm_model replaces the Ollama model (see LLMProcessor).
+        
+        Every upload and question is traced; traces are appended to trace_log as
+        JSON lines when it is set, and metrics_port starts a Prometheus endpoint.
+        
+        With use_fast_path, schema and summary questions that the intent matcher
+        recognizes confidently are answered from the profile without the LLM.
+        
+        approximate_profiles profiles uploads with sketches (distinct counts,
+        heavy hitters, quartiles) instead of exact counts and sorts; the error
+        bounds are shown in the upload preview and given to the LLM.
+        
+        ingest_workers > 1 parses and profiles uploads on that many cores
+        (0 means all of them); see CSVHandler.load_csv.
+        """
+        self.csv_handler = CSVHandler(cache=ColumnarCache())
+        self.max_llm_concurrency = max_llm_concurrency
+        self.max_llm_queue = max_llm_queue
+        self.llm_model = llm_model
+        self._llm_processor = None
+        self._viz_generator = None
+        self._init_lock = threading.Lock()
+        # Loaded datasets and their profiles, one per browser session
+        self.sessions = SessionStore(max_bytes=memory_budget_bytes, ttl_seconds=session_ttl_seconds)
+        # Answers to earlier questions, optionally matched by embedding similarity
+        self.answer_cache = AnswerCache(
+            max_entries=answer_cache_size,
+            embed_fn=OllamaEmbedder() if semantic_cache else None
+        )
+        # Profile uploads with sketches instead of exact statistics
+        self.approximate_profiles = approximate_profiles
+        # Cores used to parse and profile an upload
+        self.ingest_workers = ingest_workers
+        # Answer schema and summary questions straight from the dataset profile
+        self.use_fast_path = use_fast_path
+        self.intent_matcher = IntentMatcher()
+        # Answer aggregate questions by executing an LLM-planned query locally
+        self.use_query_engine = use_query_engine
+        # Show LLM answers token by token in the UI instead of waiting for the full response
+        self.stream_answers = stream_answers
+        # Per-request stage timings, exported to the JSON log and Prometheus
+        self.instrumentation = Instrumentation(log_path=trace_log, gauges_fn=self._gauges)
+        if metrics_port is not None:
+            self.instrumentation.start_metrics_server(metrics_port)
+    
+    @property
+    def llm_processor(self):
+        if self._llm_processor is None:
+            with self._init_lock:
+                if self._llm_processor is None:
+                    from llm_processor import LLMProcessor
+                    self._llm_processor = LLMProcessor(max_concurrency=self.max_llm_concurrency,
+                                                       max_queue=self.max_llm_queue, model=self.llm_model)
+        return self._llm_processor
     
-    def handle_file_upload(self, file):
-        """Handle CSV file upload"""
+    @property
+    def viz_generator(self):
+        if self._viz_generator is None:
+            with self._init_lock:
+                if self._viz_generator is None:
+                    from visualization import VisualizationGenerator
+                    self._viz_generator = VisualizationGenerator()
+        return self._viz_generator
+    
+    def handle_file_upload(self, file, session_id=DEFAULT_SESSION, append=False):
+        """Handle CSV file upload; several files are registered as tables that can be joined
+        
+        With append, a single file holds only new rows for the loaded dataset.
+        """
         try:
-            self.current_df, info = self.csv_handler.load_csv(file.name)
-            return info
+            files = file if isinstance(file, list) else [file]
+            if len(files) > 1:
+                return self.load_tables([f.name for f in files], session_id)
+            if append:
+                return self.append_dataset(files[0].name, session_id)
+            return self.load_dataset(files[0].name, session_id)
         except Exception as e:
             return f"Error: {str(e)}"
     
-    def handle_question(self, question, include_visualization):
-        """Process a user question about the CSV data"""
-        if self.current_df is None:
-            return "Please upload a CSV file first.", None
+    def load_dataset(self, path, session_id=DEFAULT_SESSION, schema=None, reuse_schema=False):
+        """Load a CSV file into a session and return the dataset information text
         
-        try:
-            # Process the question using the LLM
-            response = self.llm_processor.process_query(
-                self.current_df, 
-                question, 
-                include_visualization
-            )
+        If the file is the session's current file with rows appended, only the
+        new rows are parsed (see CSVHandler.load_csv).
+        
+        A dtype schema is only used when asked for: schema passes one explicitly,
+        and reuse_schema takes the one of the dataset this session loaded before
+        (e.g. the previous file of a daily feed). Schemas are never shared between
+        sessions, and numeric types are widened before they are applied to new data.
+        """
+        with self.instrumentation.trace("upload", session=session_id, file=os.path.basename(path)):
+            previous = self.sessions.get(session_id)
+            if schema is None and reuse_schema and previous is not None and previous.profile is not None:
+                schema = previous.profile.schema
+            df, info, profile = self.csv_handler.load_csv(
+                path, previous_profile=previous.profile if previous else None,
+                schema=schema, approximate=self.approximate_profiles,
+                workers=self.ingest_workers, previous_df=previous.df if previous else None)
+            return self._store_dataset(session_id, df, info, profile)
+    
+    def append_dataset(self, path, session_id=DEFAULT_SESSION):
+        """Append the rows of a delta CSV (same header, new rows only) to the session's dataset"""
+        with self.instrumentation.trace("upload", session=session_id, file=os.path.basename(path)):
+            data, message = self._get_session(session_id)
+            if data is None:
+                raise ValueError(message)
+            if data.profile is None:
+                raise ValueError("Rows can only be appended to a single uploaded file, not to joined tables")
+            df, info, profile = self.csv_handler.append_csv(path, data.df, data.profile,
+                                                            workers=self.ingest_workers)
+            return self._store_dataset(session_id, df, info, profile)
+    
+    def _store_dataset(self, session_id, df, info, profile):
+        """Keep a loaded dataset in its session; answers and figures of the version it grew from are dropped"""
+        if profile.parent_hash is not None:
+            self.answer_cache.invalidate(profile.parent_hash)
+            if self._viz_generator is not None:
+                self._viz_generator.invalidate(profile.parent_hash)
+        data = self.sessions.put(session_id, df, profile)
+        instrumentation.record(session_bytes=data.nbytes)
+        info += f"\nSession memory: {data.nbytes / 1e6:.2f} MB"
+        return info
+    
+    def load_tables(self, paths, session_id=DEFAULT_SESSION):
+        """Register several CSV files as named tables of a session and return their description
+        
+        Only headers and sample rows are read now; the columns a question or chart
+        refers to are parsed when first needed.
+        """
+        with self.instrumentation.trace("upload", session=session_id, files=len(paths)):
+            tables = TableRegistry()
+            for path in paths:
+                tables.register(path)
+            data = self.sessions.put(session_id, None, None, tables=tables)
+            instrumentation.record(tables=len(tables), session_bytes=data.nbytes)
+            return tables.info_text() + f"\nSession memory: {data.nbytes / 1e6:.2f} MB"
+    
+    def _get_session(self, session_id):
+        """Return (session data, None) or (None, message for the user)"""
+        data = self.sessions.get(session_id)
+        if data is None:
+            return None, self.sessions.pop_eviction_notice(session_id) or "Please upload a CSV file first."
+        return data, None
+    
+    def handle_question(self, question, include_visualization, session_id=DEFAULT_SESSION, use_cache=True,
+                        use_history=True):
+        """Process a user question about the CSV data
+        
+        With use_history the session's earlier questions and answers go to the LLM
+        after the data context, so follow-up questions work, and this turn is added
+        to them.
+        """
+        data, message = self._get_session(session_id)
+        if data is None:
+            return message, None
+        
+        with self.instrumentation.trace("question", session=session_id, include_visualization=include_visualization):
+            try:
+                steps = self._question_steps(data, question, include_visualization, use_cache, use_history)
+                result, error = None, None
+                while True:
+                    step = steps.throw(error) if error is not None else steps.send(result)
+                    result, error = None, None
+                    try:
+                        if step[0] == "compute":
+                            result = step[1](*step[2:])
+                        elif step[0] == "plan":
+                            result = self.llm_processor.plan_query(data.profile, question, tables=data.tables)
+                        else:
+                            result = self.llm_processor.process_query(
+                                data.df, 
+                                question, 
+                                include_visualization,
+                                profile=data.profile,
+                                tables=data.tables,
+                                history=step[1]
+                            )
+                    except RuntimeError as e:
+                        error = e
             
-            # Generate visualization if requested
-            fig = None
-            if response.create_visualization and response.visualization_params:
-                fig = self.viz_generator.create_visualization(
-                    self.current_df,
-                    response.visualization_params
-                )
+            except StopIteration as done:
+                return done.value
+            except Exception as e:
+                instrumentation.record(error=str(e))
+                return f"Error processing question: {str(e)}", None
+    
+    async def handle_question_async(self, question, include_visualization, session_id=DEFAULT_SESSION, use_cache=True,
+                                    use_history=True):
+        """Async variant of handle_question; LLM calls wait in the processor's request limiter
+        
+        Callers asking independent questions about one dataset (e.g. a batch) pass
+        use_history=False, so the questions neither see nor extend each other.
+        """
+        data, message = self._get_session(session_id)
+        if data is None:
+            return message, None
+        
+        with self.instrumentation.trace("question", session=session_id, include_visualization=include_visualization):
+            try:
+                steps = self._question_steps(data, question, include_visualization, use_cache, use_history)
+                result, error = None, None
+                while True:
+                    step = steps.throw(error) if error is not None else steps.send(result)
+                    result, error = None, None
+                    try:
+                        if step[0] == "compute":
+                            result = await asyncio.to_thread(step[1], *step[2:])
+                        elif step[0] == "plan":
+                            result = await self.llm_processor.plan_query_async(data.profile, question,
+                                                                               tables=data.tables)
+                        else:
+                            result = await self.llm_processor.process_query_async(
+                                data.df, 
+                                question, 
+                                include_visualization,
+                                profile=data.profile,
+                                tables=data.tables,
+                                history=step[1]
+                            )
+                    except RuntimeError as e:
+                        error = e
             
-            return response.answer, fig
+            except StopIteration as done:
+                return done.value
+            except Exception as e:
+                instrumentation.record(error=str(e))
+                return f"Error processing question: {str(e)}", None
+    
+    async def handle_question_stream(self, question, include_visualization, session_id=DEFAULT_SESSION,
+                                     use_cache=True, use_history=True):
+        """Streaming variant of handle_question_async that yields (answer, figure) updates
         
-        except Exception as e:
-            return f"Error processing question: {str(e)}", None
+        LLM answers are yielded as partial text while tokens arrive; the chart is
+        drawn once, from the final validated response. Fast path, cached and
+        query engine answers arrive in a single update.
+        """
+        data, message = self._get_session(session_id)
+        if data is None:
+            yield message, None
+            return
+        
+        with self.instrumentation.trace("question", session=session_id, include_visualization=include_visualization):
+            try:
+                steps = self._question_steps(data, question, include_visualization, use_cache, use_history)
+                result, error = None, None
+                while True:
+                    step = steps.throw(error) if error is not None else steps.send(result)
+                    result, error = None, None
+                    try:
+                        if step[0] == "compute":
+                            result = await asyncio.to_thread(step[1], *step[2:])
+                        elif step[0] == "plan":
+                            result = await self.llm_processor.plan_query_async(data.profile, question,
+                                                                               tables=data.tables)
+                        else:
+                            async for result in self.llm_processor.stream_query_async(
+                                data.df, 
+                                question, 
+                                include_visualization,
+                                profile=data.profile,
+                                tables=data.tables,
+                                history=step[1]
+                            ):
+                                if isinstance(result.answer, str) and result.answer:
+                                    yield result.answer, None
+                    except RuntimeError as e:
+                        error = e
+            
+            except StopIteration as done:
+                yield done.value
+            except Exception as e:
+                instrumentation.record(error=str(e))
+                yield f"Error processing question: {str(e)}", None
+    
+    def _question_steps(self, data, question, include_visualization, use_cache, use_history):
+        """The answering flow shared by the sync, async and streaming question handlers
+        
+        A generator that yields the LLM calls it needs, ("plan",) for a query plan
+        and ("answer", history) for an answer, and is sent their results (or has
+        their RuntimeError thrown in), so the handlers only differ in how they
+        make those calls. Blocking steps (intent matching, answer cache lookups
+        and stores, which may call the embedding model, query execution and chart
+        rendering) are yielded as ("compute", function, *args), which the async
+        handlers run on a worker thread to keep the event loop serving other
+        sessions. Returns the rendered (answer, figure).
+        """
+        fast = yield ("compute", self._fast_answer, data, question, include_visualization)
+        if fast is not None:
+            self._add_turn(data, question, fast[0], use_history)
+            return (yield ("compute", self._render, data, *fast))
+        
+        cached = yield ("compute", self._cached_answer, data, question, include_visualization, use_cache)
+        if cached is not None:
+            self._add_turn(data, question, cached[0], use_history)
+            return (yield ("compute", self._render, data, *cached))
+        
+        history = data.conversation.turns() if use_history else []
+        
+        # Aggregate questions are planned by the LLM and computed exactly
+        answer, chart = None, None
+        if self._can_use_query_engine(data):
+            try:
+                plan = yield ("plan",)
+            except RuntimeError as e:
+                # A failed plan (e.g. used up validation retries) falls back to the LLM like an unanswerable one
+                print(f"Query planning failed, falling back to LLM answer: {str(e)}")
+                instrumentation.record(plan_error=str(e))
+                plan = None
+            if plan is not None:
+                answer, chart = yield ("compute", self._answer_from_plan, data, plan, include_visualization)
+        
+        # Process the question using the LLM
+        standalone = True
+        if answer is None:
+            self._record_path(data, "llm")
+            response = yield ("answer", history)
+            answer, chart = self._answer_from_response(response)
+            # An answer that built on earlier turns may make no sense on its own
+            standalone = not history
+        
+        if standalone:
+            yield ("compute", self.answer_cache.put, data.content_hash, question, include_visualization,
+                   (answer, chart))
+        self._add_turn(data, question, answer, use_history)
+        return (yield ("compute", self._render, data, answer, chart))
+    
+    @staticmethod
+    def _add_turn(data, question, answer, use_history):
+        """Add an answered question to the session's conversation"""
+        if use_history:
+            data.conversation.add(question, answer)
+    
+    def _record_path(self, data, path, **attributes):
+        """Note which path answered, in the request trace and for the session's UI"""
+        instrumentation.record(path=path, **attributes)
+        data.last_answer_path = path
+    
+    def answer_path(self, session_id=DEFAULT_SESSION):
+        """The path that answered the session's latest question: fast_path, cache, query_engine or llm"""
+        data = self.sessions.get(session_id)
+        return data.last_answer_path if data is not None else None
+    
+    def _fast_answer(self, data, question, include_visualization):
+        """(answer, chart) for a confidently recognized schema or summary question, else None"""
+        # Every question starts here, so forget which path answered the previous one
+        data.last_answer_path = None
+        # Lazily loaded tables have no precomputed profile to answer from
+        if not self.use_fast_path or data.profile is None:
+            return None
+        with instrumentation.span("intent_match"):
+            match = self.intent_matcher.match(data.profile, question)
+        if match is None or match.confidence < self.intent_matcher.threshold:
+            return None
+        self._record_path(data, "fast_path", intent=match.intent, intent_confidence=round(match.confidence, 3))
+        chart = None
+        if include_visualization and match.visualization is not None:
+            chart = (None, match.visualization)
+        return match.answer, chart
+    
+    def _cached_answer(self, data, question, include_visualization, use_cache):
+        """Look up a previous (answer, chart) for this dataset; use_cache=False bypasses the lookup"""
+        if not use_cache:
+            return None
+        cached = self.answer_cache.get(data.content_hash, question, include_visualization)
+        if cached is not None:
+            self._record_path(data, "cache")
+        return cached
+    
+    def _can_use_query_engine(self, data):
+        # Streamed uploads only keep a row sample, so exact answers are not possible
+        return self.use_query_engine and (data.tables is not None or not data.profile.streamed)
+    
+    def _render(self, data, answer, chart):
+        """Draw the chart, if any, and return (answer, figure)
+        
+        A chart is (frame, VisualizationParams); a frame of None means the session's dataset.
+        """
+        fig = None
+        if chart is not None:
+            frame, params = chart
+            dataset_hash = None
+            if frame is None:
+                # Charts of the session's data are memoized by its content hash
+                dataset_hash = data.content_hash
+                if data.tables is None:
+                    frame = data.df
+                else:
+                    # Load just the charted columns of the session's tables
+                    try:
+                        frame = data.tables.frame_for_columns(params.columns)
+                    except ValueError as e:
+                        print(f"Could not load chart columns: {str(e)}")
+                        return answer, None
+                    self.sessions.account(data)
+            with instrumentation.span("render"):
+                fig = self.viz_generator.create_visualization(frame, params, dataset_hash=dataset_hash)
+        return answer, fig
+    
+    def _answer_from_response(self, response):
+        """Turn an LLM response into (answer, chart)"""
+        # Generate visualization if requested
+        chart = None
+        if response.create_visualization and response.visualization_params:
+            chart = (None, response.visualization_params)
+        
+        return response.answer, chart
+    
+    def _answer_from_plan(self, data, plan, include_visualization):
+        """Execute a QueryPlan locally; returns (None, None) to fall back to the LLM answer"""
+        if not plan.answerable or not (plan.aggregations or plan.group_by):
+            return None, None
+        try:
+            with instrumentation.span("query_execute"):
+                if data.tables is not None:
+                    result, matched_rows = QueryEngine.execute_tables(data.tables, plan)
+                else:
+                    result, matched_rows = QueryEngine.execute(data.df, plan)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Query plan execution failed, falling back to LLM answer: {str(e)}")
+            return None, None
+        finally:
+            if data.tables is not None:
+                self.sessions.account(data)
+        self._record_path(data, "query_engine", joins=len(plan.joins))
+        
+        chart = None
+        if include_visualization and plan.group_by and len(result.columns) > len(plan.group_by):
+            # One bar per group, using the first aggregate as the value
+            chart = (result, VisualizationParams(
+                visualization_type="bar",
+                columns=[plan.group_by[0], result.columns[len(plan.group_by)]],
+            ))
+        return QueryEngine.format_result(result, matched_rows), chart
+    
+    def _gauges(self):
+        """Limiter, session and cache state exported as Prometheus gauges"""
+        metrics = self.get_metrics()
+        metrics.pop("requests")
+        return metrics
+    
+    def get_metrics(self):
+        """LLM request limiter, session store and cache metrics"""
+        # Components that have not been created yet have nothing to report
+        return {
+            "llm": self._llm_processor.limiter.metrics() if self._llm_processor else {},
+            "sessions": self.sessions.stats(),
+            "answer_cache": self.answer_cache.stats(),
+            "columnar_cache": self.csv_handler.cache.stats() if self.csv_handler.cache is not None else {},
+            "figure_cache": self._viz_generator.cache_stats() if self._viz_generator else {},
+            "requests": self.instrumentation.summary(),
+        }
 
 # Create the Gradio interface for the application
-def create_interface():
-    app = CSVAnalysisApp()
+def create_interface(**app_options):
+    """Build the Gradio UI; app_options are passed to CSVAnalysisApp"""
+    import gradio as gr
+    app = CSVAnalysisApp(**app_options)
+    
+    # Datasets are stored per browser session, keyed by Gradio's session hash
+    def handle_file_upload(file, append, request: gr.Request):
+        return app.handle_file_upload(file, session_id=request.session_hash, append=append)
+    
+    # How each answer path is named under the answer
+    path_labels = {
+        "fast_path": "the fast path (computed from the dataset profile, no LLM)",
+        "cache": "the answer cache",
+        "query_engine": "the query engine (LLM plan, computed locally)",
+        "llm": "the LLM",
+    }
+    
+    async def handle_question(question, include_visualization, use_cache, request: gr.Request):
+        start = time.perf_counter()
+        if not app.stream_answers:
+            answer, fig = await app.handle_question_async(
+                question, include_visualization, session_id=request.session_hash, use_cache=use_cache)
+        else:
+            answer, fig = None, None
+            async for answer, fig in app.handle_question_stream(
+                    question, include_visualization, session_id=request.session_hash, use_cache=use_cache):
+                yield answer, fig, ""
+        path = app.answer_path(request.session_hash)
+        source = f"Answered by {path_labels[path]} in {(time.perf_counter() - start) * 1000:.0f} ms" if path else ""
+        yield answer, fig, source
     
     # Custom CSS for modern dark theme
     custom_css = """
@@ -224,17 +681,24 @@ def create_interface():
                 # File upload component with better styling
                 gr.Markdown("### 📁 Upload Your Data", elem_classes="section-title")
                 file_input = gr.File(
-                    label="Upload CSV File", 
+                    label="Upload CSV Files (several files become tables that can be joined)", 
                     file_types=[".csv"],
+                    file_count="multiple",
                     elem_classes="file-upload"
                 )
+                append_checkbox = gr.Checkbox(
+                    label="Append rows to the loaded data",
+                    value=False,
+                    info="Check this when the file holds only new rows with the same columns",
+                    elem_classes="checkbox"
+                )
                 file_info = gr.Textbox(
                     label="Dataset Information",
                     lines=8,
                     interactive=False,
                     elem_classes="output-box"
                 )
-                file_input.change(app.handle_file_upload, inputs=file_input, outputs=file_info)
+                file_input.change(handle_file_upload, inputs=[file_input, append_checkbox], outputs=file_info)
             
             with gr.Column(scale=1):
                 # Question input with better styling
@@ -251,6 +715,12 @@ def create_interface():
                     info="Check this to generate a relevant visualization",
                     elem_classes="checkbox"
                 )
+                cache_checkbox = gr.Checkbox(
+                    label="Use cached answers",
+                    value=True,
+                    info="Uncheck to ask the model again instead of reusing an earlier answer",
+                    elem_classes="checkbox"
+                )
                 
                 # Output components with better styling
                 gr.Markdown("### 💡 Answer", elem_classes="section-title")
@@ -260,6 +730,7 @@ def create_interface():
                     interactive=False,
                     elem_classes="output-box"
                 )
+                answer_source = gr.Markdown(elem_classes="subtitle")
                 
                 gr.Markdown("### 📈 Visualization", elem_classes="section-title")
                 graph_output = gr.Plot(
@@ -275,9 +746,9 @@ def create_interface():
                     elem_classes="button"
                 )
                 submit_button.click(
-                    app.handle_question, 
-                    inputs=[question_input, viz_checkbox], 
-                    outputs=[answer_output, graph_output]
+                    handle_question, 
+                    inputs=[question_input, viz_checkbox, cache_checkbox], 
+                    outputs=[answer_output, graph_output, answer_source]
                 )
         
         # Add some example questions with better styling
@@ -293,10 +764,28 @@ def create_interface():
             </ul>
         </div>
         """)
+        
+        with gr.Accordion("📊 Server Metrics", open=False):
+            metrics_output = gr.JSON(label="LLM queue and session memory")
+            refresh_metrics = gr.Button("Refresh", size="sm")
+            refresh_metrics.click(app.get_metrics, outputs=metrics_output)
 
+    # Let Gradio hand every request to the app; the LLM request limiter does the queueing
+    limiter = app.llm_processor.limiter
+    demo.queue(default_concurrency_limit=limiter.max_concurrency + limiter.max_queue)
     return demo
 
 # Run the Gradio app
 if __name__ == "__main__":
-    demo = create_interface()
+    import argparse
+    parser = argparse.ArgumentParser(description="CSV Data Analysis Assistant")
+    parser.add_argument("--trace-log", help="Append a JSON line per request to this file")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    parser.add_argument("--approximate-profiles", action="store_true",
+                        help="Profile uploads with sketches instead of exact statistics")
+    parser.add_argument("--ingest-workers", type=int, default=1,
+                        help="Cores used to parse and profile uploads (0 for all)")
+    args = parser.parse_args()
+    demo = create_interface(trace_log=args.trace_log, metrics_port=args.metrics_port,
+                            approximate_profiles=args.approximate_profiles, ingest_workers=args.ingest_workers)
     demo.launch()
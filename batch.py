@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from typing import Optional
+from app import CSVAnalysisApp
+
+def load_questions(path: str) -> list[dict]:
+    """Read questions from a JSONL file or a text file with one question per line
+
+    JSONL lines hold a "question" field (or "body", as in requests.jsonl) and may
+    set "id" (or "request_id") and "include_visualization". Blank lines are skipped.
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if not path.endswith(".jsonl"):
+                questions.append({"question": line})
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON on line {line_number} of {path}: {str(e)}")
+            question = record.get("question") or record.get("body")
+            if not question:
+                raise ValueError(f"Line {line_number} of {path} has no question")
+            entry = {"question": question}
+            if record.get("id") or record.get("request_id"):
+                entry["id"] = str(record.get("id") or record.get("request_id"))
+            if "include_visualization" in record:
+                entry["include_visualization"] = bool(record["include_visualization"])
+            questions.append(entry)
+    return questions
+
+class BatchRunner:
+    """Answers a list of questions about one dataset and writes the results to a directory
+
+    The file is loaded and profiled once. Every LLM prompt starts with the same
+    question-independent data context, and at most concurrency questions are in
+    flight at a time, so a batch never overflows the LLM request queue.
+    """
+
+    def __init__(self, app: Optional[CSVAnalysisApp] = None, concurrency: Optional[int] = None):
+        self.app = app or CSVAnalysisApp()
+        self.concurrency = concurrency or self.app.max_llm_concurrency
+
+    def run(self, csv_path: str, questions: list, output_dir: str, include_visualization: bool = False,
+            use_cache: bool = True) -> dict:
+        """Answer the questions and return the batch summary"""
+        return asyncio.run(self.run_async(csv_path, questions, output_dir, include_visualization, use_cache))
+
+    async def run_async(self, csv_path: str, questions: list, output_dir: str, include_visualization: bool = False,
+                        use_cache: bool = True) -> dict:
+        """Answer the questions concurrently and write answers.jsonl, charts/ and summary.json
+
+        questions are strings or dicts as returned by load_questions; a dict's
+        include_visualization overrides the batch-wide flag.
+        """
+        questions = [{"question": q} if isinstance(q, str) else dict(q) for q in questions]
+        for i, entry in enumerate(questions, 1):
+            entry.setdefault("id", f"q{i:03d}")
+            entry.setdefault("include_visualization", include_visualization)
+        os.makedirs(os.path.join(output_dir, "charts"), exist_ok=True)
+
+        start = time.perf_counter()
+        session_id = f"batch-{uuid.uuid4().hex}"
+        self.app.load_dataset(csv_path, session_id)
+        profile = self.app.sessions.get(session_id).profile
+        load_seconds = time.perf_counter() - start
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def answer(entry):
+            async with semaphore:
+                question_start = time.perf_counter()
+                text, fig = await self.app.handle_question_async(
+                    entry["question"], entry["include_visualization"], session_id=session_id,
+                    use_cache=use_cache, use_history=False)
+                seconds = time.perf_counter() - question_start
+            chart = None
+            if fig is not None:
+                chart = os.path.join("charts", re.sub(r"[^\w.-]", "_", entry["id"]) + ".png")
+                fig.savefig(os.path.join(output_dir, chart))
+            return {**entry, "answer": text, "chart": chart, "seconds": round(seconds, 3)}
+
+        try:
+            results = await asyncio.gather(*(answer(entry) for entry in questions))
+        finally:
+            self.app.sessions.discard(session_id)
+
+        with open(os.path.join(output_dir, "answers.jsonl"), "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result, default=str) + "\n")
+
+        timings = sorted(result["seconds"] for result in results)
+        prefix, _ = self.app.llm_processor.shared_context(profile)
+        summary = {
+            "dataset": csv_path,
+            "rows": profile.n_rows,
+            "questions": len(results),
+            "concurrency": self.concurrency,
+            "load_seconds": round(load_seconds, 3),
+            "total_seconds": round(time.perf_counter() - start, 3),
+            "question_seconds_mean": round(sum(timings) / len(timings), 3) if timings else 0.0,
+            "question_seconds_max": timings[-1] if timings else 0.0,
+            "shared_prefix_tokens": self.app.llm_processor.prompt_builder.estimate_tokens(prefix),
+            "charts": sum(1 for result in results if result["chart"]),
+        }
+        with open(os.path.join(output_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a batch of questions about one CSV file")
+    parser.add_argument("csv", help="CSV file to analyze")
+    parser.add_argument("questions", help="JSONL file of questions, or a text file with one question per line")
+    parser.add_argument("-o", "--output", default="batch_output", help="Directory for answers, charts and timings")
+    parser.add_argument("-c", "--concurrency", type=int, default=None,
+                        help="Questions in flight at once (default: the LLM concurrency limit)")
+    parser.add_argument("--visualize", action="store_true", help="Ask for a chart with every answer")
+    parser.add_argument("--no-cache", action="store_true", help="Do not reuse cached answers")
+    args = parser.parse_args(argv)
+
+    runner = BatchRunner(concurrency=args.concurrency)
+    summary = runner.run(args.csv, load_questions(args.questions), args.output,
+                         include_visualization=args.visualize, use_cache=not args.no_cache)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
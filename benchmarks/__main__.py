@@ -0,0 +1,98 @@
+import argparse
+import json
+import sys
+from benchmarks.datasets import SHAPES, SIZES
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Stage benchmarks for loading, profiling, prompting, LLM and rendering")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the suite and write JSON results")
+    run.add_argument("--sizes", default="10k,1m", help=f"Comma-separated subset of {', '.join(SIZES)}")
+    run.add_argument("--shapes", default="narrow,wide", help=f"Comma-separated subset of {', '.join(SHAPES)}")
+    run.add_argument("--repeat", type=int, default=3, help="Timed runs per stage; the median is reported")
+    run.add_argument("--data-dir", default="benchmarks/data", help="Where generated CSV files are kept")
+    run.add_argument("--output", default="-", help="Result file, or - for stdout")
+    run.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the stub LLM waits per call")
+    run.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc allocation pass")
+    run.add_argument("--no-isolate", action="store_true", help="Run every dataset in this process")
+
+    compare = commands.add_parser("compare", help="Compare two result files and fail on regressions")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.15, help="Relative slowdown that counts as a regression")
+
+    scaling = commands.add_parser("scaling", help="Time parallel parsing and profiling at several worker counts")
+    scaling.add_argument("--size", default="1m", choices=list(SIZES))
+    scaling.add_argument("--shape", default="narrow", choices=list(SHAPES))
+    scaling.add_argument("--workers", help="Comma-separated worker counts (default: powers of two up to the core count)")
+    scaling.add_argument("--repeat", type=int, default=3, help="Timed runs per stage; the median is reported")
+    scaling.add_argument("--data-dir", default="benchmarks/data", help="Where generated CSV files are kept")
+    scaling.add_argument("--output", default="-", help="Result file, or - for stdout")
+
+    worker = commands.add_parser("worker", help=argparse.SUPPRESS)
+    worker.add_argument("path")
+    worker.add_argument("output")
+    worker.add_argument("--repeat", type=int, default=3)
+    worker.add_argument("--llm-latency", type=float, default=0.0)
+    worker.add_argument("--no-memory", action="store_true")
+
+    args = parser.parse_args(argv)
+
+    # The suite imports the app, so keep argument errors and --help fast
+    from benchmarks import suite
+
+    if args.command == "run":
+        sizes = args.sizes.split(",")
+        shapes = args.shapes.split(",")
+        unknown = [size for size in sizes if size not in SIZES] + [shape for shape in shapes if shape not in SHAPES]
+        if unknown:
+            parser.error(f"Unknown size or shape: {', '.join(unknown)}")
+        results = suite.run_suite(sizes, shapes, args.data_dir, args.repeat, not args.no_memory,
+                                  args.llm_latency, isolate=not args.no_isolate)
+        text = json.dumps(results, indent=2)
+        if args.output == "-":
+            print(text)
+        else:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+
+    elif args.command == "scaling":
+        from benchmarks.datasets import dataset_path, generate_csv
+        counts = [int(count) for count in args.workers.split(",")] if args.workers else suite.default_worker_counts()
+        path = generate_csv(dataset_path(args.data_dir, args.size, args.shape), SIZES[args.size], args.shape)
+        results = suite.run_scaling(path, counts, args.repeat)
+        print(f"{'workers':>7} {'stage':<16} {'seconds':>9} {'speedup':>8}", file=sys.stderr)
+        for result in results["results"]:
+            for stage, stats in result["stages"].items():
+                print(f"{result['workers']:>7} {stage:<16} {stats['seconds']:>9.3f} {stats['speedup']:>8.2f}",
+                      file=sys.stderr)
+        text = json.dumps(results, indent=2)
+        if args.output == "-":
+            print(text)
+        else:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+
+    elif args.command == "worker":
+        result = suite.run_dataset(args.path, args.repeat, not args.no_memory, args.llm_latency)
+        with open(args.output, "w") as f:
+            json.dump(result, f)
+
+    elif args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        rows, regressions = suite.compare(base, new, args.threshold)
+        print(f"{'dataset':<32} {'stage':<22} {'base s':>10} {'new s':>10} {'ratio':>7}")
+        for row in rows:
+            flag = "  REGRESSION" if row in regressions else ""
+            print(f"{row['dataset']:<32} {row['stage']:<22} {row['base_seconds']:>10.4f} "
+                  f"{row['new_seconds']:>10.4f} {row['ratio']:>7.2f}{flag}")
+        print(f"{len(regressions)} regression(s) from {base['meta']['commit']} to {new['meta']['commit']}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import os
+import numpy as np
+import pandas as pd
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Number of repetitions of the base column block per shape
+SHAPES = {"narrow": 1, "wide": 8}
+
+CATEGORIES = ["Electronics", "Clothing", "Groceries", "Furniture", "Toys", "Books", "Sports", "Garden"]
+REGIONS = ["North", "South", "East", "West"]
+
+def _block(rng: np.random.Generator, rows: int, suffix: str) -> dict:
+    """One block of mixed columns: low/high-cardinality strings, dates, ints, floats and a flag"""
+    return {
+        f"category{suffix}": rng.choice(CATEGORIES, rows),
+        f"region{suffix}": rng.choice(REGIONS, rows),
+        f"customer{suffix}": np.char.add("C", rng.integers(0, max(rows // 10, 1), rows).astype(str)),
+        f"order_date{suffix}": (np.datetime64("2020-01-01") + rng.integers(0, 1500, rows).astype("timedelta64[D]")),
+        f"quantity{suffix}": rng.integers(1, 50, rows),
+        f"price{suffix}": np.round(rng.gamma(2.0, 40.0, rows), 2),
+        f"discount{suffix}": np.round(rng.random(rows) * 0.3, 3),
+        f"returned{suffix}": rng.random(rows) < 0.05,
+    }
+
+def generate_frame(rows: int, shape: str = "narrow", seed: int = 0, start: int = 0) -> pd.DataFrame:
+    """Deterministic synthetic sales data; start offsets the order ids for chunked generation"""
+    rng = np.random.default_rng([seed, start])
+    columns = {"order_id": np.arange(start, start + rows)}
+    for i in range(SHAPES[shape]):
+        columns.update(_block(rng, rows, "" if i == 0 else f"_{i}"))
+    return pd.DataFrame(columns)
+
+def generate_csv(path: str, rows: int, shape: str = "narrow", seed: int = 0, chunk_rows: int = 500_000) -> str:
+    """Write the synthetic dataset to path in chunks, reusing an existing file of the same name"""
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    for start in range(0, rows, chunk_rows):
+        frame = generate_frame(min(chunk_rows, rows - start), shape, seed, start)
+        frame.to_csv(tmp_path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+def dataset_path(data_dir: str, size: str, shape: str, seed: int = 0) -> str:
+    return os.path.join(data_dir, f"sales-{size}-{shape}-seed{seed}.csv")
@@ -0,0 +1,63 @@
+import asyncio
+import json
+from typing import AsyncIterator
+from pydantic_ai.messages import ModelMessage, ModelResponse, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, DeltaToolCall, DeltaToolCalls, FunctionModel
+
+class StubLLM:
+    """Deterministic stand-in for the Ollama model
+
+    Answer requests get a fixed CSVQueryResponse with a chart of the configured
+    columns, and planning requests get a mean-per-category QueryPlan, so the
+    benchmark exercises the same validation and rendering paths as a real model
+    without network access. Streamed requests get the same arguments as JSON in
+    chunks of chunk_chars characters. latency adds a fixed delay per call.
+    """
+
+    def __init__(self, category_column: str, value_column: str, visualization_type: str = "bar",
+                 latency: float = 0.0, chunk_chars: int = 16):
+        self.category_column = category_column
+        self.value_column = value_column
+        self.visualization_type = visualization_type
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.calls = 0
+
+    def model(self) -> FunctionModel:
+        return FunctionModel(self._respond, stream_function=self._stream)
+
+    async def _respond(self, messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        tool = info.result_tools[0]
+        return ModelResponse(parts=[ToolCallPart(tool.name, self._arguments(tool))])
+
+    async def _stream(self, messages: list[ModelMessage], info: AgentInfo) -> AsyncIterator[DeltaToolCalls]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        tool = info.result_tools[0]
+        text = json.dumps(self._arguments(tool))
+        for start in range(0, len(text), self.chunk_chars):
+            yield {0: DeltaToolCall(name=tool.name if start == 0 else None,
+                                    json_args=text[start:start + self.chunk_chars])}
+
+    def _arguments(self, tool) -> dict:
+        """Arguments of the answer or the plan, whichever result tool the request offers"""
+        if "answer" in tool.parameters_json_schema.get("properties", {}):
+            return {
+                "answer": f"The average {self.value_column} differs by {self.category_column}.",
+                "create_visualization": True,
+                "visualization_params": {
+                    "visualization_type": self.visualization_type,
+                    "columns": [self.category_column, self.value_column],
+                    "title": f"Average {self.value_column} by {self.category_column}",
+                },
+            }
+        return {
+            "answerable": True,
+            "group_by": [self.category_column],
+            "aggregations": [{"function": "mean", "column": self.value_column}],
+            "sort": [{"column": f"mean_{self.value_column}", "descending": True}],
+        }
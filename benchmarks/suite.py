@@ -0,0 +1,295 @@
+import asyncio
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from app import CSVAnalysisApp
+from columnar_cache import ColumnarCache
+from csv_handler import CSVHandler
+from dataset_profile import DatasetProfile
+from dtype_optimizer import DtypeOptimizer
+from models import VisualizationParams
+from benchmarks.datasets import SIZES, dataset_path, generate_csv
+from benchmarks.stub_llm import StubLLM
+
+QUESTION = "What is the average price by category?"
+
+RENDER_PARAMS = {
+    "render_histogram": VisualizationParams(visualization_type="histogram", columns=["price"]),
+    "render_pie": VisualizationParams(visualization_type="pie", columns=["category"]),
+    "render_bar": VisualizationParams(visualization_type="bar", columns=["category", "price"]),
+    "render_scatter": VisualizationParams(visualization_type="scatter", columns=["quantity", "price"]),
+    "render_line": VisualizationParams(visualization_type="line", columns=["order_date", "price"]),
+}
+
+def _rss_mb() -> float:
+    """Current resident set size; falls back to the peak where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return _peak_rss_mb()
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+def measure(fn, repeat: int = 3, memory: bool = True) -> dict:
+    """Median wall time over repeat calls and, with memory, the peak traced allocation of one more call
+
+    The allocation pass runs separately because tracemalloc slows the code it traces.
+    """
+    runs = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    result = {"seconds": round(statistics.median(runs), 6), "runs": [round(run, 6) for run in runs]}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result["peak_alloc_mb"] = round(peak / 1e6, 2)
+    result["rss_mb"] = round(_rss_mb(), 1)
+    return result
+
+def _last(updates) -> object:
+    """Run an async generator to completion on a new event loop and return its last item"""
+    async def drain():
+        last = None
+        async for last in updates:
+            pass
+        return last
+    return asyncio.run(drain())
+
+def run_dataset(path: str, repeat: int = 3, memory: bool = True, llm_latency: float = 0.0) -> dict:
+    """Time and memory-profile every stage of answering a question about one CSV file"""
+    stub = StubLLM("category", "price", latency=llm_latency)
+    app = CSVAnalysisApp(llm_model=stub.model())
+    cache_root = tempfile.mkdtemp(prefix="csv-bench-cache-")
+    try:
+        cold_loads = iter(range(1_000_000))
+
+        def load_cold():
+            # A fresh columnar cache and no earlier profile in the session: parse, optimize, profile, write cache
+            app.csv_handler = CSVHandler(cache=ColumnarCache(cache_dir=os.path.join(cache_root, str(next(cold_loads)))))
+            app.sessions.discard("bench")
+            app.load_dataset(path, "bench")
+
+        stages = {}
+        stages["load_cold"] = measure(load_cold, repeat, memory)
+        # Warm the cache entry that re-uploads read
+        app.load_dataset(path, "bench")
+        stages["load_cached"] = measure(lambda: app.load_dataset(path, "bench"), repeat, memory)
+
+        data = app.sessions.get("bench")
+        df, profile = data.df, data.profile
+        processor = app.llm_processor
+
+        stages["profile"] = measure(lambda: DatasetProfile.from_dataframe(profile.content_hash, df), repeat, memory)
+        stages["profile_approx"] = measure(
+            lambda: DatasetProfile.from_dataframe(profile.content_hash, df, approximate=True), repeat, memory)
+        stages["prompt_build"] = measure(lambda: processor._build_prompt(profile, QUESTION, True), repeat, memory)
+        stages["llm_answer"] = measure(lambda: processor.process_query(df, QUESTION, True, profile=profile),
+                                       repeat, memory)
+        # The web UI streams answers by default
+        stages["llm_answer_stream"] = measure(
+            lambda: _last(processor.stream_query_async(df, QUESTION, True, profile=profile)), repeat, memory)
+        stages["llm_plan"] = measure(lambda: processor.plan_query(profile, QUESTION), repeat, memory)
+        plan = processor.plan_query(profile, QUESTION)
+        stages["query_execute"] = measure(lambda: app._answer_from_plan(data, plan, False), repeat, memory)
+        if profile.streamed:
+            # A streamed upload only keeps a row sample in memory; these stages ran on it, not on the file
+            for name in ("profile", "profile_approx", "query_execute"):
+                stages[name]["sampled_rows"] = len(df)
+        for name, params in RENDER_PARAMS.items():
+            # Without a dataset hash the figure cache is bypassed, so every call renders
+            stages[name] = measure(lambda: app.viz_generator.create_visualization(df, params), repeat, memory)
+
+        def question(use_query_engine):
+            app.use_query_engine = use_query_engine
+            # Answers bypass the answer cache; drop memoized figures so the chart is drawn too
+            app.viz_generator.invalidate(profile.content_hash)
+            answer, _ = app.handle_question(QUESTION, True, "bench", use_cache=False)
+            if answer.startswith("Error"):
+                raise RuntimeError(answer)
+
+        def question_stream():
+            app.use_query_engine = False
+            app.viz_generator.invalidate(profile.content_hash)
+            answer, _ = _last(app.handle_question_stream(QUESTION, True, "bench", use_cache=False))
+            if answer.startswith("Error"):
+                raise RuntimeError(answer)
+
+        stages["question_query_engine"] = measure(lambda: question(True), repeat, memory)
+        stages["question_llm"] = measure(lambda: question(False), repeat, memory)
+        stages["question_llm_stream"] = measure(question_stream, repeat, memory)
+
+        return {
+            "dataset": os.path.basename(path),
+            "rows": profile.n_rows,
+            "columns": len(profile.columns),
+            "csv_mb": round(os.path.getsize(path) / 1e6, 1),
+            "frame_mb": round(data.nbytes / 1e6, 1),
+            "prompt_tokens": processor.last_prompt_stats.estimated_tokens,
+            # The LLM questions share a session, so the last one replays earlier turns after the data context
+            "prompt_history_turns": processor.last_prompt_stats.history_turns,
+            "prefix_tokens_reused_estimate": processor.last_prompt_stats.estimated_reused_tokens,
+            "llm_calls": stub.calls,
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "stages": stages,
+        }
+    finally:
+        # Every cold load wrote a full columnar copy of the dataset
+        shutil.rmtree(cache_root, ignore_errors=True)
+
+def default_worker_counts() -> list:
+    """Powers of two up to the number of cores, plus the core count itself"""
+    cores = os.cpu_count() or 1
+    counts = [1 << i for i in range(cores.bit_length()) if 1 << i <= cores]
+    return counts if counts[-1] == cores else counts + [cores]
+
+def run_scaling(path: str, worker_counts: list, repeat: int = 3) -> dict:
+    """Time parallel ingest stages of one CSV file at each worker count
+
+    Stages: parse (pyarrow reader, or the C parser at one worker), dtype
+    optimization, exact and approximate profiling, the whole in-memory load and
+    a streamed load over worker processes. Speedups are relative to the first
+    worker count.
+    """
+    handler = CSVHandler()
+    results = []
+    for workers in worker_counts:
+        print(f"Scaling {os.path.basename(path)} with {workers} workers", file=sys.stderr)
+        df = handler.read_csv(path, workers)
+        optimized, _ = DtypeOptimizer.optimize(df, workers=workers)
+        stages = {
+            "parse": measure(lambda: handler.read_csv(path, workers), repeat, memory=False),
+            "optimize": measure(lambda df=df: DtypeOptimizer.optimize(df, workers=workers), repeat, memory=False),
+            "profile": measure(lambda frame=optimized: DatasetProfile.from_dataframe("", frame, workers=workers),
+                               repeat, memory=False),
+            "profile_approx": measure(
+                lambda frame=optimized: DatasetProfile.from_dataframe("", frame, approximate=True, workers=workers),
+                repeat, memory=False),
+            "load": measure(lambda: handler.load_csv(path, streaming=False, workers=workers), repeat, memory=False),
+            "load_streaming": measure(lambda: handler.load_csv(path, streaming=True, workers=workers),
+                                      repeat, memory=False),
+        }
+        # Free this worker count's frames before the next one parses the file again
+        del df, optimized
+        results.append({"workers": workers, "stages": stages})
+    for result in results:
+        for stage, stats in result["stages"].items():
+            stats["speedup"] = round(results[0]["stages"][stage]["seconds"] / stats["seconds"], 2)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+        },
+        "dataset": os.path.basename(path),
+        "csv_mb": round(os.path.getsize(path) / 1e6, 1),
+        "results": results,
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_suite(sizes: list, shapes: list, data_dir: str, repeat: int = 3, memory: bool = True,
+              llm_latency: float = 0.0, isolate: bool = True) -> dict:
+    """Benchmark every size/shape combination
+
+    With isolate each dataset runs in a fresh interpreter, so peak RSS and
+    import or cache warm-up of one dataset do not leak into the next.
+    """
+    results = []
+    for size in sizes:
+        for shape in shapes:
+            path = generate_csv(dataset_path(data_dir, size, shape), SIZES[size], shape)
+            print(f"Benchmarking {os.path.basename(path)}", file=sys.stderr)
+            if not isolate:
+                results.append(run_dataset(path, repeat, memory, llm_latency))
+                continue
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+                output = f.name
+            try:
+                command = [sys.executable, "-m", "benchmarks", "worker", path, output, "--repeat", str(repeat),
+                           "--llm-latency", str(llm_latency)]
+                if not memory:
+                    command.append("--no-memory")
+                subprocess.run(command, check=True, stdout=subprocess.DEVNULL,
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+                with open(output) as f:
+                    results.append(json.load(f))
+            finally:
+                os.remove(output)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+            "llm_latency": llm_latency,
+        },
+        "datasets": results,
+    }
+
+def compare(base: dict, new: dict, threshold: float = 0.15, min_seconds: float = 0.005) -> tuple[list, list]:
+    """Stage-by-stage comparison of two suite results
+
+    Returns (rows, regressions). A stage regresses when it got slower by more
+    than threshold (relative) and min_seconds (absolute), or when its peak
+    allocation grew by more than threshold.
+    """
+    base_datasets = {result["dataset"]: result for result in base["datasets"]}
+    rows, regressions = [], []
+    for result in new["datasets"]:
+        previous = base_datasets.get(result["dataset"])
+        if previous is None:
+            continue
+        for stage, stats in result["stages"].items():
+            old = previous["stages"].get(stage)
+            if old is None:
+                continue
+            ratio = stats["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+            row = {
+                "dataset": result["dataset"],
+                "stage": stage,
+                "base_seconds": old["seconds"],
+                "new_seconds": stats["seconds"],
+                "ratio": round(ratio, 3),
+            }
+            slower = ratio > 1 + threshold and stats["seconds"] - old["seconds"] > min_seconds
+            if "peak_alloc_mb" in stats and "peak_alloc_mb" in old:
+                row["base_alloc_mb"] = old["peak_alloc_mb"]
+                row["new_alloc_mb"] = stats["peak_alloc_mb"]
+                slower = slower or stats["peak_alloc_mb"] > old["peak_alloc_mb"] * (1 + threshold) + 1
+            rows.append(row)
+            if slower:
+                regressions.append(row)
+    return rows, regressions
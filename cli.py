@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app import CSVAnalysisApp
+from session_store import DEFAULT_SESSION
+
+def figure_to_base64(fig) -> str:
+    """PNG bytes of a figure, base64-encoded for JSON responses"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+class HeadlessServer:
+    """Lightweight JSON HTTP API over CSVAnalysisApp, without Gradio
+
+    Endpoints:
+      GET  /health    liveness check
+      GET  /metrics   CSVAnalysisApp.get_metrics()
+      POST /datasets  {"path" or "paths", "session_id"?, "append"?} loads a CSV file, registers several as
+                      tables, or with append adds the rows of a delta CSV to the session's dataset
+      POST /ask       {"question", "session_id" or "path", "include_visualization"?, "use_cache"?}
+
+    Requests are served from threads, but every question runs on one shared
+    event loop, so the LLM request limiter bounds concurrency across requests.
+    """
+
+    def __init__(self, app: CSVAnalysisApp = None, host: str = "127.0.0.1", port: int = 8765):
+        self.app = app or CSVAnalysisApp()
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._loop_thread.start()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._respond(*server.handle("GET", self.path, None))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError as e:
+                    self._respond(400, {"error": f"Invalid JSON body: {str(e)}"})
+                    return
+                self._respond(*server.handle("POST", self.path, body))
+
+            def _respond(self, status, payload):
+                data = json.dumps(payload, default=str).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                print(f"{self.address_string()} {format % args}")
+
+        return Handler
+
+    def handle(self, method: str, path: str, body) -> tuple[int, dict]:
+        """Dispatch one request and return (HTTP status, JSON payload)"""
+        try:
+            if method == "GET" and path == "/health":
+                return 200, {"status": "ok"}
+            if method == "GET" and path == "/metrics":
+                return 200, self.app.get_metrics()
+            if method == "POST" and path == "/datasets":
+                session_id = body.get("session_id") or uuid.uuid4().hex
+                if "paths" in body:
+                    info = self.app.load_tables(body["paths"], session_id)
+                elif body.get("append"):
+                    info = self.app.append_dataset(body["path"], session_id)
+                else:
+                    info = self.app.load_dataset(body["path"], session_id)
+                return 200, {"session_id": session_id, "info": info}
+            if method == "POST" and path == "/ask":
+                return 200, self.ask(body)
+            return 404, {"error": f"No route for {method} {path}"}
+        except KeyError as e:
+            return 400, {"error": f"Missing field {str(e)}"}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+    def ask(self, body: dict) -> dict:
+        session_id = body.get("session_id")
+        if session_id is None:
+            # One-shot request: load the file into a throwaway session
+            session_id = f"http-{uuid.uuid4().hex}"
+            self.app.load_dataset(body["path"], session_id)
+            discard = True
+        else:
+            discard = False
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                self.app.handle_question_async(
+                    body["question"], bool(body.get("include_visualization", False)),
+                    session_id=session_id, use_cache=bool(body.get("use_cache", True))),
+                self.loop)
+            answer, fig = future.result()
+        finally:
+            if discard:
+                self.app.sessions.discard(session_id)
+        return {"answer": answer, "chart_png_base64": figure_to_base64(fig) if fig is not None else None}
+
+    def serve_forever(self) -> None:
+        host, port = self.httpd.server_address[:2]
+        print(f"Serving JSON API on http://{host}:{port}")
+        self.httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+# Startup variants compared by the startup subcommand; each runs in a fresh interpreter
+STARTUP_VARIANTS = {
+    "headless": "import cli; cli.CSVAnalysisApp()",
+    "gradio": "import app; app.create_interface()",
+}
+
+STARTUP_PROBE = """
+import resource, sys, time
+start = time.perf_counter()
+exec({code!r})
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss * (1 if sys.platform == "darwin" else 1024))
+"""
+
+def measure_startup(runs: int = 3) -> dict:
+    """Import-and-construct time and peak RSS of the headless and Gradio paths
+
+    Each run is a fresh interpreter, so the numbers include cold imports (but
+    not interpreter start-up, which both paths share).
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, code in STARTUP_VARIANTS.items():
+        seconds, peak = [], []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, "-c", STARTUP_PROBE.format(code=code)],
+                cwd=here, capture_output=True, text=True, check=True).stdout.split()
+            seconds.append(float(output[-2]))
+            peak.append(int(output[-1]))
+        results[name] = {
+            "seconds_median": round(statistics.median(seconds), 3),
+            "peak_rss_mb": round(max(peak) / 1e6, 1),
+        }
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless CSV question answering without the Gradio UI")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ask = commands.add_parser("ask", help="Answer one question about a CSV file")
+    ask.add_argument("csv", help="CSV file to analyze")
+    ask.add_argument("question", help="Question about the data")
+    ask.add_argument("--visualize", action="store_true", help="Ask for a chart with the answer")
+    ask.add_argument("--chart", help="Where to save the chart as PNG")
+    ask.add_argument("--json", action="store_true", help="Print the answer as a JSON object")
+    ask.add_argument("--trace-log", help="Append the request trace to this JSON lines file")
+    ask.add_argument("--approximate-profiles", action="store_true",
+                     help="Profile the file with sketches instead of exact statistics")
+    ask.add_argument("--ingest-workers", type=int, default=1,
+                     help="Cores used to parse and profile the file (0 for all)")
+
+    serve = commands.add_parser("serve", help="Run the JSON HTTP API")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--trace-log", help="Append a JSON line per request to this file")
+    serve.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    serve.add_argument("--approximate-profiles", action="store_true",
+                       help="Profile uploads with sketches instead of exact statistics")
+    serve.add_argument("--ingest-workers", type=int, default=1,
+                       help="Cores used to parse and profile uploads (0 for all)")
+
+    startup = commands.add_parser("startup", help="Compare cold start and memory of the headless and Gradio paths")
+    startup.add_argument("--runs", type=int, default=3)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "ask":
+        app = CSVAnalysisApp(trace_log=args.trace_log, approximate_profiles=args.approximate_profiles,
+                             ingest_workers=args.ingest_workers)
+        app.load_dataset(args.csv, DEFAULT_SESSION)
+        answer, fig = asyncio.run(app.handle_question_async(args.question, args.visualize))
+        if fig is not None and args.chart:
+            fig.savefig(args.chart)
+        if args.json:
+            print(json.dumps({"answer": answer, "chart": args.chart if fig is not None else None}, default=str))
+        else:
+            print(answer)
+    elif args.command == "serve":
+        app = CSVAnalysisApp(trace_log=args.trace_log, metrics_port=args.metrics_port,
+                             approximate_profiles=args.approximate_profiles, ingest_workers=args.ingest_workers)
+        server = HeadlessServer(app, host=args.host, port=args.port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+    elif args.command == "startup":
+        print(json.dumps(measure_startup(args.runs), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import os
+import threading
+from typing import Optional
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "csv-query-visualizer")
+DEFAULT_MAX_BYTES = 2 << 30
+
+class ColumnarCache:
+    """Content-addressed on-disk cache of parsed CSVs stored as Arrow IPC (Feather v2) files
+
+    Files are written uncompressed so later loads can memory-map them instead of
+    parsing text. Only the read is memory-mapped: converting to pandas copies the
+    columns into ordinary writable arrays, because zero-copy columns would be
+    read-only views of the file that callers could not modify. The directory is
+    kept under max_bytes by evicting the least recently used entries; recency is
+    tracked through file modification times so it survives restarts. Requires
+    pyarrow; without it the cache is disabled and every lookup is a miss.
+    """
+
+    SUFFIX = ".arrow"
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        try:
+            import pyarrow.feather  # noqa: F401
+            self.enabled = True
+            os.makedirs(cache_dir, exist_ok=True)
+        except (ImportError, OSError):
+            self.enabled = False
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.SUFFIX)
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """Return the cached frame for key, or None on a miss"""
+        path = self._path(key)
+        if not self.enabled or not os.path.exists(path):
+            with self._lock:
+                self.misses += 1
+            return None
+        from pyarrow import feather
+        try:
+            df = feather.read_table(path, memory_map=True).to_pandas()
+        except Exception:
+            # Corrupt or partially written entry; drop it and treat as a miss
+            self._remove(path)
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another thread or process after the read; the frame is still good
+            pass
+        with self._lock:
+            self.hits += 1
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        """Store a frame under key and evict old entries beyond the size budget"""
+        if not self.enabled:
+            return
+        from pyarrow import feather
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            feather.write_feather(df, tmp_path, compression='uncompressed')
+            if os.path.getsize(tmp_path) > self.max_bytes:
+                self._remove(tmp_path)
+                return
+            os.replace(tmp_path, path)
+        except Exception as e:
+            # Caching is best effort; e.g. mixed-type object columns cannot be written
+            print(f"Columnar cache write failed: {str(e)}")
+            self._remove(tmp_path)
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(self.SUFFIX):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+                self.evictions += 1
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
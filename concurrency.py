@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+class QueueFullError(RuntimeError):
+    """Raised when the request queue in front of the LLM is full"""
+
+class RequestLimiter:
+    """Bounded concurrency and waiting queue in front of the LLM endpoint
+
+    At most max_concurrency requests run at once; up to max_queue more wait for
+    a slot and anything beyond that is rejected with QueueFullError. Queue depth
+    and wait times are recorded for sizing the pool.
+    """
+
+    def __init__(self, max_concurrency: int = 2, max_queue: int = 32, window: int = 1000):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        self._wait_times = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._semaphore = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # asyncio semaphores are bound to one event loop; Gradio uses a single
+        # loop, but scripted callers may run several loops one after another
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for a free slot and hold it for the duration of the block"""
+        semaphore = self._get_semaphore()
+        with self._lock:
+            if self.queue_depth >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(
+                    f"Too many pending requests ({self.queue_depth} queued); please try again shortly")
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        start = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        finally:
+            with self._lock:
+                self.queue_depth -= 1
+        wait = time.perf_counter() - start
+
+        with self._lock:
+            self.in_flight += 1
+            self._wait_times.append(wait)
+        try:
+            yield wait
+        finally:
+            semaphore.release()
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+
+    def metrics(self) -> dict:
+        """Current queue depth, in-flight count and wait-time statistics (seconds)"""
+        with self._lock:
+            waits = sorted(self._wait_times)
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "wait_mean": sum(waits) / len(waits) if waits else 0.0,
+                "wait_p95": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                "wait_max": waits[-1] if waits else 0.0,
+            }
@@ -0,0 +1,37 @@
+import json
+import threading
+from collections import deque
+
+class Conversation:
+    """Earlier questions and answers of one session, replayed to the LLM so follow-up questions work
+
+    Every answered question is kept as a (question, answer) turn, whichever path
+    answered it; only the latest max_turns are kept. The LLM processor replays
+    as many of the most recent turns as fit its history budget.
+    """
+
+    def __init__(self, max_turns: int = 8):
+        self._turns = deque(maxlen=max_turns)
+        self._lock = threading.Lock()
+
+    def add(self, question: str, answer) -> None:
+        """Remember an answered question, forgetting the oldest turn beyond max_turns
+
+        Structured answers (an LLM may answer with a JSON object) are kept as JSON text.
+        """
+        if not isinstance(answer, str):
+            answer = json.dumps(answer, default=str)
+        with self._lock:
+            self._turns.append((question, answer))
+
+    def turns(self) -> list:
+        """The remembered (question, answer) turns, oldest first"""
+        with self._lock:
+            return list(self._turns)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._turns.clear()
+
+    def __len__(self) -> int:
+        return len(self._turns)
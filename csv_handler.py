@@ -1,27 +1,368 @@
+import copy
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import numpy as np
 import pandas as pd
+from dataset_profile import DatasetProfile, ProfileBuilder
+from dtype_optimizer import DtypeOptimizer
+from columnar_cache import ColumnarCache
+from parallel import ByteRangeReader, resolve_workers, split_byte_ranges
+import instrumentation
+
+# Files larger than this are streamed in chunks unless a mode is requested explicitly
+STREAMING_THRESHOLD_BYTES = 1 << 30
+DEFAULT_CHUNKSIZE = 200000
+
+# What pandas' C parser reads as missing or boolean, so the pyarrow reader produces the same values
+NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+             "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+TRUE_VALUES = ["True", "TRUE", "true"]
+FALSE_VALUES = ["False", "FALSE", "false"]
+
+def _profile_byte_range(file_path: str, start: int, end: int, names: list, read_kwargs: dict,
+                        chunksize: int, content_hash: str, seed: int) -> ProfileBuilder:
+    """Fold the records in one byte range of a CSV file into a ProfileBuilder (runs in a worker process)"""
+    builder = ProfileBuilder(content_hash, seed=seed)
+    with io.BufferedReader(ByteRangeReader(file_path, start, end)) as f:
+        for chunk in pd.read_csv(f, header=None, names=names, chunksize=chunksize, **read_kwargs):
+            builder.update(chunk)
+    return builder
 
 class CSVHandler:
     """Module responsible for CSV file operations"""
-    
+
+    def __init__(self, cache: Optional[ColumnarCache] = None):
+        """Optionally keep parsed uploads in a columnar cache keyed by file content"""
+        self.cache = cache
+
+    @staticmethod
+    def compute_content_hash(file_path: str, block_size: int = 1 << 20) -> str:
+        """Return a SHA-256 hex digest of the file contents"""
+        return CSVHandler.compute_content_hashes(file_path, block_size=block_size)[0]
+
+    @staticmethod
+    def compute_content_hashes(file_path: str, prefix_bytes: Optional[int] = None,
+                               block_size: int = 1 << 20) -> tuple[str, Optional[str]]:
+        """SHA-256 hex digests of the whole file and of its first prefix_bytes bytes, in one pass
+
+        The prefix digest is only returned when the file is longer than the
+        prefix and the prefix ends a line, i.e. when the file could be an
+        earlier version with rows appended.
+        """
+        digest = hashlib.sha256()
+        prefix_digest = None
+        read = 0
+        last_byte = b''
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                if prefix_bytes and prefix_digest is None and read + len(block) > prefix_bytes:
+                    split = prefix_bytes - read
+                    digest.update(block[:split])
+                    if (block[split - 1:split] if split else last_byte) == b'\n':
+                        prefix_digest = digest.copy().hexdigest()
+                    else:
+                        prefix_bytes = None
+                    digest.update(block[split:])
+                else:
+                    digest.update(block)
+                read += len(block)
+                last_byte = block[-1:]
+        return digest.hexdigest(), prefix_digest
+
     @staticmethod
-    def load_csv(file_path: str) -> tuple[pd.DataFrame, str]:
-        """Load and validate CSV file, return dataframe and info string"""
+    def read_csv(file_path: str, workers: int = 1) -> pd.DataFrame:
+        """pd.read_csv, or with workers > 1 the multi-threaded pyarrow reader where it can read the file"""
+        if workers > 1:
+            try:
+                df = CSVHandler.read_csv_parallel(file_path, workers)
+                instrumentation.record(parser="pyarrow")
+                return df
+            except ImportError:
+                pass
+            except ValueError as e:
+                # e.g. ragged rows, which the C parser pads but pyarrow rejects
+                print(f"Parallel CSV parsing failed, parsing serially: {str(e)}")
+        instrumentation.record(parser="c")
+        return pd.read_csv(file_path)
+
+    @staticmethod
+    def read_csv_parallel(file_path: str, workers: int) -> pd.DataFrame:
+        """Parse a CSV file with pyarrow's multi-threaded reader into the frame pd.read_csv would return
+
+        pyarrow would turn date-like text into dates and timestamps; those columns
+        are read as text, as the C parser does, and left to DtypeOptimizer or a
+        schema. Missing text values become NaN rather than None. Files pandas
+        would read differently (duplicate or blank column names) raise ValueError,
+        as do rows pyarrow cannot parse. Requires pyarrow.
+        """
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+
+        # The reader and the conversion to pandas run on pyarrow's process-wide CPU pool
+        pa.set_cpu_count(workers)
+        convert_options = pa_csv.ConvertOptions(null_values=NA_VALUES, true_values=TRUE_VALUES,
+                                                false_values=FALSE_VALUES, strings_can_be_null=True)
+        with pa_csv.open_csv(file_path, convert_options=convert_options) as reader:
+            inferred = reader.schema
+        if len(set(inferred.names)) < len(inferred.names) or not all(inferred.names):
+            raise ValueError("Duplicate or blank column names")
+        # Types are inferred from the first block first; a later block can still turn up a temporal column
+        column_types = {}
+        temporal = [field.name for field in inferred if pa.types.is_temporal(field.type)]
+        while True:
+            column_types.update({name: pa.string() for name in temporal})
+            convert_options.column_types = column_types
+            table = pa_csv.read_csv(file_path, read_options=pa_csv.ReadOptions(use_threads=True),
+                                    convert_options=convert_options)
+            temporal = [field.name for field in table.schema if pa.types.is_temporal(field.type)]
+            if not temporal:
+                break
+        df = table.to_pandas(use_threads=True, split_blocks=True, self_destruct=True)
+        del table
+        for col in df.columns:
+            if df[col].dtype == object:
+                missing = df[col].isna()
+                if missing.any():
+                    df[col] = df[col].where(~missing, np.nan)
+        return df
+
+    @staticmethod
+    def stream_profile_parallel(file_path: str, content_hash: str, workers: int,
+                                chunksize: int = DEFAULT_CHUNKSIZE, read_kwargs: Optional[dict] = None) -> ProfileBuilder:
+        """Profile a CSV file in byte ranges on a process pool and merge the partial profiles
+
+        Each worker parses its range in chunks and returns only its statistics and
+        row sample, so no parsed data crosses process boundaries. Workers are
+        spawned, so a calling script needs the usual if __name__ == "__main__" guard.
+        """
+        names = pd.read_csv(file_path, nrows=0).columns.tolist()
+        _, ranges = split_byte_ranges(file_path, workers)
+        instrumentation.record(byte_ranges=len(ranges))
+        builder = ProfileBuilder(content_hash)
+        if not ranges:
+            return builder
+        # Spawned rather than forked: the app may be running threads (event loop, HTTP server)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=context) as executor:
+            futures = [executor.submit(_profile_byte_range, file_path, start, end, names, read_kwargs or {},
+                                       chunksize, content_hash, seed)
+                       for seed, (start, end) in enumerate(ranges)]
+            # Merged in file order so row numbers follow on
+            for future in futures:
+                builder.merge(future.result())
+        return builder
+
+    def load_csv(self, file_path: str, previous_profile: Optional[DatasetProfile] = None,
+                 streaming: Optional[bool] = None, chunksize: int = DEFAULT_CHUNKSIZE,
+                 optimize_dtypes: bool = True, schema: Optional[dict] = None,
+                 approximate: bool = False, workers: int = 1,
+                 previous_df: Optional[pd.DataFrame] = None) -> tuple[pd.DataFrame, str, DatasetProfile]:
+        """Load and validate CSV file, return dataframe, info string and dataset profile
+
+        If previous_profile was built from a file with the same content hash it is
+        reused instead of profiling the data again.
+
+        In streaming mode (the default for files above STREAMING_THRESHOLD_BYTES) the
+        file is read in chunks that are folded into the profile and then discarded;
+        the returned dataframe is a uniform row sample rather than the full data.
+
+        With optimize_dtypes, in-memory frames are shrunk by DtypeOptimizer and the
+        savings are listed in the preview. A schema (column -> dtype name, e.g. the
+        schema of an earlier profile of the same feed) is passed to the parser with
+        numeric types widened (see DtypeOptimizer.widen), so type inference is
+        skipped; the frame is then optimized as usual. When the file's values do
+        not fit the schema, the file is parsed with inference instead.
+
+        When a columnar cache is configured, in-memory loads of a file whose
+        content was parsed before with the same options are read from the cache
+        instead of parsing the CSV text.
+
+        With approximate, in-memory frames are profiled with sketches (see
+        DatasetProfile.from_dataframe) and the preview lists their error bounds.
+
+        With workers > 1 (0 means one per core) in-memory files are parsed by
+        pyarrow's multi-threaded reader and their columns are optimized and
+        profiled on a thread pool; streamed files are split into byte ranges that
+        worker processes profile and whose statistics are then merged.
+
+        When the file is previous_profile's file with rows appended (it starts
+        with exactly the bytes that were profiled), only the new rows are parsed:
+        they are appended to previous_df, or folded into the statistics of a
+        streamed profile, and the profile is updated incrementally.
+        """
         try:
-            df = pd.read_csv(file_path)
-            
-            # Generate preview information
-            preview = f"CSV loaded successfully. Shape: {df.shape}\n\nPreview:\n{df.head(5).to_string()}\n\n"
-            
-            # Add column information
-            preview += "Column Information:\n"
-            for col in df.columns:
-                dtype = df[col].dtype
-                if pd.api.types.is_numeric_dtype(dtype):
-                    preview += f"- {col} (numeric): min={df[col].min()}, max={df[col].max()}, mean={df[col].mean():.2f}\n"
+            optimization_report = None
+            loaded_from_cache = False
+            file_size = os.path.getsize(file_path)
+            with instrumentation.span("content_hash"):
+                content_hash, prefix_hash = CSVHandler.compute_content_hashes(
+                    file_path, previous_profile.source_bytes if previous_profile is not None else None)
+            workers = resolve_workers(workers)
+            if previous_profile is not None and previous_profile.content_hash != content_hash:
+                if (prefix_hash == previous_profile.content_hash and previous_profile.approximate == approximate
+                        and (previous_df is not None or previous_profile.builder is not None)):
+                    try:
+                        df, profile, appended_rows = self._append_rows(
+                            file_path, previous_df, previous_profile, content_hash, optimize_dtypes, workers,
+                            chunksize, start=previous_profile.source_bytes)
+                        profile.source_bytes = file_size
+                        instrumentation.record(append="prefix")
+                        return df, self._preview(df, profile, appended_rows=appended_rows), profile
+                    except ValueError as e:
+                        print(f"Could not append the new rows, loading the whole file: {str(e)}")
+                previous_profile = None
+            if streaming is None:
+                streaming = file_size > STREAMING_THRESHOLD_BYTES
+
+            if streaming:
+                if previous_profile is not None and previous_profile.streamed:
+                    profile = previous_profile
+                else:
+                    read_kwargs = DtypeOptimizer.read_kwargs(schema) if schema else {}
+                    # Parsing and profiling are interleaved chunk by chunk
+                    with instrumentation.span("csv_stream_profile"):
+                        if workers > 1:
+                            builder = CSVHandler.stream_profile_parallel(file_path, content_hash, workers,
+                                                                         chunksize, read_kwargs)
+                        else:
+                            builder = ProfileBuilder(content_hash)
+                            for chunk in pd.read_csv(file_path, chunksize=chunksize, **read_kwargs):
+                                builder.update(chunk)
+                        profile = builder.build()
+                df = profile.row_sample
+            else:
+                df = None
+                cache_key = None
+                if self.cache is not None:
+                    options = json.dumps({"optimize_dtypes": optimize_dtypes, "schema": schema}, sort_keys=True)
+                    cache_key = f"{content_hash}-{hashlib.sha256(options.encode()).hexdigest()[:16]}"
+                    with instrumentation.span("cache_read"):
+                        df = self.cache.get(cache_key)
+                    loaded_from_cache = df is not None
+                with instrumentation.span("csv_parse"):
+                    if df is None and schema:
+                        try:
+                            if workers > 1:
+                                df = DtypeOptimizer.apply_schema(CSVHandler.read_csv(file_path, workers), schema,
+                                                                 workers)
+                            else:
+                                df = pd.read_csv(file_path, **DtypeOptimizer.read_kwargs(schema))
+                        except (ValueError, TypeError, KeyError, OverflowError):
+                            # The schema no longer matches this file; fall back to inference
+                            df = None
+                    if df is None:
+                        df = CSVHandler.read_csv(file_path, workers)
+                    if optimize_dtypes and not loaded_from_cache:
+                        df, optimization_report = DtypeOptimizer.optimize(df, workers=workers)
+                if cache_key is not None and not loaded_from_cache:
+                    with instrumentation.span("cache_write"):
+                        self.cache.put(cache_key, df)
+                if (previous_profile is not None and not previous_profile.streamed
+                        and previous_profile.approximate == approximate):
+                    profile = previous_profile
                 else:
-                    preview += f"- {col} (non-numeric): {len(df[col].unique())} unique values\n"
-            
-            return df, preview
-            
+                    with instrumentation.span("profile_build"):
+                        profile = DatasetProfile.from_dataframe(content_hash, df, approximate=approximate,
+                                                                workers=workers)
+
+            profile.source_bytes = file_size
+            preview = self._preview(df, profile, loaded_from_cache, optimization_report)
+            instrumentation.record(loaded_from_cache=loaded_from_cache, workers=workers)
+            return df, preview, profile
+
         except Exception as e:
-            raise ValueError(f"Error loading CSV: {str(e)}") 
\ No newline at end of file
+            raise ValueError(f"Error loading CSV: {str(e)}")
+
+    def append_csv(self, file_path: str, df: pd.DataFrame, profile: DatasetProfile, optimize_dtypes: bool = True,
+                   workers: int = 1, chunksize: int = DEFAULT_CHUNKSIZE) -> tuple[pd.DataFrame, str, DatasetProfile]:
+        """Append the rows of a delta CSV, with the same header as the loaded data, to df and its profile
+
+        Returns the combined frame (the row sample for streamed profiles), an
+        info string and the updated profile. The combined data no longer matches
+        one file, so a later upload of the full file is loaded from scratch.
+        """
+        try:
+            with instrumentation.span("content_hash"):
+                delta_hash = CSVHandler.compute_content_hash(file_path)
+            content_hash = hashlib.sha256(f"{profile.content_hash}+{delta_hash}".encode()).hexdigest()
+            columns = pd.read_csv(file_path, nrows=0).columns.tolist()
+            if columns != profile.columns:
+                raise ValueError(f"The file has columns {', '.join(map(str, columns))}, "
+                                 f"the loaded data {', '.join(map(str, profile.columns))}")
+            df, profile, appended_rows = self._append_rows(file_path, df, profile, content_hash, optimize_dtypes,
+                                                           resolve_workers(workers), chunksize)
+            instrumentation.record(append="delta")
+            return df, self._preview(df, profile, appended_rows=appended_rows), profile
+        except Exception as e:
+            raise ValueError(f"Error appending CSV: {str(e)}")
+
+    def _append_rows(self, file_path: str, df: Optional[pd.DataFrame], profile: DatasetProfile, content_hash: str,
+                     optimize_dtypes: bool, workers: int, chunksize: int,
+                     start: Optional[int] = None) -> tuple[pd.DataFrame, DatasetProfile, int]:
+        """Parse the rows of file_path from byte offset start (or, without start, the whole file after
+        its header) and append them to the loaded data; returns (frame, profile, appended row count)
+
+        Raises ValueError when the new rows cannot simply be appended.
+        """
+        if start is None:
+            source, header = file_path, 0
+        else:
+            source, header = io.BufferedReader(ByteRangeReader(file_path, start, os.path.getsize(file_path))), None
+        try:
+            if profile.streamed:
+                builder = copy.deepcopy(profile.builder)
+                # Row sample keys must not repeat those drawn for the earlier rows
+                part = ProfileBuilder(content_hash, seed=builder.n_rows)
+                with instrumentation.span("append_parse"):
+                    for chunk in pd.read_csv(source, header=header, names=profile.columns, chunksize=chunksize):
+                        part.update(chunk)
+                builder.merge(part)
+                builder.content_hash = content_hash
+                updated = builder.build()
+                updated.parent_hash = profile.content_hash
+                instrumentation.record(appended_rows=part.n_rows)
+                return updated.row_sample, updated, part.n_rows
+
+            with instrumentation.span("append_parse"):
+                new_rows = pd.read_csv(source, header=header, names=profile.columns,
+                                       **DtypeOptimizer.append_read_kwargs(df))
+                combined = DtypeOptimizer.append_rows(df, new_rows, optimize=optimize_dtypes)
+        finally:
+            if start is not None:
+                source.close()
+        with instrumentation.span("profile_update"):
+            updated = profile.appended(content_hash, combined, workers)
+        instrumentation.record(appended_rows=len(new_rows))
+        return combined, updated, len(new_rows)
+
+    @staticmethod
+    def _preview(df: pd.DataFrame, profile: DatasetProfile, loaded_from_cache: bool = False,
+                 optimization_report: Optional[dict] = None, appended_rows: Optional[int] = None) -> str:
+        """Upload preview: shape, first rows, how the data was read and per-column information"""
+        preview = f"CSV loaded successfully. Shape: {(profile.n_rows, len(profile.columns))}\n\nPreview:\n{profile.sample.to_string()}\n\n"
+        if appended_rows is not None:
+            preview += (f"Appended {appended_rows} new rows to the loaded data; only the new rows were parsed "
+                        f"and the statistics were updated incrementally.\n\n")
+        if profile.streamed:
+            preview += (f"Streaming mode: statistics were computed over all {profile.n_rows} rows in chunks; "
+                        f"visualizations use a uniform sample of {len(df)} rows.\n\n")
+        if loaded_from_cache:
+            preview += "Loaded from columnar cache (CSV parsing skipped).\n\n"
+
+        # Add column information
+        preview += profile.column_info_text()
+        approximation = profile.approximation_text()
+        if approximation:
+            preview += "\n" + approximation
+
+        if optimization_report:
+            preview += "\n" + DtypeOptimizer.report_text(optimization_report)
+
+        instrumentation.record(rows=profile.n_rows, columns=len(profile.columns), streamed=profile.streamed,
+                               approximate=profile.approximate)
+        return preview
\ No newline at end of file
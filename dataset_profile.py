@@ -0,0 +1,531 @@
+from typing import Optional
+import numpy as np
+import pandas as pd
+from parallel import map_columns
+from sketches import HyperLogLog, KLLSketch, TopValues, hash_values, heavy_hitters
+
+def describe_columns(df: pd.DataFrame, descriptions: list) -> pd.DataFrame:
+    """Assemble per-column describe() results into df.describe(include='all')
+
+    Statistic rows are ordered as pandas does: those of the shortest
+    descriptions (counts and top values) first, then the numeric ones.
+    """
+    order = []
+    for index in sorted((description.index for description in descriptions), key=len):
+        order += [name for name in index if name not in order]
+    summary = pd.concat([description.reindex(order) for description in descriptions], axis=1, sort=False)
+    summary.columns = df.columns.copy()
+    return summary
+
+class DatasetProfile:
+    """Summary of a loaded dataset, computed once per upload and reused by every query"""
+
+    def __init__(self, content_hash: str, n_rows: int, columns: list, summary: pd.DataFrame,
+                 sample: pd.DataFrame, column_stats: dict, value_counts: dict,
+                 row_sample: Optional[pd.DataFrame] = None, value_count_errors: Optional[dict] = None,
+                 schema: Optional[dict] = None, approximate: bool = False, error_bounds: Optional[dict] = None,
+                 builder: Optional['ProfileBuilder'] = None):
+        """Store a precomputed profile; use from_dataframe or ProfileBuilder to build one"""
+        self.content_hash = content_hash
+        self.n_rows = n_rows
+        self.columns = columns
+        self.summary = summary
+        self.sample = sample
+        # Per-column stats used for the upload preview
+        self.column_stats = column_stats
+        # Value distributions for categorical / low-cardinality columns
+        self.value_counts = value_counts
+        # Uniform row sample kept when the full data was never held in memory
+        self.row_sample = row_sample
+        # Maximum undercount of each truncated value distribution
+        self.value_count_errors = value_count_errors or {}
+        # Column -> dtype name; can be passed back to CSVHandler.load_csv for known feeds
+        self.schema = schema or {}
+        # Whether an in-memory frame was profiled with sketches instead of exactly
+        self.approximate = approximate
+        # Column -> bounds of its sketched statistics: "unique" (relative standard error of the
+        # distinct count), "quantiles" (normalized rank error), "unlisted" (highest possible
+        # count of a value missing from value_counts) and "freq" (maximum undercount of the
+        # summary's freq, a lower bound when values were counted with a truncated counter)
+        self.error_bounds = error_bounds or {}
+        # Mergeable statistics of a streamed profile, kept so appended rows can be folded in
+        self.builder = builder
+        # Size of the CSV file the profile describes; a longer file starting with the same
+        # bytes has had rows appended (None when the data is not a single file, e.g. after a delta)
+        self.source_bytes = None
+        # Content hash of the version this one was created from by appending rows
+        self.parent_hash = None
+
+    @property
+    def streamed(self) -> bool:
+        """Whether the profile was built from chunks rather than an in-memory frame"""
+        return self.row_sample is not None
+
+    @classmethod
+    def from_dataframe(cls, content_hash: str, df: pd.DataFrame, approximate: bool = False,
+                       top_k: int = 50, workers: int = 1) -> 'DatasetProfile':
+        """Profile an in-memory dataframe, exactly or (with approximate) with sketches
+
+        Columns are profiled independently; with workers > 1 they are spread over a
+        thread pool. Counting and sorting numeric columns releases the GIL, so
+        those scale best, while object columns mostly run one at a time.
+        """
+        if approximate:
+            return cls._from_dataframe_sketched(content_hash, df, top_k, workers)
+        column_stats = {}
+        value_counts = {}
+        descriptions = []
+        for col, (stats, counts, description) in zip(df.columns, map_columns(cls._profile_column, df, workers)):
+            column_stats[col] = stats
+            if counts is not None:
+                value_counts[col] = counts
+            descriptions.append(description)
+
+        return cls(
+            content_hash=content_hash,
+            n_rows=len(df),
+            columns=df.columns.tolist(),
+            summary=describe_columns(df, descriptions),
+            sample=df.head(5),
+            column_stats=column_stats,
+            value_counts=value_counts,
+            schema={col: str(dtype) for col, dtype in df.dtypes.items()},
+        )
+
+    def appended(self, content_hash: str, df: pd.DataFrame, workers: int = 1) -> 'DatasetProfile':
+        """Exact profile of df, which is this profile's data with rows appended
+
+        Counts, means, standard deviations, min/max and value counts are merged
+        with those of the new rows only; quartiles cannot be merged exactly and
+        are recomputed from the column. A column whose kind changed is profiled
+        again, as is an approximate profile as a whole.
+        """
+        if self.approximate:
+            profile = DatasetProfile.from_dataframe(content_hash, df, approximate=True, workers=workers)
+        else:
+            new_rows = df.iloc[self.n_rows:]
+            merged = map_columns(lambda series: self._append_column(series, new_rows[series.name]), df, workers)
+            profile = DatasetProfile(
+                content_hash=content_hash,
+                n_rows=len(df),
+                columns=df.columns.tolist(),
+                summary=describe_columns(df, [description for _, _, description in merged]),
+                sample=df.head(5),
+                column_stats={col: stats for col, (stats, _, _) in zip(df.columns, merged)},
+                value_counts={col: counts for col, (_, counts, _) in zip(df.columns, merged) if counts is not None},
+                schema={col: str(dtype) for col, dtype in df.dtypes.items()},
+            )
+        profile.parent_hash = self.content_hash
+        return profile
+
+    def _append_column(self, series: pd.Series, rows: pd.Series) -> tuple[dict, Optional[pd.Series], pd.Series]:
+        """_profile_column of a whole column, merged from this profile and the appended rows"""
+        col = series.name
+        old_stats = self.column_stats[col]
+        if self.schema.get(col) is None or old_stats["numeric"] != pd.api.types.is_numeric_dtype(series.dtype) \
+                or pd.api.types.is_datetime64_any_dtype(self.schema[col]) != pd.api.types.is_datetime64_any_dtype(series.dtype):
+            return self._profile_column(series)
+        new_stats, new_counts, new_description = self._profile_column(rows)
+        old_description = self.summary[col]
+        old_counts = self.value_counts.get(col)
+
+        counts = None
+        if old_counts is not None and new_counts is not None:
+            # Values first seen in the new rows go after the old ones before sorting by count
+            index = old_counts.index.append(new_counts.index[~new_counts.index.isin(old_counts.index)])
+            counts = (old_counts.reindex(index, fill_value=0) + new_counts.reindex(index, fill_value=0)).astype('int64')
+            counts = counts.sort_values(ascending=False, kind='stable')
+            counts.name = old_counts.name
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                counts.index = pd.CategoricalIndex(counts.index, dtype=series.dtype, name=old_counts.index.name)
+            if old_stats["numeric"] and (counts > 0).sum() >= 10:
+                counts = None
+
+        n_old, n_new = old_description["count"], new_description["count"]
+        n = n_old + n_new
+        values = {"count": n}
+        percentiles = [stat for stat in new_description.index if stat.endswith("%")]
+        if percentiles:
+            quantiles = series.quantile([float(stat[:-1]) / 100 for stat in percentiles])
+            values.update(zip(percentiles, quantiles))
+        for stat in new_description.index:
+            if stat == "mean":
+                old_mean, new_mean = old_description["mean"], new_description["mean"]
+                values["mean"] = new_mean if not n_old else old_mean if not n_new else \
+                    old_mean + (new_mean - old_mean) * (n_new / n)
+            elif stat == "std":
+                # Chan et al.'s pairwise update of the sum of squared deviations
+                delta = new_description["mean"] - old_description["mean"] if n_old and n_new else 0.0
+                squares = sum(description["std"] ** 2 * (count - 1) for description, count
+                              in ((old_description, n_old), (new_description, n_new)) if count > 1)
+                squares += delta ** 2 * n_old * n_new / n if n else 0.0
+                values["std"] = float(np.sqrt(squares / (n - 1))) if n > 1 else float('nan')
+            elif stat in ("min", "max"):
+                pair = pd.Series([old_description[stat], new_description[stat]])
+                values[stat] = pair.min() if stat == "min" else pair.max()
+            elif stat in ("unique", "top", "freq"):
+                present = counts[counts > 0]
+                values["unique"] = len(present)
+                values["top"] = present.index[0] if len(present) else float('nan')
+                values["freq"] = present.iloc[0] if len(present) else float('nan')
+        description = pd.Series([values[stat] for stat in new_description.index], index=new_description.index,
+                                dtype=new_description.dtype, name=col)
+
+        if old_stats["numeric"]:
+            stats = {
+                "numeric": True,
+                "min": pd.Series([old_stats["min"], new_stats["min"]]).min(),
+                "max": pd.Series([old_stats["max"], new_stats["max"]]).max(),
+                "mean": values["mean"] if "mean" in values else series.mean(),
+            }
+        else:
+            has_missing = old_stats["unique"] > len(old_counts) or new_stats["unique"] > len(new_counts)
+            stats = {"numeric": False, "unique": len(counts) + int(has_missing)}
+        return stats, counts, description
+
+    @staticmethod
+    def _profile_column(series: pd.Series) -> tuple[dict, Optional[pd.Series], pd.Series]:
+        """Preview stats, value counts (None if not kept) and describe() of one column"""
+        if series.dtype == np.float32:
+            # Accumulate in double precision, like the streamed profile of the same file
+            series = series.astype(np.float64)
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            stats = {
+                "numeric": True,
+                "min": series.min(),
+                "max": series.max(),
+                "mean": series.mean(),
+            }
+            counts = series.value_counts() if series.nunique() < 10 else None
+        else:
+            counts = series.value_counts()
+            stats = {
+                "numeric": False,
+                "unique": len(counts) + int(series.isna().any()),
+            }
+        return stats, counts, series.describe()
+
+    @classmethod
+    def _from_dataframe_sketched(cls, content_hash: str, df: pd.DataFrame, top_k: int,
+                                 workers: int = 1) -> 'DatasetProfile':
+        """Profile text columns with sketches instead of exact value counts
+
+        Each text column is hashed once; the hashes feed a HyperLogLog distinct
+        count and a count-min sketch that finds the top_k values, which are then
+        counted exactly. Numeric and categorical columns are cheap to profile
+        exactly and are, so only the text columns carry error bounds.
+        """
+        exact_columns = [col for col in df.columns
+                         if pd.api.types.is_numeric_dtype(df[col].dtype)
+                         or isinstance(df[col].dtype, pd.CategoricalDtype)]
+        exact = cls.from_dataframe(content_hash, df[exact_columns], workers=workers) if exact_columns else None
+        text_columns = [col for col in df.columns if col not in exact_columns]
+        sketched = dict(zip(text_columns, map_columns(lambda series: cls._sketch_column(series, top_k),
+                                                      df[text_columns], workers)))
+        column_stats = {}
+        value_counts = {}
+        error_bounds = {}
+        summary = {}
+        for col in df.columns:
+            if col in exact_columns:
+                column_stats[col] = exact.column_stats[col]
+                if col in exact.value_counts:
+                    value_counts[col] = exact.value_counts[col]
+                summary[col] = exact.summary[col]
+                continue
+            column_stats[col], value_counts[col], summary[col], bounds = sketched[col]
+            if bounds:
+                error_bounds[col] = bounds
+
+        summary = pd.DataFrame(summary, columns=df.columns)
+        order = list(exact.summary.index) if exact is not None else []
+        order += [stat for stat in ["count", "unique", "top", "freq"] if stat not in order]
+        return cls(
+            content_hash=content_hash,
+            n_rows=len(df),
+            columns=df.columns.tolist(),
+            summary=summary.reindex(order),
+            sample=df.head(5),
+            column_stats=column_stats,
+            value_counts=value_counts,
+            schema={col: str(dtype) for col, dtype in df.dtypes.items()},
+            approximate=True,
+            error_bounds=error_bounds,
+        )
+
+    @staticmethod
+    def _sketch_column(series: pd.Series, top_k: int) -> tuple[dict, pd.Series, pd.Series, Optional[dict]]:
+        """Preview stats, top value counts, summary and error bounds (None if exact) of one text column"""
+        non_null = series.dropna()
+        hashes = hash_values(non_null)
+        distinct = HyperLogLog()
+        distinct.update_hashes(hashes)
+        counts, unlisted = heavy_hitters(non_null, top_k, hashes=hashes)
+        bounds = None
+        if unlisted:
+            unique = distinct.estimate()
+            bounds = {"unique": distinct.relative_error, "unlisted": unlisted}
+        else:
+            # Every value was counted, so the distinct count is exact too
+            unique = len(counts)
+        stats = {"numeric": False, "unique": unique + int(len(non_null) < len(series)),
+                 "unique_exact": not unlisted}
+        summary = pd.Series({"count": len(non_null), "unique": unique,
+                             "top": counts.index[0] if len(counts) else None,
+                             "freq": int(counts.iloc[0]) if len(counts) else None})
+        return stats, counts, summary, bounds
+
+    def approximation_text(self) -> str:
+        """How far sketched statistics may be off, for the preview and the prompt; empty if all are exact"""
+        unique = [bounds["unique"] for bounds in self.error_bounds.values() if "unique" in bounds]
+        quantiles = [bounds["quantiles"] for bounds in self.error_bounds.values() if "quantiles" in bounds]
+        unlisted = {col: bounds["unlisted"] for col, bounds in self.error_bounds.items() if bounds.get("unlisted")}
+        freq = {col: bounds["freq"] for col, bounds in self.error_bounds.items() if bounds.get("freq")}
+        if not (unique or quantiles or unlisted or freq):
+            return ""
+        text = "Approximate statistics:\n"
+        if unique:
+            text += f"- Unique counts of {len(unique)} columns are estimates (standard error {max(unique):.1%})\n"
+        if quantiles:
+            text += f"- Quartiles (25%, 50%, 75%) are within {max(quantiles):.1%} of the true rank\n"
+        if unlisted:
+            text += "- Value distributions list the most frequent values with exact counts; values not listed occur at most "
+            text += ", ".join(f"{count} times in {col}" for col, count in unlisted.items()) + "\n"
+        if freq:
+            text += "- Counts of the most frequent value (freq) are lower bounds, low by up to "
+            text += ", ".join(f"{error} in {col}" for col, error in freq.items()) + "\n"
+        return text
+
+    def column_info_text(self) -> str:
+        """Column information block shown in the upload preview"""
+        text = "Column Information:\n"
+        for col, stats in self.column_stats.items():
+            if stats["numeric"]:
+                text += f"- {col} (numeric): min={stats['min']}, max={stats['max']}, mean={stats['mean']:.2f}\n"
+            else:
+                approx = "" if stats.get("unique_exact", True) else "~"
+                text += f"- {col} (non-numeric): {approx}{stats['unique']} unique values\n"
+        return text
+
+    def distribution_text(self, col: str, top_k: Optional[int] = None) -> str:
+        """Value distribution of one column; beyond top_k values the rest are folded into 'other'"""
+        value_counts = self.value_counts[col]
+        error = self.value_count_errors.get(col)
+        unlisted = self.error_bounds.get(col, {}).get("unlisted")
+        if error:
+            text = f"\nDistribution of {col} (most frequent values, counts may be low by up to {error}):\n"
+        elif unlisted:
+            text = f"\nDistribution of {col} (most frequent values; any other value occurs at most {unlisted} times):\n"
+        else:
+            text = f"\nDistribution of {col}:\n"
+        shown = value_counts if top_k is None else value_counts.head(top_k)
+        for value, count in shown.items():
+            percentage = (count / self.n_rows) * 100
+            text += f"  {value}: {count} ({percentage:.1f}%)\n"
+        if unlisted:
+            # The listed values are only the heaviest ones; the rest of the non-null rows are unlisted values
+            other = int(self.summary.at["count", col]) - int(shown.sum())
+            percentage = (other / self.n_rows) * 100
+            text += f"  other values: {other} ({percentage:.1f}%)\n"
+        elif len(shown) < len(value_counts):
+            other = int(value_counts.iloc[len(shown):].sum())
+            percentage = (other / self.n_rows) * 100
+            text += f"  other ({len(value_counts) - len(shown)} values): {other} ({percentage:.1f}%)\n"
+        return text
+
+    def categorical_info_text(self) -> str:
+        """Value distributions of all categorical columns, formatted for the LLM prompt"""
+        return "".join(self.distribution_text(col) for col in self.value_counts)
+
+class ColumnStats:
+    """Mergeable statistics for one column, updated a chunk at a time"""
+
+    def __init__(self, max_tracked_values: int = 10000):
+        self.count = 0
+        self.null_count = 0
+        self.numeric = None
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.distinct = HyperLogLog()
+        self.top_values = TopValues(max_tracked_values)
+        self.quantiles = KLLSketch()
+
+    def update(self, series: pd.Series) -> None:
+        """Fold one chunk of the column into the statistics"""
+        non_null = series.dropna()
+        self.count += len(non_null)
+        self.null_count += len(series) - len(non_null)
+
+        is_numeric = pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype)
+        # A column is numeric only if every chunk parsed as numeric
+        self.numeric = is_numeric if self.numeric is None else (self.numeric and is_numeric)
+
+        if len(non_null):
+            if is_numeric:
+                values = non_null.to_numpy(dtype=np.float64)
+                self.sum += float(values.sum())
+                self.sum_sq += float(np.square(values).sum())
+                self.quantiles.update(values)
+                chunk_min, chunk_max = non_null.min(), non_null.max()
+                self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+                self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+            self.distinct.update(non_null)
+            self.top_values.update(non_null)
+
+    def merge(self, other: 'ColumnStats') -> None:
+        """Fold the statistics of another part of the same column into these"""
+        self.count += other.count
+        self.null_count += other.null_count
+        if other.numeric is not None:
+            self.numeric = other.numeric if self.numeric is None else (self.numeric and other.numeric)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        self.distinct.merge(other.distinct)
+        self.top_values.merge(other.top_values)
+        self.quantiles.merge(other.quantiles)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else float('nan')
+
+    @property
+    def std(self) -> float:
+        if self.count < 2:
+            return float('nan')
+        variance = (self.sum_sq - self.count * self.mean ** 2) / (self.count - 1)
+        return float(np.sqrt(max(variance, 0.0)))
+
+    @property
+    def unique_exact(self) -> bool:
+        """Unique count is exact while the value counter has not been truncated"""
+        return self.top_values.exact
+
+    @property
+    def unique_count(self) -> int:
+        if self.unique_exact:
+            return len(self.top_values.counts)
+        return self.distinct.estimate()
+
+class ProfileBuilder:
+    """Folds CSV chunks into a DatasetProfile without keeping the full data in memory"""
+
+    def __init__(self, content_hash: str, sample_rows: int = 100000,
+                 max_tracked_values: int = 10000, seed: int = 0):
+        self.content_hash = content_hash
+        self.sample_rows = sample_rows
+        self.max_tracked_values = max_tracked_values
+        self.n_rows = 0
+        self.columns = None
+        self.head = None
+        self.stats = {}
+        self._rng = np.random.default_rng(seed)
+        self._reservoir = None
+        self._reservoir_keys = None
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """Fold one chunk into the running profile"""
+        if self.columns is None:
+            self.columns = chunk.columns.tolist()
+            self.head = chunk.head(5)
+            self.stats = {col: ColumnStats(self.max_tracked_values) for col in self.columns}
+        self.n_rows += len(chunk)
+        for col in self.columns:
+            self.stats[col].update(chunk[col])
+        self._update_reservoir(chunk)
+
+    def merge(self, other: 'ProfileBuilder') -> None:
+        """Fold a builder that read the rows following this one's (e.g. the next byte range of the file)
+
+        The other builder's row numbers are shifted to follow these rows, and the
+        merged row sample keeps the rows with the smallest random keys of both,
+        so it stays a uniform sample of all rows.
+        """
+        if other.columns is None:
+            return
+        if self.columns is None:
+            self.columns, self.head, self.stats = other.columns, other.head, other.stats
+        else:
+            if other.columns != self.columns:
+                raise ValueError("Cannot merge profiles of different columns")
+            for col in self.columns:
+                self.stats[col].merge(other.stats[col])
+        reservoir = other._reservoir.set_axis(other._reservoir.index + self.n_rows)
+        self.n_rows += other.n_rows
+        if self._reservoir is None:
+            self._reservoir, self._reservoir_keys = reservoir, other._reservoir_keys
+            return
+        chunk = pd.concat([self._reservoir, reservoir])
+        keys = np.concatenate([self._reservoir_keys, other._reservoir_keys])
+        if len(chunk) > self.sample_rows:
+            order = np.argpartition(keys, self.sample_rows)[:self.sample_rows]
+            chunk, keys = chunk.iloc[order], keys[order]
+        self._reservoir, self._reservoir_keys = chunk, keys
+
+    def _update_reservoir(self, chunk: pd.DataFrame) -> None:
+        """Keep a uniform sample by retaining the rows with the smallest random keys"""
+        keys = self._rng.random(len(chunk))
+        if self._reservoir is not None:
+            if len(self._reservoir) >= self.sample_rows:
+                keep = keys < self._reservoir_keys.max()
+                chunk, keys = chunk[keep], keys[keep]
+            chunk = pd.concat([self._reservoir, chunk])
+            keys = np.concatenate([self._reservoir_keys, keys])
+        if len(chunk) > self.sample_rows:
+            order = np.argpartition(keys, self.sample_rows)[:self.sample_rows]
+            chunk, keys = chunk.iloc[order], keys[order]
+        self._reservoir, self._reservoir_keys = chunk, keys
+
+    def build(self) -> DatasetProfile:
+        """Produce the profile for everything folded so far"""
+        if self.columns is None:
+            raise ValueError("No data rows were read")
+
+        column_stats = {}
+        value_counts = {}
+        value_count_errors = {}
+        error_bounds = {}
+        summary = {}
+        for col, stats in self.stats.items():
+            unique = stats.unique_count
+            top = stats.top_values.most_common(1)
+            if stats.numeric:
+                q25, q50, q75 = stats.quantiles.quantiles([0.25, 0.5, 0.75])
+                column_stats[col] = {"numeric": True, "min": stats.min, "max": stats.max, "mean": stats.mean}
+                summary[col] = {"count": stats.count, "mean": stats.mean, "std": stats.std,
+                                "min": stats.min, "25%": q25, "50%": q50, "75%": q75, "max": stats.max}
+                error_bounds[col] = {"quantiles": stats.quantiles.rank_error}
+            else:
+                column_stats[col] = {"numeric": False, "unique": unique + int(stats.null_count > 0),
+                                     "unique_exact": stats.unique_exact}
+                summary[col] = {"count": stats.count, "unique": unique,
+                                "top": top.index[0] if len(top) else None,
+                                "freq": int(top.iloc[0]) if len(top) else None}
+                if not stats.unique_exact:
+                    error_bounds[col] = {"unique": stats.distinct.relative_error}
+                if not stats.top_values.exact and len(top):
+                    error_bounds.setdefault(col, {})["freq"] = stats.top_values.error
+            if (not stats.numeric or unique < 10) and len(stats.top_values.counts):
+                value_counts[col] = stats.top_values.most_common()
+                if not stats.top_values.exact:
+                    value_count_errors[col] = stats.top_values.error
+
+        summary_index = ["count", "unique", "top", "freq", "mean", "std", "min", "25%", "50%", "75%", "max"]
+        return DatasetProfile(
+            content_hash=self.content_hash,
+            n_rows=self.n_rows,
+            columns=self.columns,
+            summary=pd.DataFrame(summary, index=summary_index, columns=self.columns),
+            sample=self.head,
+            column_stats=column_stats,
+            value_counts=value_counts,
+            row_sample=self._reservoir.sort_index(),
+            value_count_errors=value_count_errors,
+            schema={col: str(dtype) for col, dtype in self.head.dtypes.items()},
+            error_bounds=error_bounds,
+            builder=self,
+        )
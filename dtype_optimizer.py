@@ -0,0 +1,199 @@
+import warnings
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from parallel import map_columns
+
+class DtypeOptimizer:
+    """Module for shrinking dataframe memory by picking compact column dtypes"""
+
+    @staticmethod
+    def optimize(df: pd.DataFrame, max_category_ratio: float = 0.05,
+                 parse_dates: bool = True, workers: int = 1) -> tuple[pd.DataFrame, dict]:
+        """Return a copy of df with compact dtypes and a per-column report
+
+        Integers are downcast to the smallest type holding their range, floats are
+        downcast only when float32 represents every value exactly, object columns
+        whose values parse as dates become datetimes, and object columns with at
+        most max_category_ratio unique values per row become categoricals. A
+        column keeps its dtype when the new one would not be smaller. float32
+        only stores values; profiles and query plans aggregate them as float64.
+        The report maps column -> (old dtype, new dtype, bytes before, bytes after).
+        With workers > 1 the columns are converted on a thread pool.
+        """
+        def optimize_column(series):
+            before = int(series.memory_usage(index=False, deep=True))
+            converted = DtypeOptimizer._optimize_series(series, max_category_ratio, parse_dates)
+            after = int(converted.memory_usage(index=False, deep=True))
+            if after >= before:
+                converted, after = series, before
+            return converted, (str(series.dtype), str(converted.dtype), before, after)
+
+        optimized = {}
+        report = {}
+        for col, (converted, entry) in zip(df.columns, map_columns(optimize_column, df, workers)):
+            optimized[col] = converted
+            report[col] = entry
+        return pd.DataFrame(optimized, index=df.index), report
+
+    @staticmethod
+    def _optimize_series(series: pd.Series, max_category_ratio: float, parse_dates: bool) -> pd.Series:
+        """Pick a compact dtype for a single column"""
+        dtype = series.dtype
+        if pd.api.types.is_bool_dtype(dtype):
+            return series
+
+        if pd.api.types.is_integer_dtype(dtype):
+            downcast = 'unsigned' if len(series) and series.min() >= 0 else 'integer'
+            return pd.to_numeric(series, downcast=downcast)
+
+        if pd.api.types.is_float_dtype(dtype):
+            values = series.to_numpy()
+            as_float32 = values.astype(np.float32)
+            lossless = np.array_equal(as_float32.astype(values.dtype), values, equal_nan=True)
+            return series.astype(np.float32) if lossless else series
+
+        if pd.api.types.is_object_dtype(dtype):
+            non_null = series.dropna()
+            if len(non_null) == 0:
+                return series
+            if parse_dates and DtypeOptimizer._looks_like_dates(non_null):
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', UserWarning)
+                    parsed = pd.to_datetime(series, errors='coerce')
+                if parsed.notna().sum() == len(non_null):
+                    return parsed
+            if non_null.nunique() <= max_category_ratio * len(series):
+                return series.astype('category')
+        return series
+
+    @staticmethod
+    def _looks_like_dates(non_null: pd.Series, sample_size: int = 1000) -> bool:
+        """Cheap check on a sample before attempting a full datetime parse"""
+        sample = non_null.head(sample_size)
+        if not all(isinstance(value, str) for value in sample):
+            return False
+        if not sample.str.contains(r'\d').all() or not sample.str.contains(r'[-/:]').all():
+            return False
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            parsed = pd.to_datetime(sample, errors='coerce')
+        return bool(parsed.notna().all())
+
+    @staticmethod
+    def widen(dtype) -> str:
+        """The 64-bit dtype of a downcast numeric dtype name; other dtypes are returned unchanged
+
+        A schema describes the file it was taken from. Integers of another file may
+        not fit the downcast type and floats may not be exact in float32, so
+        schemas are only ever applied with widened numeric types.
+        """
+        dtype = str(dtype)
+        if dtype.startswith(('int', 'uint')):
+            return 'int64'
+        if dtype.startswith(('Int', 'UInt')):
+            return 'Int64'
+        if dtype.startswith('float'):
+            return 'float64'
+        if dtype.startswith('Float'):
+            return 'Float64'
+        return dtype
+
+    @staticmethod
+    def read_kwargs(schema: dict) -> dict:
+        """Translate a column -> dtype schema into pd.read_csv keyword arguments
+
+        Numeric dtypes are widened (see widen); pd.read_csv raises ValueError for
+        values that do not fit even then, e.g. decimals in an integer column.
+        """
+        dtypes = {}
+        date_columns = []
+        for col, dtype in schema.items():
+            if str(dtype).startswith('datetime64'):
+                date_columns.append(col)
+            else:
+                dtypes[col] = DtypeOptimizer.widen(dtype)
+        return {"dtype": dtypes, "parse_dates": date_columns}
+
+    @staticmethod
+    def apply_schema(df: pd.DataFrame, schema: dict, workers: int = 1) -> pd.DataFrame:
+        """Convert already parsed columns to the (widened) dtypes of a schema
+
+        The counterpart of read_kwargs for readers that cannot take dtypes up
+        front. Raises KeyError, ValueError or TypeError when the schema does not
+        fit the data, like pd.read_csv with read_kwargs would.
+        """
+        if list(schema) != df.columns.tolist():
+            raise KeyError("Schema columns do not match the file")
+
+        def convert(series):
+            dtype = DtypeOptimizer.widen(schema[series.name])
+            if dtype.startswith('datetime64'):
+                return pd.to_datetime(series)
+            if pd.api.types.is_float_dtype(series.dtype) and dtype.lower() == 'int64':
+                # astype would silently truncate decimals and fail only on missing values
+                values = series.dropna()
+                if not np.array_equal(values, np.trunc(values)):
+                    raise ValueError(f"Column {series.name} has non-integer values")
+            return series.astype(dtype)
+
+        return pd.DataFrame(dict(zip(df.columns, map_columns(convert, df, workers))), index=df.index)
+
+    @staticmethod
+    def append_read_kwargs(df: pd.DataFrame) -> dict:
+        """pd.read_csv keyword arguments for rows to be appended to df with append_rows
+
+        Text, categorical and date columns are read as text, as they were in the
+        whole file, and converted by append_rows.
+        """
+        text = [col for col, dtype in df.dtypes.items()
+                if pd.api.types.is_object_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype)
+                or pd.api.types.is_datetime64_any_dtype(dtype)]
+        return {"dtype": {col: object for col in text}}
+
+    @staticmethod
+    def append_rows(df: pd.DataFrame, new: pd.DataFrame, optimize: bool = True) -> pd.DataFrame:
+        """Append newly parsed rows to df, keeping each column's dtype where the new values fit
+
+        Categoricals gain any new categories, and with optimize a numeric column
+        the new values widen is shrunk again. Raises ValueError when a column
+        cannot keep its kind (text in a numeric column, a missing value in a
+        boolean one, an unparsable date); the whole file then has to be parsed again.
+        """
+        if new.columns.tolist() != df.columns.tolist():
+            raise ValueError("The new rows have different columns")
+        combined = {}
+        for col in df.columns:
+            old, rows = df[col], new[col]
+            dtype = old.dtype
+            if isinstance(dtype, pd.CategoricalDtype):
+                rows = pd.Series(pd.Categorical(rows, categories=rows.dropna().unique()), name=col)
+                combined[col] = pd.Series(union_categoricals([old, rows]), name=col)
+                continue
+            if pd.api.types.is_datetime64_any_dtype(dtype):
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', UserWarning)
+                    rows = pd.to_datetime(rows)
+            elif pd.api.types.is_bool_dtype(dtype):
+                if not pd.api.types.is_bool_dtype(rows.dtype):
+                    raise ValueError(f"Column {col} is no longer boolean")
+            elif pd.api.types.is_numeric_dtype(dtype):
+                if not pd.api.types.is_numeric_dtype(rows.dtype) or pd.api.types.is_bool_dtype(rows.dtype):
+                    raise ValueError(f"Column {col} is no longer numeric")
+            series = pd.concat([old, rows], ignore_index=True)
+            if optimize and series.dtype != dtype and pd.api.types.is_numeric_dtype(series.dtype):
+                series = DtypeOptimizer._optimize_series(series, 0.05, False)
+            combined[col] = series
+        return pd.DataFrame(combined)
+
+    @staticmethod
+    def report_text(report: dict) -> str:
+        """Format an optimization report for the upload preview"""
+        total_before = sum(before for _, _, before, _ in report.values())
+        total_after = sum(after for _, _, _, after in report.values())
+        text = (f"Memory Optimization: {total_before / 1e6:.2f} MB -> {total_after / 1e6:.2f} MB "
+                f"(saved {(total_before - total_after) / 1e6:.2f} MB)\n")
+        for col, (old_dtype, new_dtype, before, after) in report.items():
+            if old_dtype != new_dtype:
+                text += f"- {col}: {old_dtype} -> {new_dtype}, saved {before - after} bytes\n"
+        return text
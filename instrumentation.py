@@ -0,0 +1,241 @@
+import contextvars
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+def _rss_bytes() -> tuple[int, int]:
+    """Current and peak resident set size of the process in bytes (current is 0 without /proc)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak if sys.platform == "darwin" else peak * 1024
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        current = 0
+    return current, peak
+
+class RequestTrace:
+    """Stage timings and counters of one request
+
+    Span durations are summed per name, so a stage that runs twice (e.g. two LLM
+    calls) reports its total time.
+    """
+
+    def __init__(self, kind: str, **attributes):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.spans = {}
+        self.counters = defaultdict(int)
+        self.start = time.perf_counter()
+        self.duration = None
+        self.error = None
+        self.rss_start, _ = _rss_bytes()
+        self.rss_end = self.peak_rss = None
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - start
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counters[name] += value
+
+    def finish(self, error: Optional[str] = None) -> None:
+        self.duration = time.perf_counter() - self.start
+        self.error = error
+        self.rss_end, self.peak_rss = _rss_bytes()
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "kind": self.kind,
+            "timestamp": time.time(),
+            "duration_seconds": round(self.duration, 6) if self.duration is not None else None,
+            "spans": {name: round(seconds, 6) for name, seconds in self.spans.items()},
+            "counters": dict(self.counters),
+            "attributes": self.attributes,
+            "error": self.error,
+            "rss_mb": round(self.rss_end / 1e6, 1) if self.rss_end else None,
+            "rss_delta_mb": round((self.rss_end - self.rss_start) / 1e6, 1) if self.rss_end else None,
+            "peak_rss_mb": round(self.peak_rss / 1e6, 1) if self.peak_rss else None,
+        }
+
+def current_trace() -> Optional[RequestTrace]:
+    """The trace of the request running in this context, if any"""
+    return _current_trace.get()
+
+@contextmanager
+def span(name: str):
+    """Time a stage of the current request; does nothing outside a traced request"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+def record(**attributes) -> None:
+    """Attach attributes to the current request's trace"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.set(**attributes)
+
+def count(name: str, value: int = 1) -> None:
+    """Add to a counter of the current request's trace"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.count(name, value)
+
+class Instrumentation:
+    """Collects per-request traces, appends them to a JSON log and aggregates them for Prometheus
+
+    Code deeper in the stack reports into the active trace through the
+    module-level span(), record() and count() helpers, which find it through a
+    context variable, so no trace object needs to be passed around. gauges_fn
+    may return a nested dict of numbers exported as gauges alongside the
+    request metrics (e.g. queue depth and cache sizes).
+    """
+
+    def __init__(self, log_path: Optional[str] = None, max_recent: int = 1000,
+                 gauges_fn: Optional[Callable[[], dict]] = None):
+        self.log_path = log_path
+        self.gauges_fn = gauges_fn
+        self.recent = deque(maxlen=max_recent)
+        self._requests = defaultdict(int)
+        self._span_sums = defaultdict(float)
+        self._span_counts = defaultdict(int)
+        self._counters = defaultdict(int)
+        self._peak_rss = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @contextmanager
+    def trace(self, kind: str, **attributes):
+        """Trace one request; the trace is logged when the block exits"""
+        trace = RequestTrace(kind, **attributes)
+        token = _current_trace.set(trace)
+        error = None
+        try:
+            yield trace
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            try:
+                _current_trace.reset(token)
+            except ValueError:
+                # An async generator resumed in another context; just detach the trace there
+                _current_trace.set(None)
+            trace.finish(error or trace.attributes.get("error"))
+            self._collect(trace)
+
+    def _collect(self, trace: RequestTrace) -> None:
+        entry = trace.as_dict()
+        status = "error" if trace.error else "ok"
+        with self._lock:
+            self.recent.append(entry)
+            self._requests[(trace.kind, str(trace.attributes.get("path", "")), status)] += 1
+            for name, seconds in trace.spans.items():
+                self._span_sums[(trace.kind, name)] += seconds
+                self._span_counts[(trace.kind, name)] += 1
+            self._span_sums[(trace.kind, "total")] += trace.duration
+            self._span_counts[(trace.kind, "total")] += 1
+            for name, value in trace.counters.items():
+                self._counters[name] += value
+            self._peak_rss = max(self._peak_rss, trace.peak_rss or 0)
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry, default=str) + "\n")
+                except OSError as e:
+                    print(f"Could not write trace log: {str(e)}")
+
+    def summary(self) -> dict:
+        """Mean seconds per stage and counter totals over all traced requests"""
+        with self._lock:
+            return {
+                "requests": sum(self._requests.values()),
+                "mean_seconds": {f"{kind}.{name}": round(self._span_sums[(kind, name)] / count, 6)
+                                 for (kind, name), count in self._span_counts.items()},
+                "counters": dict(self._counters),
+                "peak_rss_mb": round(self._peak_rss / 1e6, 1),
+            }
+
+    @staticmethod
+    def _label(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+    def prometheus_text(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP csvqa_requests_total Traced requests by kind, answer path and status",
+            "# TYPE csvqa_requests_total counter",
+        ]
+        with self._lock:
+            for (kind, path, status), value in sorted(self._requests.items()):
+                lines.append(f'csvqa_requests_total{{kind="{self._label(kind)}",path="{self._label(path)}",'
+                             f'status="{status}"}} {value}')
+            lines += ["# HELP csvqa_stage_seconds Time spent per request stage",
+                      "# TYPE csvqa_stage_seconds summary"]
+            for (kind, name), total in sorted(self._span_sums.items()):
+                labels = f'kind="{self._label(kind)}",stage="{self._label(name)}"'
+                lines.append(f"csvqa_stage_seconds_sum{{{labels}}} {total:.6f}")
+                lines.append(f"csvqa_stage_seconds_count{{{labels}}} {self._span_counts[(kind, name)]}")
+            for name, value in sorted(self._counters.items()):
+                lines += [f"# TYPE csvqa_{name}_total counter", f"csvqa_{name}_total {value}"]
+            lines += ["# TYPE csvqa_peak_rss_bytes gauge", f"csvqa_peak_rss_bytes {self._peak_rss}"]
+
+        if self.gauges_fn is not None:
+            for name, value in self._flatten(self.gauges_fn()):
+                lines += [f"# TYPE csvqa_{name} gauge", f"csvqa_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def _flatten(cls, values: dict, prefix: str = ""):
+        for key, value in values.items():
+            name = f"{prefix}{key}".replace(".", "_").replace("-", "_")
+            if isinstance(value, dict):
+                yield from cls._flatten(value, name + "_")
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield name, value
+
+    def start_metrics_server(self, port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve /metrics in the Prometheus text format from a background thread"""
+        instrumentation = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = instrumentation.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"Serving Prometheus metrics on http://{host}:{self._server.server_address[1]}/metrics")
+        return self._server
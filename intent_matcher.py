@@ -0,0 +1,254 @@
+import difflib
+import re
+from typing import Optional
+import pandas as pd
+from dataset_profile import DatasetProfile
+from models import VisualizationParams
+
+# Wording that turns a lookup into real analysis: filters, grouping, comparisons, time ranges
+COMPLICATING = re.compile(
+    r"\b(where|with|have|has|having|which|whose|that|by|per|each|for|between|greater|less|more|fewer|above|below|"
+    r"over|under|than|after|before|during|since|until|if|when|group|grouped|compare|compared|versus|vs|trend|"
+    r"top|bottom|and|or|not|except|excluding|only|why|predict|correlation|relationship)\b|[<>=]|\d")
+
+# "in the dataset" and similar phrases add nothing to the question
+DATASET_PHRASES = re.compile(
+    r"\b(in|of|from|across)\s+(the|this|my|our)?\s*(whole\s+|entire\s+)?(dataset|data\s*set|data|file|table|csv|sheet)\b")
+
+STATISTICS = [
+    ("mean", "average", r"\b(average|mean|avg)\b"),
+    ("50%", "median", r"\bmedian\b"),
+    ("min", "minimum", r"\b(minimum|min|lowest|smallest|least)\b"),
+    ("max", "maximum", r"\b(maximum|max|highest|largest|biggest|greatest)\b"),
+    ("std", "standard deviation", r"\b(standard deviation|std|stdev)\b"),
+]
+
+class IntentMatch:
+    """A question resolved from the dataset profile without the LLM"""
+
+    def __init__(self, intent: str, answer: str, confidence: float,
+                 visualization: Optional[VisualizationParams] = None):
+        self.intent = intent
+        self.answer = answer
+        self.confidence = confidence
+        self.visualization = visualization
+
+    def __repr__(self) -> str:
+        return f"IntentMatch({self.intent!r}, confidence={self.confidence:.2f})"
+
+class IntentMatcher:
+    """Answers common schema and summary questions directly from the cached profile
+
+    Recognized shapes: row count, column names and count, data types, a summary
+    statistic of one column (mean, median, min, max, standard deviation),
+    distinct values, most common values / distribution, and missing values.
+
+    Each candidate gets a confidence from how completely the question matched
+    the shape and how well the column name matched; leftover words lower it,
+    most of all wording that implies filtering, grouping or comparison. Only matches at or above
+    threshold should be used; everything else goes to the LLM.
+    """
+
+    def __init__(self, threshold: float = 0.8, max_listed_values: int = 10):
+        self.threshold = threshold
+        self.max_listed_values = max_listed_values
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        text = re.sub(r"[_\-]+", " ", str(text).lower())
+        text = re.sub(r"[^\w\s<>=%]", " ", text)
+        return " ".join(text.split())
+
+    @staticmethod
+    def _format_number(value) -> str:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            if float(value).is_integer():
+                return f"{int(value):,}"
+            return f"{value:,.6g}"
+        return str(value)
+
+    def _find_column(self, profile: DatasetProfile, question: str) -> tuple[Optional[str], float, str]:
+        """Best matching column, its match score and the question with the column name removed"""
+        best, best_score, best_span = None, 0.0, None
+        for col in profile.columns:
+            name = self._normalize(col)
+            if not name:
+                continue
+            match = re.search(rf"\b{re.escape(name)}\b", question)
+            # Prefer the longest exact mention ("unit price" over "price")
+            if match and (best_score < 1.0 or len(name) > len(self._normalize(best))):
+                best, best_score, best_span = col, 1.0, match.span()
+        if best is not None:
+            return best, best_score, question[:best_span[0]] + " " + question[best_span[1]:]
+
+        # Fuzzy match against word n-grams of the same length as the column name
+        words = question.split()
+        for col in profile.columns:
+            name = self._normalize(col)
+            size = len(name.split())
+            for i in range(len(words) - size + 1):
+                candidate = " ".join(words[i:i + size])
+                score = difflib.SequenceMatcher(None, name, candidate).ratio()
+                if score > best_score:
+                    best, best_score, best_span = col, score, (i, i + size)
+        if best is None or best_score < 0.8:
+            return None, 0.0, question
+        rest = " ".join(words[:best_span[0]] + words[best_span[1]:])
+        # A close spelling is good evidence, but not as good as the exact name
+        return best, best_score * 0.95, rest
+
+    @staticmethod
+    def _confidence(rest: str, score: float = 1.0) -> float:
+        """Full score when nothing but filler words is left over; unexplained words lower it"""
+        if not rest.strip():
+            return score
+        return score * (0.3 if COMPLICATING.search(rest) else 0.6)
+
+    def match(self, profile: DatasetProfile, question: str) -> Optional[IntentMatch]:
+        """Return the most confident answer for the question, or None if no shape fits
+
+        The result may be below threshold; callers should compare confidence
+        before using it.
+        """
+        text = DATASET_PHRASES.sub(" ", self._normalize(question))
+        text = " ".join(text.split())
+        candidates = [
+            self._row_count(profile, text),
+            self._column_names(profile, text),
+            self._data_types(profile, text),
+            self._statistic(profile, text),
+            self._unique_values(profile, text),
+            self._distribution(profile, text),
+            self._missing_values(profile, text),
+        ]
+        candidates = [candidate for candidate in candidates if candidate is not None]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda candidate: candidate.confidence)
+
+    def _row_count(self, profile: DatasetProfile, text: str) -> Optional[IntentMatch]:
+        if not re.search(r"\b(rows|records|entries|observations|lines|samples)\b", text):
+            return None
+        if not re.search(r"\b(how many|number of|count|total|size)\b", text):
+            return None
+        rest = re.sub(r"\b(what|is|are|the|how|many|number|of|count|total|size|rows|records|entries|observations|"
+                      r"lines|samples|there|do|we|i|you|give|me|tell|a|an|in|it|contain|contains|have|has)\b", " ", text)
+        confidence = self._confidence(rest)
+        return IntentMatch("row_count", f"The dataset has {self._format_number(profile.n_rows)} rows.", confidence)
+
+    def _column_names(self, profile: DatasetProfile, text: str) -> Optional[IntentMatch]:
+        if not re.search(r"\b(columns?|fields|headers|variables|attributes)\b", text):
+            return None
+        if re.search(r"\b(types?|dtypes?)\b", text):
+            return None
+        rest = re.sub(r"\b(what|which|are|is|the|list|show|me|all|give|tell|names?|columns?|fields|headers|"
+                      r"variables|attributes|available|there|do|we|have|has|how|many|number|of|count|total|a|"
+                      r"in|it|contain|contains)\b", " ", text)
+        confidence = self._confidence(rest)
+        names = ", ".join(str(col) for col in profile.columns)
+        return IntentMatch("column_names", f"The dataset has {len(profile.columns)} columns: {names}.", confidence)
+
+    def _data_types(self, profile: DatasetProfile, text: str) -> Optional[IntentMatch]:
+        if not re.search(r"\b(data ?types?|dtypes?|types? of (the )?columns|column types?)\b", text):
+            return None
+        rest = re.sub(r"\b(what|which|are|is|the|list|show|me|all|give|tell|data|types?|dtypes?|of|columns?|"
+                      r"each|every)\b", " ", text)
+        confidence = self._confidence(rest)
+        lines = "\n".join(f"- {col}: {profile.schema.get(col, 'unknown')}" for col in profile.columns)
+        return IntentMatch("data_types", f"Column data types:\n{lines}", confidence)
+
+    def _statistic(self, profile: DatasetProfile, text: str) -> Optional[IntentMatch]:
+        found = [statistic for statistic in STATISTICS if re.search(statistic[2], text)]
+        if len(found) != 1:
+            return None
+        key, label, pattern = found[0]
+        col, column_score, rest = self._find_column(profile, text)
+        if col is None or col not in profile.summary.columns or key not in profile.summary.index:
+            return None
+        value = profile.summary.at[key, col]
+        if pd.isna(value):
+            return None
+        rest = re.sub(pattern + r"|\b(what|is|the|of|value|values|a|an|column|field|tell|me|give|show|find|calculate|compute|"
+                      r"overall|all)\b", " ", rest)
+        confidence = self._confidence(rest, column_score)
+        count = profile.summary.at["count", col] if "count" in profile.summary.index else profile.n_rows
+        rank_error = profile.error_bounds.get(col, {}).get("quantiles") if key == "50%" else None
+        estimate = f"about {self._format_number(value)}, within {rank_error:.1%} of the true rank" if rank_error \
+            else self._format_number(value)
+        answer = f"The {label} of {col} is {estimate} (over {self._format_number(count)} non-missing values)."
+        return IntentMatch(label.replace(" ", "_"), answer, confidence,
+                           VisualizationParams(visualization_type="histogram", columns=[col],
+                                               title=f"Distribution of {col}"))
+
+    def _unique_values(self, profile: DatasetProfile, text: str) -> Optional[IntentMatch]:
+        if not re.search(r"\b(unique|distinct|different)\b", text):
+            return None
+        col, column_score, rest = self._find_column(profile, text)
+        if col is None:
+            return None
+        rest = re.sub(r"\b(how|many|number|of|count|the|what|are|is|unique|distinct|different|values?|there|"
+                      r"in|column|field|list|show|me|give|a)\b", " ", rest)
+        confidence = self._confidence(rest, column_score)
+        value_counts = profile.value_counts.get(col)
+        bounds = profile.error_bounds.get(col, {})
+        if value_counts is not None and not profile.value_count_errors.get(col) and not bounds.get("unlisted"):
+            count = int((value_counts > 0).sum())
+            approximate = False
+        elif "unique" in profile.summary.index and not pd.isna(profile.summary.at["unique", col]):
+            count = profile.summary.at["unique", col]
+            approximate = profile.streamed or "unique" in bounds
+        else:
+            return None
+        answer = f"{col} has {'about ' if approximate else ''}{self._format_number(count)} distinct values"
+        if value_counts is not None and not approximate and count <= self.max_listed_values:
+            answer += ": " + ", ".join(str(value) for value in value_counts[value_counts > 0].index)
+        return IntentMatch("unique_values", answer + ".", confidence)
+
+    def _distribution(self, profile: DatasetProfile, text: str) -> Optional[IntentMatch]:
+        if not re.search(r"\b(most (common|frequent|popular)|mode|distribution|breakdown|value counts|frequency|"
+                         r"frequencies)\b", text):
+            return None
+        col, column_score, rest = self._find_column(profile, text)
+        if col is None or col not in profile.value_counts or len(profile.value_counts[col]) == 0:
+            return None
+        rest = re.sub(r"\b(most|common|frequent|popular|mode|distribution|breakdown|value|values|counts?|"
+                      r"frequency|frequencies|what|is|are|the|of|show|me|give|a|column|field|plot|chart|graph|"
+                      r"visualize|display)\b", " ", rest)
+        confidence = self._confidence(rest, column_score)
+        value_counts = profile.value_counts[col]
+        if re.search(r"\b(most (common|frequent|popular)|mode)\b", text):
+            top, top_count = value_counts.index[0], value_counts.iloc[0]
+            error = profile.value_count_errors.get(col)
+            if error:
+                # Counted with a truncated counter: counts are lower bounds, so the order may be off too
+                answer = (f"The most common {col} is probably {top} (at least {self._format_number(top_count)} "
+                          f"rows, counts may be low by up to {self._format_number(error)}).")
+            else:
+                answer = (f"The most common {col} is {top} ({self._format_number(top_count)} rows, "
+                          f"{top_count / profile.n_rows * 100:.1f}%).")
+        else:
+            answer = profile.distribution_text(col, self.max_listed_values).strip()
+        chart_type = "pie" if len(value_counts) <= 8 else "bar"
+        return IntentMatch("distribution", answer, confidence,
+                           VisualizationParams(visualization_type=chart_type, columns=[col],
+                                               title=f"Distribution of {col}"))
+
+    def _missing_values(self, profile: DatasetProfile, text: str) -> Optional[IntentMatch]:
+        if not re.search(r"\b(missing|null|nulls|nan|nans|empty|blank|na)\b", text):
+            return None
+        if "count" not in profile.summary.index:
+            return None
+        col, column_score, rest = self._find_column(profile, text)
+        rest = re.sub(r"\b(how|many|number|of|count|the|what|are|is|there|any|missing|null|nulls|nan|nans|"
+                      r"empty|blank|na|values?|in|column|columns|field|each|every|per|do|does|have|has)\b", " ", rest)
+        confidence = self._confidence(rest, column_score if col is not None else 1.0)
+        missing = (profile.n_rows - profile.summary.loc["count"]).astype(int)
+        if col is not None:
+            answer = f"{col} has {self._format_number(missing[col])} missing values out of " \
+                     f"{self._format_number(profile.n_rows)} rows."
+        elif missing.sum() == 0:
+            answer = "There are no missing values."
+        else:
+            lines = "\n".join(f"- {name}: {self._format_number(count)}" for name, count in missing.items() if count)
+            answer = f"Missing values per column:\n{lines}"
+        return IntentMatch("missing_values", answer, confidence)
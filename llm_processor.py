@@ -1,17 +1,39 @@
-import io
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Optional
 import pandas as pd
+from pydantic import ValidationError
 from pydantic_ai import Agent
+from pydantic_ai.exceptions import UnexpectedModelBehavior
+from pydantic_ai.messages import (ModelRequest, ModelResponse, RetryPromptPart, SystemPromptPart, TextPart,
+                                  UserPromptPart)
+from pydantic_ai.models import Model
 from pydantic_ai.models.openai import OpenAIModel
 from pydantic_ai.providers.openai import OpenAIProvider
-from models import CSVQueryResponse, VisualizationParams
+from models import CSVQueryResponse, VisualizationParams, QueryPlan
+from dataset_profile import DatasetProfile
+from concurrency import RequestLimiter
+from prompt_builder import PromptBuilder, PromptStats
+from table_registry import TableRegistry
+import instrumentation
 import json
 
 class LLMProcessor:
     """Module for LLM integration using Ollama"""
     
-    def __init__(self, model_name: str = "llama3.2:latest"):
-        """Initialize the LLM processor with the specified model"""
-        self.model = OpenAIModel(
+    def __init__(self, model_name: str = "llama3.2:latest", max_concurrency: int = 2, max_queue: int = 32,
+                 token_budget: int = 6000, model: Optional[Model] = None, history_budget: int = 1500):
+        """Initialize the LLM processor with the specified model
+        
+        max_concurrency and max_queue bound the async paths: how many requests may
+        run against Ollama at once and how many may wait for a slot. token_budget
+        caps the estimated size of answer prompts, of which history_budget is kept
+        for earlier turns of the conversation. A model passed in replaces the
+        Ollama model, e.g. a deterministic stand-in for offline benchmarks.
+        """
+        self.model = model or OpenAIModel(
             model_name=model_name,
             provider=OpenAIProvider(
                 base_url='http://localhost:11434/v1',
@@ -24,122 +46,440 @@ class LLMProcessor:
             result_type=CSVQueryResponse,
             retries=5
         )
+        
+        # Small structured call used to turn aggregate questions into a QueryPlan
+        self.planner = Agent(
+            self.model,
+            result_type=QueryPlan,
+            retries=2
+        )
+        
+        self.limiter = RequestLimiter(max_concurrency=max_concurrency, max_queue=max_queue)
+        self.prompt_builder = PromptBuilder(token_budget=token_budget)
+        # Size of the most recently built answer prompt
+        self.last_prompt_stats = None
+        # Seconds from sending the most recent streamed request to its first partial answer
+        self.last_ttft = None
+        self.history_budget = history_budget
+        # Part of token_budget kept for the question and the columns it names that the data context left out
+        self.question_budget = 300
+        # Question-independent prompt prefixes, see shared_context
+        self._shared_contexts = OrderedDict()
+        # Recently sent prompts, to estimate how much of the next one the server can reuse
+        self._recent_prompts = deque(maxlen=max_concurrency)
+        self._lock = threading.Lock()
+    
+    def _build_prompt(self, profile: Optional[DatasetProfile], query: str, include_visualization: bool,
+                      tables: Optional[TableRegistry] = None, history: Optional[list] = None) -> tuple[list, str]:
+        """Build the answer request as (message history, user prompt)
+        
+        The system message holds the data description and instructions, which are
+        the same for every question about the dataset (see shared_context). The
+        session's earlier (question, answer) turns follow, then the question. A
+        model server that keeps the attention state of recent prompts (Ollama does,
+        per request slot) then only prefills what follows the prefix it has seen.
+        A multi-table session passes its tables instead of a profile.
+        """
+        context, context_stats = self.shared_context(profile, tables)
+        turns = self._fit_history(history or [])
+        messages = [ModelRequest(parts=[SystemPromptPart(context)])]
+        for question, answer in turns:
+            messages.append(ModelRequest(parts=[UserPromptPart(self._question_text(question))]))
+            messages.append(ModelResponse(parts=[TextPart(answer)]))
+        prompt = self._question_text(query, include_visualization)
+        
+        # A wide dataset's stable context covers only its first columns; describe the ones the question names
+        details = []
+        if tables is None and context_stats.columns_included < context_stats.columns_total:
+            detail_text, details = self.prompt_builder.question_context(
+                profile, query, profile.columns[:context_stats.columns_included], token_budget=self.question_budget)
+            if details:
+                prompt = detail_text + "\n" + prompt
+        
+        # Stand-in for the rendered prompt: its text up to the first difference is what a cache can reuse
+        text = context + "".join(f"\n{self._question_text(question)}\n{answer}" for question, answer in turns) \
+            + f"\n{prompt}"
+        estimated_tokens = self.prompt_builder.estimate_tokens(text)
+        # Only an estimate: the server's own cache may have evicted the prefix; llm_answer_request_tokens
+        # (see _record_run) is what the server reports it actually evaluated
+        reused_tokens = min(self.prompt_builder.estimate_tokens(self._cached_prefix(text)), estimated_tokens)
+        self.last_prompt_stats = PromptStats(
+            chars=len(text),
+            estimated_tokens=estimated_tokens,
+            columns_included=context_stats.columns_included + len(details),
+            columns_total=context_stats.columns_total,
+            token_budget=self.prompt_builder.token_budget,
+            history_turns=len(turns),
+            estimated_reused_tokens=reused_tokens,
+        )
+        instrumentation.count("prompt_tokens_estimated", estimated_tokens)
+        instrumentation.count("prefix_tokens_reused_estimated", reused_tokens)
+        instrumentation.record(prompt_chars=self.last_prompt_stats.chars,
+                               prompt_tokens=estimated_tokens,
+                               prompt_columns=self.last_prompt_stats.columns_included,
+                               prompt_history_turns=len(turns),
+                               prefix_tokens_reused_estimate=reused_tokens)
+        return messages, prompt
+    
+    def _fit_history(self, history: list) -> list:
+        """The most recent turns that fit the history budget; older turns are dropped whole"""
+        turns, used = [], 0
+        for question, answer in reversed(history):
+            used += self.prompt_builder.estimate_tokens(self._question_text(question) + answer)
+            if used > self.history_budget:
+                break
+            turns.append((question, answer))
+        return turns[::-1]
+    
+    def _cached_prefix(self, text: str) -> str:
+        """Longest prefix the text shares with one of the recently sent prompts, then remember the text
+        
+        One prompt is remembered per concurrent request, like the server's cache slots.
+        The server may have evicted a remembered prompt, so this only bounds what it can reuse.
+        """
+        with self._lock:
+            prefix = max((os.path.commonprefix([text, previous]) for previous in self._recent_prompts),
+                         key=len, default="")
+            self._recent_prompts.append(text)
+        return prefix
+    
+    @staticmethod
+    def _question_text(query: str, include_visualization: bool = False) -> str:
+        text = f'Question: "{query}"'
+        if include_visualization:
+            text += "\nThe user wants a visualization with the answer."
+        return text
+    
+    def shared_context(self, profile: Optional[DatasetProfile] = None,
+                       tables: Optional[TableRegistry] = None) -> tuple[str, PromptStats]:
+        """Question-independent data description and instructions for a dataset
+        
+        The columns keep file order instead of being ranked by the question. The
+        result is memoized per dataset hash. The context of a multi-table session
+        is rebuilt each time, since it gains row counts and exact dtypes as
+        columns are loaded.
+        """
+        instructions = self._instructions()
+        # Leave room for the earlier turns and the question that follow the context
+        overhead = self.prompt_builder.estimate_tokens(instructions) + self.history_budget + self.question_budget
+        budget = max(self.prompt_builder.token_budget - overhead, 0)
+        if tables is not None:
+            data_context, context_stats = self.prompt_builder.build_tables_context(tables, token_budget=budget)
+            return "\n        Analyze these CSV tables.\n\n" + data_context + "\n" + instructions, context_stats
+        
+        key = (profile.content_hash, self.prompt_builder.token_budget)
+        with self._lock:
+            if profile.content_hash and key in self._shared_contexts:
+                self._shared_contexts.move_to_end(key)
+                return self._shared_contexts[key]
+        
+        data_context, context_stats = self.prompt_builder.build_context(profile, token_budget=budget)
+        entry = ("\n        Analyze this CSV data.\n\n" + data_context + "\n" + instructions, context_stats)
+        
+        if profile.content_hash:
+            with self._lock:
+                self._shared_contexts[key] = entry
+                while len(self._shared_contexts) > 32:
+                    self._shared_contexts.popitem(last=False)
+        return entry
+    
+    @staticmethod
+    def _instructions() -> str:
+        """Answering and output-format instructions that follow the data description"""
+        return """
+        Instructions:
+        1. Answer the question using ONLY the data provided above
+        2. Be precise with numbers and statistics
+        3. If the information isn't in the data, say "I cannot answer this question with the available data"
+        4. Format your response as a valid JSON object
+        5. Earlier questions and answers may follow; use them to understand follow-up questions
+        
+        Available visualization types:
+        - "histogram": Shows distribution of a single numeric column
+        - "pie": Shows distribution of a categorical column
+        - "bar": Shows bar chart (can be used for comparing categories or time series)
+        - "scatter": Shows relationship between two numeric columns
+        - "line": Shows trend over time or ordered data
+        
+        Respond with a JSON object in this exact format:
+        {
+            "answer": "Your answer here",
+            "create_visualization": false,
+            "visualization_params": {
+                "visualization_type": "line",  # One of: histogram, pie, bar, scatter, line
+                "columns": ["column1", "column2"],  # Required columns for the visualization
+                "title": "Optional title for the visualization",
+                "x_axis_label": "Optional x-axis label",
+                "y_axis_label": "Optional y-axis label"
+            }
+        }
+        
+        Only set create_visualization to true if the user specifically asked for a visualization.
+        When creating a visualization:
+        1. Choose appropriate visualization type based on the data and question
+        2. Specify exactly which columns to use
+        3. Provide clear title and axis labels
+        """
     
-    def process_query(self, df: pd.DataFrame, query: str, include_visualization: bool) -> CSVQueryResponse:
-        """Process a query about the CSV data using the LLM"""
+    def _parse_response(self, response) -> CSVQueryResponse:
+        """Convert the agent result into a CSVQueryResponse"""
+        # Debug print the response
+        print(f"Raw response from LLM: {response}")
+        
+        # Handle AgentRunResult type
+        if hasattr(response, 'data'):
+            return response.data
+        
+        # Handle different response types
+        if isinstance(response, str):
+            try:
+                response = json.loads(response)
+            except json.JSONDecodeError:
+                # If it's a string but not JSON, create a simple response
+                response = {
+                    "answer": response,
+                    "create_visualization": False,
+                    "visualization_params": None
+                }
+        
+        # Ensure we have a dictionary
+        if not isinstance(response, dict):
+            raise ValueError(f"Unexpected response type: {type(response)}")
+        
+        # Create the response object
         try:
-            # Prepare data description for the LLM
-            buffer = io.StringIO()
-            df.info(buf=buffer)
-            df_info = buffer.getvalue()
-            
-            # Create summary statistics and sample data
-            df_summary = df.describe(include='all').to_string()
-            df_sample = df.head(5).to_string()
-            column_names = df.columns.tolist()
-            
-            # Prepare categorical value distributions
-            categorical_info = ""
-            for col in df.columns:
-                if not pd.api.types.is_numeric_dtype(df[col].dtype) or df[col].nunique() < 10:
-                    value_counts = df[col].value_counts()
-                    categorical_info += f"\nDistribution of {col}:\n"
-                    for value, count in value_counts.items():
-                        percentage = (count / len(df)) * 100
-                        categorical_info += f"  {value}: {count} ({percentage:.1f}%)\n"
-            
-            # Construct a simpler prompt for the LLM
-            prompt = f"""
-            Analyze this CSV data and answer the question: "{query}"
-            
-            Data Overview:
-            - Columns: {', '.join(column_names)}
-            - Total rows: {len(df)}
-            
-            Summary Statistics:
-            {df_summary}
-            
-            Sample Data:
-            {df_sample}
-            
-            {categorical_info}
-            
-            Instructions:
-            1. Answer the question using ONLY the data provided above
-            2. Be precise with numbers and statistics
-            3. If the information isn't in the data, say "I cannot answer this question with the available data"
-            4. Format your response as a valid JSON object
-            
-            {"The user wants a visualization with the answer." if include_visualization else ""}
-            
-            Available visualization types:
-            - "histogram": Shows distribution of a single numeric column
-            - "pie": Shows distribution of a categorical column
-            - "bar": Shows bar chart (can be used for comparing categories or time series)
-            - "scatter": Shows relationship between two numeric columns
-            - "line": Shows trend over time or ordered data
-            
-            Respond with a JSON object in this exact format:
-            {{
-                "answer": "Your answer here",
-                "create_visualization": false,
-                "visualization_params": {{
-                    "visualization_type": "line",  # One of: histogram, pie, bar, scatter, line
-                    "columns": ["column1", "column2"],  # Required columns for the visualization
-                    "title": "Optional title for the visualization",
-                    "x_axis_label": "Optional x-axis label",
-                    "y_axis_label": "Optional y-axis label"
-                }}
-            }}
-            
-            Only set create_visualization to true if the user specifically asked for a visualization.
-            When creating a visualization:
-            1. Choose appropriate visualization type based on the data and question
-            2. Specify exactly which columns to use
-            3. Provide clear title and axis labels
-            """
+            return CSVQueryResponse(**response)
+        except Exception as e:
+            print(f"Error creating CSVQueryResponse: {str(e)}")
+            # Create a fallback response
+            return CSVQueryResponse(
+                answer=str(response),
+                create_visualization=False,
+                visualization_params=None
+            )
+    
+    @staticmethod
+    def _record_run(stage: str, result) -> None:
+        """Report retries, validation failures and token usage of an agent run to the current trace
+        
+        Every retry shows up as a RetryPromptPart sent back to the model; those
+        carrying pydantic error details are result validation failures.
+        """
+        retries = validation_failures = 0
+        for message in result.all_messages():
+            for part in getattr(message, 'parts', []):
+                if isinstance(part, RetryPromptPart):
+                    retries += 1
+                    if not isinstance(part.content, str):
+                        validation_failures += 1
+        usage = result.usage()
+        instrumentation.count("llm_retries", retries)
+        instrumentation.count("llm_validation_failures", validation_failures)
+        instrumentation.count("llm_requests", usage.requests)
+        # Prompt tokens the server reports evaluating; Ollama leaves out the prefix it reused from its cache
+        instrumentation.count("llm_request_tokens", usage.request_tokens or 0)
+        instrumentation.record(**{
+            f"{stage}_retries": retries,
+            f"{stage}_validation_failures": validation_failures,
+            f"{stage}_model_requests": usage.requests,
+            f"{stage}_request_tokens": usage.request_tokens,
+            f"{stage}_response_tokens": usage.response_tokens,
+        })
+    
+    @staticmethod
+    def _record_failure(stage: str, error: Exception) -> None:
+        """Count a run that gave up after using all its retries"""
+        if isinstance(error, UnexpectedModelBehavior) and "Exceeded maximum retries" in str(error):
+            instrumentation.count("llm_retries_exhausted")
+            instrumentation.record(**{f"{stage}_retries_exhausted": True})
+    
+    def process_query(self, df: Optional[pd.DataFrame], query: str, include_visualization: bool,
+                      profile: Optional[DatasetProfile] = None, tables: Optional[TableRegistry] = None,
+                      history: Optional[list] = None) -> CSVQueryResponse:
+        """Process a query about the CSV data using the LLM
+        
+        The dataset profile computed at upload time is reused when given; it is only
+        rebuilt here for callers that do not keep one around. Multi-table sessions
+        pass their tables instead of a frame and profile. history holds the
+        session's earlier (question, answer) turns, oldest first.
+        """
+        try:
+            if profile is None and tables is None:
+                with instrumentation.span("profile_build"):
+                    profile = DatasetProfile.from_dataframe("", df)
+            with instrumentation.span("prompt_build"):
+                messages, prompt = self._build_prompt(profile, query, include_visualization, tables, history)
             
             # Run the query through the LLM agent
-            response = self.agent.run_sync(prompt)
+            with instrumentation.span("llm_answer"):
+                response = self.agent.run_sync(prompt, message_history=messages)
+            self._record_run("llm_answer", response)
+            return self._parse_response(response)
             
-            # Debug print the response
-            print(f"Raw response from LLM: {response}")
-            
-            # Handle AgentRunResult type
-            if hasattr(response, 'data'):
-                return response.data
-            
-            # Handle different response types
-            if isinstance(response, str):
-                try:
-                    response = json.loads(response)
-                except json.JSONDecodeError:
-                    # If it's a string but not JSON, create a simple response
-                    response = {
-                        "answer": response,
-                        "create_visualization": False,
-                        "visualization_params": None
-                    }
-            
-            # Ensure we have a dictionary
-            if not isinstance(response, dict):
-                raise ValueError(f"Unexpected response type: {type(response)}")
+        except json.JSONDecodeError as e:
+            print(f"JSON decode error: {str(e)}")
+            raise RuntimeError(f"LLM returned invalid JSON: {str(e)}")
+        except Exception as e:
+            self._record_failure("llm_answer", e)
+            print(f"General error: {str(e)}")
+            raise RuntimeError(f"Error processing query: {str(e)}")
+    
+    async def process_query_async(self, df: Optional[pd.DataFrame], query: str, include_visualization: bool,
+                                  profile: Optional[DatasetProfile] = None,
+                                  tables: Optional[TableRegistry] = None,
+                                  history: Optional[list] = None) -> CSVQueryResponse:
+        """Async variant of process_query that waits for a slot in the request limiter"""
+        try:
+            if profile is None and tables is None:
+                with instrumentation.span("profile_build"):
+                    profile = DatasetProfile.from_dataframe("", df)
+            with instrumentation.span("prompt_build"):
+                messages, prompt = self._build_prompt(profile, query, include_visualization, tables, history)
             
-            # Create the response object
-            try:
-                return CSVQueryResponse(**response)
-            except Exception as e:
-                print(f"Error creating CSVQueryResponse: {str(e)}")
-                # Create a fallback response
-                return CSVQueryResponse(
-                    answer=str(response),
-                    create_visualization=False,
-                    visualization_params=None
-                )
+            async with self.limiter.slot() as wait:
+                instrumentation.record(llm_answer_queue_seconds=round(wait, 6))
+                with instrumentation.span("llm_answer"):
+                    response = await self.agent.run(prompt, message_history=messages)
+            self._record_run("llm_answer", response)
+            return self._parse_response(response)
             
         except json.JSONDecodeError as e:
             print(f"JSON decode error: {str(e)}")
             raise RuntimeError(f"LLM returned invalid JSON: {str(e)}")
         except Exception as e:
+            self._record_failure("llm_answer", e)
+            print(f"General error: {str(e)}")
+            raise RuntimeError(f"Error processing query: {str(e)}")
+    
+    async def stream_query_async(self, df: Optional[pd.DataFrame], query: str, include_visualization: bool,
+                                 profile: Optional[DatasetProfile] = None,
+                                 tables: Optional[TableRegistry] = None,
+                                 history: Optional[list] = None) -> AsyncIterator[CSVQueryResponse]:
+        """Streaming variant of process_query_async
+        
+        Yields partially validated responses as tokens arrive and the fully
+        validated response last, so only the final item is guaranteed to carry
+        complete visualization parameters. Time to first token and the total stream
+        time are recorded in the request trace.
+        """
+        try:
+            if profile is None and tables is None:
+                with instrumentation.span("profile_build"):
+                    profile = DatasetProfile.from_dataframe("", df)
+            with instrumentation.span("prompt_build"):
+                messages, prompt = self._build_prompt(profile, query, include_visualization, tables, history)
+            
+            async with self.limiter.slot() as wait:
+                instrumentation.record(llm_answer_queue_seconds=round(wait, 6))
+                start = time.perf_counter()
+                first_token = None
+                with instrumentation.span("llm_answer"):
+                    async with self.agent.run_stream(prompt, message_history=messages) as result:
+                        async for message, is_last in result.stream_structured(debounce_by=None):
+                            try:
+                                response = await result.validate_structured_result(message, allow_partial=not is_last)
+                            except ValidationError:
+                                if is_last:
+                                    raise
+                                # Too little of the JSON object has arrived to validate yet
+                                continue
+                            if first_token is None:
+                                first_token = time.perf_counter() - start
+                                self.last_ttft = first_token
+                                instrumentation.record(llm_answer_ttft_seconds=round(first_token, 6))
+                            yield response
+                self._record_run("llm_answer", result)
+            instrumentation.record(llm_answer_stream_seconds=round(time.perf_counter() - start, 6))
+            
+        except Exception as e:
+            self._record_failure("llm_answer", e)
             print(f"General error: {str(e)}")
-            raise RuntimeError(f"Error processing query: {str(e)}") 
\ No newline at end of file
+            raise RuntimeError(f"Error processing query: {str(e)}")
+    
+    def _build_plan_prompt(self, profile: DatasetProfile, query: str) -> str:
+        """Build the planning prompt
+        
+        The prompt only lists column names, dtypes and a few example values, so it
+        stays small regardless of the dataset size.
+        """
+        column_lines = []
+        for col in profile.columns:
+            line = f"- {col} ({profile.schema.get(col, 'unknown')})"
+            if col in profile.value_counts:
+                examples = ', '.join(str(value) for value in profile.value_counts[col].index[:5])
+                line += f", e.g. {examples}"
+            column_lines.append(line)
+        columns_text = '\n'.join(column_lines)
+        
+        return f"""
+        Translate the question into a query plan over a table with {profile.n_rows} rows and these columns:
+        {columns_text}
+        
+        Question: "{query}"
+        
+        Instructions:
+        1. Use only the column names listed above, spelled exactly as shown
+        2. Filters are combined with AND; use values exactly as they appear in the data
+        3. Omit the column of an aggregation to count rows
+        4. For top-N questions, sort by the aggregate and set limit to N
+        5. Set answerable to false if the question cannot be answered by filtering,
+           grouping, aggregating, sorting and limiting the rows of this table
+        """
+    
+    def _build_tables_plan_prompt(self, tables: TableRegistry, query: str) -> str:
+        """Build the planning prompt for a multi-table session, which may join tables"""
+        return f"""
+        Translate the question into a query plan over these tables:
+        
+        {tables.catalog_text(sample_rows=2)}
+        
+        Question: "{query}"
+        
+        Instructions:
+        1. Set table to the table the question is mainly about
+        2. When other tables are needed, add a join for each, matching key columns: left_on from the
+           tables joined so far, right_on from the joined table
+        3. Refer to columns as table.column, spelled exactly as listed above
+        4. Filters are combined with AND; use values exactly as they appear in the data
+        5. Omit the column of an aggregation to count rows
+        6. For top-N questions, sort by the aggregate and set limit to N
+        7. Set answerable to false if the question cannot be answered by joining, filtering,
+           grouping, aggregating, sorting and limiting the rows of these tables
+        """
+    
+    def plan_query(self, profile: Optional[DatasetProfile], query: str,
+                   tables: Optional[TableRegistry] = None) -> QueryPlan:
+        """Ask the LLM for a QueryPlan that answers the question by local computation
+        
+        With tables (a multi-table session) the plan may join them.
+        """
+        prompt = self._build_tables_plan_prompt(tables, query) if tables is not None \
+            else self._build_plan_prompt(profile, query)
+        try:
+            with instrumentation.span("llm_plan"):
+                response = self.planner.run_sync(prompt)
+            self._record_run("llm_plan", response)
+            return response.data
+        
+        except Exception as e:
+            self._record_failure("llm_plan", e)
+            print(f"Query planning error: {str(e)}")
+            raise RuntimeError(f"Error planning query: {str(e)}")
+    
+    async def plan_query_async(self, profile: Optional[DatasetProfile], query: str,
+                               tables: Optional[TableRegistry] = None) -> QueryPlan:
+        """Async variant of plan_query that waits for a slot in the request limiter"""
+        prompt = self._build_tables_plan_prompt(tables, query) if tables is not None \
+            else self._build_plan_prompt(profile, query)
+        try:
+            async with self.limiter.slot() as wait:
+                instrumentation.record(llm_plan_queue_seconds=round(wait, 6))
+                with instrumentation.span("llm_plan"):
+                    response = await self.planner.run(prompt)
+            self._record_run("llm_plan", response)
+            return response.data
+        
+        except Exception as e:
+            self._record_failure("llm_plan", e)
+            print(f"Query planning error: {str(e)}")
+            raise RuntimeError(f"Error planning query: {str(e)}")
\ No newline at end of file
@@ -19,4 +19,58 @@ class CSVQueryResponse(BaseModel):
     create_visualization: bool = Field(
         default=False, description="Whether a visualization should be created")
     visualization_params: Optional[Union[VisualizationParams, dict]] = Field(
-        default=None, description="Parameters for visualization if needed") 
\ No newline at end of file
+        default=None, description="Parameters for visualization if needed") 
+
+class FilterCondition(BaseModel):
+    """A row filter applied before grouping"""
+    model_config = ConfigDict(extra='allow')
+    column: str = Field(..., description="Column to filter on")
+    operator: Literal["==", "!=", ">", ">=", "<", "<=", "in", "not in", "contains"] = Field(
+        default="==", description="Comparison operator")
+    value: Union[str, int, float, bool, List[Union[str, int, float, bool]]] = Field(
+        ..., description="Value to compare against; a list for 'in' / 'not in'")
+
+class Aggregation(BaseModel):
+    """An aggregate computed per group (or over all filtered rows)"""
+    model_config = ConfigDict(extra='allow')
+    function: Literal["count", "sum", "mean", "median", "min", "max", "nunique"] = Field(
+        ..., description="Aggregate function")
+    column: Optional[str] = Field(
+        default=None, description="Column to aggregate; omit for a row count")
+    alias: Optional[str] = Field(
+        default=None, description="Name of the result column")
+
+class SortKey(BaseModel):
+    """Ordering applied to the aggregated result"""
+    model_config = ConfigDict(extra='allow')
+    column: str = Field(..., description="Result column (group-by column or aggregate alias) to sort by")
+    descending: bool = Field(default=True, description="Sort from largest to smallest")
+
+class Join(BaseModel):
+    """Another table joined to the rows of the tables joined so far"""
+    model_config = ConfigDict(extra='allow')
+    table: str = Field(..., description="Name of the table to join")
+    left_on: str = Field(..., description="Key column of the tables joined so far, as table.column")
+    right_on: str = Field(..., description="Key column of the joined table, as table.column")
+    how: Literal["inner", "left"] = Field(
+        default="inner", description="inner keeps matching rows only; left keeps every row of the left side")
+
+class QueryPlan(BaseModel):
+    """Structured plan for aggregate questions, executed locally by QueryEngine"""
+    model_config = ConfigDict(extra='allow')
+    answerable: bool = Field(
+        default=True, description="False if the question cannot be expressed as filter/group-by/aggregate/sort/limit")
+    table: Optional[str] = Field(
+        default=None, description="Table the question is about, when several tables are registered")
+    joins: List[Join] = Field(
+        default_factory=list, description="Other tables joined to table before filtering, in order")
+    filters: List[FilterCondition] = Field(
+        default_factory=list, description="Row filters, combined with AND")
+    group_by: List[str] = Field(
+        default_factory=list, description="Columns to group by")
+    aggregations: List[Aggregation] = Field(
+        default_factory=list, description="Aggregates to compute")
+    sort: List[SortKey] = Field(
+        default_factory=list, description="Ordering of the result")
+    limit: Optional[int] = Field(
+        default=None, description="Maximum number of result rows, e.g. for top-N questions")
@@ -0,0 +1,218 @@
+import difflib
+import math
+import re
+import pandas as pd
+from dataset_profile import DatasetProfile
+from table_registry import TableRegistry
+
+class PromptStats:
+    """Size of a built prompt and how much of the dataset it covers
+
+    For answer prompts, history_turns counts the replayed earlier turns and
+    estimated_reused_tokens estimates the prefix shared with a recently sent
+    prompt, which the model server need not prefill again if it still caches it.
+    """
+
+    def __init__(self, chars: int, estimated_tokens: int, columns_included: int, columns_total: int,
+                 token_budget: int, history_turns: int = 0, estimated_reused_tokens: int = 0):
+        self.chars = chars
+        self.estimated_tokens = estimated_tokens
+        self.columns_included = columns_included
+        self.columns_total = columns_total
+        self.token_budget = token_budget
+        self.history_turns = history_turns
+        self.estimated_reused_tokens = estimated_reused_tokens
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+    def __str__(self) -> str:
+        return (f"{self.chars} chars, ~{self.estimated_tokens} tokens (budget {self.token_budget}), "
+                f"{self.columns_included}/{self.columns_total} columns, {self.history_turns} earlier turns, "
+                f"~{self.estimated_reused_tokens} tokens shared with a recent prompt")
+
+class PromptBuilder:
+    """Builds the data-context part of the prompt within a token budget
+
+    Columns are ranked by how closely their names match the question, then added
+    in rank order (summary line plus value distribution truncated to the top_k
+    values and an 'other' bucket) until the budget is used up.
+    """
+
+    def __init__(self, token_budget: int = 6000, top_k_values: int = 10, chars_per_token: float = 4.0,
+                 max_sample_columns: int = 12):
+        self.token_budget = token_budget
+        self.top_k_values = top_k_values
+        self.chars_per_token = chars_per_token
+        self.max_sample_columns = max_sample_columns
+
+    def estimate_tokens(self, text: str) -> int:
+        """Rough token count; about four characters per token for English and numbers"""
+        return math.ceil(len(text) / self.chars_per_token)
+
+    @staticmethod
+    def rank_columns(columns: list, question: str) -> list:
+        """Order columns by relevance to the question, keeping file order among ties"""
+        scores = PromptBuilder.column_scores(columns, question)
+        return sorted(columns, key=lambda col: -scores[col])
+
+    @staticmethod
+    def column_scores(columns: list, question: str) -> dict:
+        """Column -> relevance to the question; 0 for columns the question does not mention"""
+        question = question.lower()
+        words = set(re.findall(r"[a-z0-9]+", question))
+        scores = {}
+        for col in columns:
+            name = str(col).lower()
+            parts = set(re.findall(r"[a-z0-9]+", name))
+            score = 0.0
+            if name in question:
+                score += 10
+            if parts:
+                score += 3 * len(parts & words) / len(parts)
+                fuzzy = sum(1 for part in parts - words if difflib.get_close_matches(part, words, n=1, cutoff=0.8))
+                score += fuzzy / len(parts)
+            scores[col] = score
+        return scores
+
+    @staticmethod
+    def _format_value(value) -> str:
+        if isinstance(value, float):
+            return str(int(value)) if value.is_integer() else f"{value:.6g}"
+        return str(value)
+
+    def _summary_line(self, profile: DatasetProfile, col) -> str:
+        stats = profile.summary[col].dropna() if col in profile.summary.columns else pd.Series(dtype=object)
+        freq_error = profile.error_bounds.get(col, {}).get("freq")
+        values = ", ".join(f"{name}={self._format_value(value)}"
+                           + (f" (low by up to {freq_error})" if name == "freq" and freq_error else "")
+                           for name, value in stats.items())
+        return f"- {col}: {values}\n"
+
+    def _distribution(self, profile: DatasetProfile, col) -> str:
+        value_counts = profile.value_counts.get(col)
+        # Columns where every value occurs once (IDs, timestamps) have no useful distribution
+        if value_counts is None or len(value_counts) == 0 or value_counts.iloc[0] <= 1:
+            return ""
+        return profile.distribution_text(col, self.top_k_values)
+
+    def build_context(self, profile: DatasetProfile, question: str = None,
+                      token_budget: int = None) -> tuple[str, PromptStats]:
+        """Return the data context for the question and its size statistics
+
+        Without a question the columns keep their file order, which gives the same
+        context for every question about the dataset.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        ranked = self.rank_columns(profile.columns, question) if question else list(profile.columns)
+
+        all_names = ", ".join(str(col) for col in profile.columns)
+        list_all_names = self.estimate_tokens(all_names) <= budget // 4
+
+        # Reserve room for the headers and the sample rows of the top-ranked columns
+        sample_candidates = [col for col in ranked if col in profile.sample.columns][:self.max_sample_columns]
+        used = self.estimate_tokens(profile.sample[sample_candidates].to_string()) + 100
+        used += self.estimate_tokens(all_names) if list_all_names else 0
+
+        # Add columns in rank order while they fit, always keeping at least one
+        selected = []
+        sections = {}
+        for col in ranked:
+            section = (self._summary_line(profile, col), self._distribution(profile, col))
+            cost = self.estimate_tokens(section[0]) + self.estimate_tokens(section[1])
+            if selected and used + cost > budget:
+                break
+            selected.append(col)
+            sections[col] = section
+            used += cost
+
+        context = self._render(profile, selected, sections, all_names if list_all_names else None)
+        # The reservation is an estimate; drop the least relevant columns if still over budget
+        while len(selected) > 1 and self.estimate_tokens(context) > budget:
+            selected.pop()
+            context = self._render(profile, selected, sections, all_names if list_all_names else None)
+
+        stats = PromptStats(
+            chars=len(context),
+            estimated_tokens=self.estimate_tokens(context),
+            columns_included=len(selected),
+            columns_total=len(profile.columns),
+            token_budget=budget,
+        )
+        return context, stats
+
+    def question_context(self, profile: DatasetProfile, question: str, shown: list, token_budget: int = None,
+                         max_columns: int = 5, min_score: float = 2.0) -> tuple[str, list]:
+        """Summary lines of the columns the question refers to that a question-independent context left out
+
+        Wide datasets do not fit the budget, so a stable context (build_context
+        without a question) covers only the first columns; this short block goes
+        after it, next to the question. A column counts as referred to when its
+        relevance reaches min_score, i.e. the question names it or most of the
+        words in its name. Returns the text (empty when nothing relevant was
+        left out) and the columns it covers.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        scores = self.column_scores(profile.columns, question)
+        shown = set(shown)
+        lines, added = "", []
+        for col in self.rank_columns(profile.columns, question):
+            if scores[col] < min_score or len(added) >= max_columns:
+                break
+            if col in shown:
+                continue
+            line = self._summary_line(profile, col)
+            if self.estimate_tokens(lines + line) > budget:
+                break
+            lines += line
+            added.append(col)
+        if not added:
+            return "", []
+        return "Columns the question refers to (not covered above):\n" + lines, added
+
+    def build_tables_context(self, tables: TableRegistry, token_budget: int = None) -> tuple[str, PromptStats]:
+        """Data context for a multi-table session: every table's columns and dtypes, plus sample rows if they fit
+
+        No statistics are precomputed for lazily loaded tables, so the context
+        describes their structure only.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        for sample_rows in (3, 1, 0):
+            context = tables.catalog_text(sample_rows)
+            if self.estimate_tokens(context) <= budget:
+                break
+        columns = sum(len(table.columns) for table in tables.tables.values())
+        stats = PromptStats(
+            chars=len(context),
+            estimated_tokens=self.estimate_tokens(context),
+            columns_included=columns,
+            columns_total=columns,
+            token_budget=budget,
+        )
+        return context, stats
+
+    def _render(self, profile: DatasetProfile, selected: list, sections: dict, all_names: str = None) -> str:
+        """Assemble the context text for the selected columns, shown in file order"""
+        selected_set = set(selected)
+        ordered = [col for col in profile.columns if col in selected_set]
+
+        if all_names is not None:
+            columns_line = all_names
+        else:
+            columns_line = ", ".join(str(col) for col in ordered)
+            columns_line += f" (and {len(profile.columns) - len(ordered)} more)"
+
+        context = "Data Overview:\n"
+        context += f"- Columns: {columns_line}\n"
+        context += f"- Total rows: {profile.n_rows}\n"
+        if len(ordered) < len(profile.columns):
+            context += f"- Details below cover {len(ordered)} of {len(profile.columns)} columns\n"
+        approximation = profile.approximation_text()
+        if approximation:
+            context += "\n" + approximation
+        context += "\nSummary Statistics:\n"
+        context += "".join(sections[col][0] for col in ordered)
+        sample_columns = set([col for col in selected if col in profile.sample.columns][:self.max_sample_columns])
+        context += f"\nSample Data:\n{profile.sample[[col for col in ordered if col in sample_columns]].to_string()}\n"
+        context += "".join(sections[col][1] for col in ordered)
+        return context
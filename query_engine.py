@@ -0,0 +1,189 @@
+import numpy as np
+import pandas as pd
+from models import QueryPlan, FilterCondition, Aggregation
+from table_registry import TableRegistry
+
+class QueryEngine:
+    """Module for executing structured query plans against a dataframe"""
+
+    @staticmethod
+    def execute(df: pd.DataFrame, plan: QueryPlan) -> tuple[pd.DataFrame, int]:
+        """Run a plan and return the result frame and the number of rows that passed the filters"""
+        QueryEngine._check_columns(df, plan)
+
+        mask = np.ones(len(df), dtype=bool)
+        for condition in plan.filters:
+            mask &= QueryEngine._filter_mask(df[condition.column], condition)
+        filtered = df[mask] if not mask.all() else df
+        matched_rows = int(mask.sum())
+
+        if plan.aggregations:
+            # Compactly stored float32 columns are summed and averaged in double precision
+            narrow = [agg.column for agg in plan.aggregations
+                      if agg.column is not None and filtered[agg.column].dtype == np.float32]
+            if narrow:
+                filtered = filtered.astype(dict.fromkeys(narrow, np.float64))
+            named = {QueryEngine._alias(agg): QueryEngine._named_agg(filtered, agg) for agg in plan.aggregations}
+            if plan.group_by:
+                result = filtered.groupby(plan.group_by, observed=True, sort=False).agg(**named).reset_index()
+            else:
+                result = pd.DataFrame({alias: [QueryEngine._aggregate(filtered, agg)]
+                                       for alias, agg in zip(named, plan.aggregations)})
+        elif plan.group_by:
+            result = filtered.groupby(plan.group_by, observed=True, sort=False).size().reset_index(name="count")
+        else:
+            result = filtered
+
+        if plan.sort:
+            missing = [key.column for key in plan.sort if key.column not in result.columns]
+            if missing:
+                raise ValueError(f"Cannot sort by unknown result columns: {', '.join(missing)}")
+            result = result.sort_values(
+                by=[key.column for key in plan.sort],
+                ascending=[not key.descending for key in plan.sort],
+                kind='stable',
+            )
+        if plan.limit is not None:
+            result = result.head(plan.limit)
+        return result.reset_index(drop=True), matched_rows
+
+    @staticmethod
+    def execute_tables(tables: TableRegistry, plan: QueryPlan) -> tuple[pd.DataFrame, int]:
+        """Run a plan over registered tables, loading only the columns it references
+
+        Joins are applied in order with pandas merges before the plan's filters.
+        Without joins the frame keeps bare column names; with joins every column
+        is named table.column so equal names in different tables stay apart.
+        """
+        names = [plan.table or tables.default_table] + [join.table for join in plan.joins]
+        unknown = [name for name in names if name not in tables.tables]
+        if unknown:
+            raise ValueError(f"Unknown tables in query plan: {', '.join(unknown)}")
+
+        # Resolve every reference to a (table, column) of the tables in scope
+        resolved = {}
+        for reference in QueryEngine.referenced_columns(plan):
+            resolved[reference] = tables.resolve(reference, names)
+        join_keys = []
+        for i, join in enumerate(plan.joins, 1):
+            left = tables.resolve(join.left_on, names[:i])
+            right = tables.resolve(join.right_on, [join.table])
+            join_keys.append((left, right))
+
+        needed = {name: [] for name in names}
+        for table, column in list(resolved.values()) + [key for pair in join_keys for key in pair]:
+            if column not in needed[table]:
+                needed[table].append(column)
+
+        if not plan.joins:
+            frame = tables[names[0]].load(needed[names[0]])
+            rename = {reference: column for reference, (_, column) in resolved.items()}
+        else:
+            frames = []
+            for name in names:
+                part = tables[name].load(needed[name])
+                part.columns = [f"{name}.{column}" for column in part.columns]
+                frames.append(part)
+            frame = frames[0]
+            for join, (left, right), right_frame in zip(plan.joins, join_keys, frames[1:]):
+                frame = frame.merge(right_frame, how=join.how,
+                                    left_on=".".join(left), right_on=".".join(right))
+            rename = {reference: ".".join(target) for reference, target in resolved.items()}
+
+        local_plan = plan.model_copy(update={
+            "filters": [c.model_copy(update={"column": rename[c.column]}) for c in plan.filters],
+            "group_by": [rename[col] for col in plan.group_by],
+            # Default aliases are derived from the column names the plan was written with
+            "aggregations": [agg.model_copy(update={"column": rename[agg.column] if agg.column else None,
+                                                    "alias": QueryEngine._alias(agg)})
+                             for agg in plan.aggregations],
+            "sort": [key.model_copy(update={"column": rename.get(key.column, key.column)}) for key in plan.sort],
+        })
+        return QueryEngine.execute(frame, local_plan)
+
+    @staticmethod
+    def referenced_columns(plan: QueryPlan) -> list:
+        """Columns read by the plan's filters, grouping and aggregates"""
+        referenced = [c.column for c in plan.filters] + list(plan.group_by)
+        referenced += [agg.column for agg in plan.aggregations if agg.column]
+        return referenced
+
+    @staticmethod
+    def _check_columns(df: pd.DataFrame, plan: QueryPlan) -> None:
+        missing = [col for col in QueryEngine.referenced_columns(plan) if col not in df.columns]
+        if missing:
+            raise ValueError(f"Unknown columns in query plan: {', '.join(missing)}")
+
+    @staticmethod
+    def _alias(agg: Aggregation) -> str:
+        if agg.alias:
+            return agg.alias
+        return f"{agg.function}_{agg.column}" if agg.column else agg.function
+
+    @staticmethod
+    def _named_agg(df: pd.DataFrame, agg: Aggregation) -> pd.NamedAgg:
+        if agg.column is None:
+            # Row count per group: count any column, nulls included
+            return pd.NamedAgg(column=df.columns[0], aggfunc='size')
+        return pd.NamedAgg(column=agg.column, aggfunc=agg.function)
+
+    @staticmethod
+    def _aggregate(df: pd.DataFrame, agg: Aggregation):
+        if agg.column is None:
+            return len(df)
+        return getattr(df[agg.column], agg.function)()
+
+    @staticmethod
+    def _coerce(series: pd.Series, value):
+        """Convert a plan value (usually parsed from JSON) to the column's type"""
+        if isinstance(value, list):
+            return [QueryEngine._coerce(series, item) for item in value]
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            return pd.Timestamp(value)
+        if pd.api.types.is_numeric_dtype(series.dtype) and isinstance(value, str):
+            try:
+                return float(value)
+            except ValueError:
+                return value
+        return value
+
+    @staticmethod
+    def _filter_mask(series: pd.Series, condition: FilterCondition) -> np.ndarray:
+        op = condition.operator
+        value = QueryEngine._coerce(series, condition.value)
+        if op == "contains":
+            mask = series.astype(str).str.contains(str(value), case=False, regex=False)
+        elif op in ("in", "not in"):
+            values = value if isinstance(value, list) else [value]
+            mask = series.isin(values)
+            if op == "not in":
+                mask = ~mask
+        elif op == "==":
+            mask = series == value
+        elif op == "!=":
+            mask = series != value
+        elif op == ">":
+            mask = series > value
+        elif op == ">=":
+            mask = series >= value
+        elif op == "<":
+            mask = series < value
+        elif op == "<=":
+            mask = series <= value
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        return mask.fillna(False).to_numpy(dtype=bool)
+
+    @staticmethod
+    def format_result(result: pd.DataFrame, matched_rows: int, max_rows: int = 50) -> str:
+        """Render a result frame as the answer text"""
+        if result.shape == (1, 1):
+            value = result.iat[0, 0]
+            if isinstance(value, (float, np.floating)):
+                value = f"{value:,.4f}".rstrip('0').rstrip('.')
+            return f"{result.columns[0]}: {value} (computed exactly over {matched_rows} rows)"
+        text = f"Computed exactly over {matched_rows} rows:\n\n"
+        text += result.head(max_rows).to_string(index=False)
+        if len(result) > max_rows:
+            text += f"\n... {len(result) - max_rows} more rows"
+        return text
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import pandas as pd
+from conversation import Conversation
+from dataset_profile import DatasetProfile
+from table_registry import TableRegistry
+
+DEFAULT_SESSION = "default"
+
+class SessionData:
+    """Dataset state belonging to one browser session
+
+    A single upload keeps its frame and profile; a multi-file upload keeps a
+    TableRegistry instead, and df and profile are None.
+    """
+
+    def __init__(self, df: Optional[pd.DataFrame], profile: Optional[DatasetProfile],
+                 tables: Optional[TableRegistry] = None):
+        self.df = df
+        self.profile = profile
+        self.tables = tables
+        self.nbytes = self.measure()
+        self.last_access = time.monotonic()
+        # Which path answered the latest question (see CSVAnalysisApp.answer_path)
+        self.last_answer_path = None
+        # Earlier questions about this dataset, for follow-up questions
+        self.conversation = Conversation()
+
+    def measure(self) -> int:
+        """Bytes held by the dataset; lazily loaded tables grow as columns are loaded"""
+        if self.tables is not None:
+            return self.tables.nbytes
+        return int(self.df.memory_usage(index=True, deep=True).sum())
+
+    @property
+    def content_hash(self) -> str:
+        """Identifies the session's data for the answer and figure caches"""
+        return self.profile.content_hash if self.profile is not None else self.tables.content_hash
+
+class SessionStore:
+    """Server-side registry of per-session datasets with a global memory budget
+
+    Datasets idle for longer than ttl_seconds are dropped, and when a new upload
+    would exceed max_bytes the least recently used sessions are evicted first.
+    The reason for each eviction is kept so the affected user can be told on
+    their next request instead of the data silently disappearing.
+    """
+
+    def __init__(self, max_bytes: int = 4 << 30, ttl_seconds: float = 3600, max_notices: int = 10000):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_notices = max_notices
+        self.total_bytes = 0
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._notices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, session_id: str, df: Optional[pd.DataFrame], profile: Optional[DatasetProfile],
+            tables: Optional[TableRegistry] = None) -> SessionData:
+        """Store the dataset for a session, evicting idle or least recently used sessions as needed"""
+        data = SessionData(df, profile, tables)
+        if data.nbytes > self.max_bytes:
+            raise MemoryError(
+                f"Dataset needs {data.nbytes / 1e6:.1f} MB, more than the server budget of "
+                f"{self.max_bytes / 1e6:.1f} MB; try streaming mode for files this large")
+        with self._lock:
+            self._remove(session_id)
+            self._notices.pop(session_id, None)
+            self._expire()
+            while self._sessions and self.total_bytes + data.nbytes > self.max_bytes:
+                victim = next(iter(self._sessions))
+                self._evict(victim, "the server needed memory for other users' datasets")
+            self._sessions[session_id] = data
+            self.total_bytes += data.nbytes
+        return data
+
+    def account(self, data: SessionData) -> None:
+        """Re-measure a session whose tables loaded more columns, evicting other sessions if over budget"""
+        with self._lock:
+            nbytes = data.measure()
+            stored = any(stored is data for stored in self._sessions.values())
+            if stored:
+                self.total_bytes += nbytes - data.nbytes
+            data.nbytes = nbytes
+            while stored and self.total_bytes > self.max_bytes:
+                victim = next((session_id for session_id, other in self._sessions.items() if other is not data), None)
+                if victim is None:
+                    break
+                self._evict(victim, "the server needed memory for other users' datasets")
+
+    def get(self, session_id: str) -> Optional[SessionData]:
+        """Return the session's dataset and mark it as recently used"""
+        with self._lock:
+            self._expire()
+            data = self._sessions.get(session_id)
+            if data is not None:
+                data.last_access = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return data
+
+    def pop_eviction_notice(self, session_id: str) -> Optional[str]:
+        """Return (once) a message explaining why the session's dataset was evicted"""
+        with self._lock:
+            return self._notices.pop(session_id, None)
+
+    def discard(self, session_id: str) -> None:
+        """Drop a session's dataset without leaving an eviction notice"""
+        with self._lock:
+            self._remove(session_id)
+
+    def _remove(self, session_id: str) -> Optional[SessionData]:
+        data = self._sessions.pop(session_id, None)
+        if data is not None:
+            self.total_bytes -= data.nbytes
+        return data
+
+    def _evict(self, session_id: str, reason: str) -> None:
+        if self._remove(session_id) is None:
+            return
+        self.evictions += 1
+        self._notices[session_id] = f"Your dataset was removed from memory because {reason}. Please upload it again."
+        while len(self._notices) > self.max_notices:
+            self._notices.popitem(last=False)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        # Sessions are ordered by last access, so stop at the first fresh one
+        while self._sessions:
+            session_id, data = next(iter(self._sessions.items()))
+            if now - data.last_access <= self.ttl_seconds:
+                break
+            self._evict(session_id, f"it was idle for more than {self.ttl_seconds / 60:.0f} minutes")
+
+    def stats(self) -> dict:
+        """Session count, memory use and eviction count"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,268 @@
+import numpy as np
+import pandas as pd
+
+def hash_values(series: pd.Series) -> np.ndarray:
+    """Return stable 64-bit hashes of the non-null values of a series"""
+    non_null = series.dropna()
+    if non_null.dtype == object:
+        # Same hashes, but skips factorizing, which costs more than it saves on high-cardinality strings
+        return pd.util.hash_array(non_null.to_numpy(), categorize=False)
+    return pd.util.hash_pandas_object(non_null, index=False).to_numpy(dtype=np.uint64)
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """Vectorized int.bit_length for uint64 arrays"""
+    x = x.copy()
+    length = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = x >= (np.uint64(1) << np.uint64(shift))
+        length[mask] += shift
+        x[mask] >>= np.uint64(shift)
+    return length + (x > 0)
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch using 2**precision one-byte registers"""
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        """Standard error of the estimate, relative to the true count"""
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def update(self, series: pd.Series) -> None:
+        """Add the non-null values of a series to the sketch"""
+        self.update_hashes(hash_values(series))
+
+    def update_hashes(self, hashes: np.ndarray) -> None:
+        """Add precomputed 64-bit hashes to the sketch"""
+        if len(hashes) == 0:
+            return
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        remainder = hashes << p
+        max_rank = 64 - self.precision + 1
+        rank = np.minimum(64 - _bit_length(remainder) + 1, max_rank).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        """Fold another sketch with the same precision into this one"""
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        """Estimated number of distinct values seen"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            return int(round(m * np.log(m / zeros)))
+        return int(round(raw))
+
+class TopValues:
+    """Bounded value counter (Misra-Gries) that keeps at most `capacity` values
+
+    While fewer than `capacity` distinct values have been seen the counts are
+    exact. After that, every reported count may be low by at most `error`.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='int64')
+        self.error = 0
+        self.exact = True
+
+    def update(self, series: pd.Series) -> None:
+        """Count the non-null values of a series"""
+        self.update_counts(series.value_counts())
+
+    def update_counts(self, counts: pd.Series) -> None:
+        """Fold a value -> count series into the counter"""
+        if len(counts) == 0:
+            return
+        if len(self.counts) == 0:
+            merged = counts.astype('int64')
+        else:
+            merged = self.counts.add(counts, fill_value=0).astype('int64')
+        if len(merged) > self.capacity:
+            threshold = int(merged.nlargest(self.capacity + 1).iloc[-1])
+            merged = merged - threshold
+            merged = merged[merged > 0]
+            self.error += threshold
+            self.exact = False
+        self.counts = merged
+
+    def merge(self, other: 'TopValues') -> None:
+        """Fold another counter into this one"""
+        self.update_counts(other.counts)
+        self.error += other.error
+        self.exact = self.exact and other.exact
+
+    def most_common(self, n: int = None) -> pd.Series:
+        """Counts sorted in descending order, optionally limited to the top n"""
+        counts = self.counts.sort_values(ascending=False, kind='stable')
+        return counts if n is None else counts.head(n)
+
+class CountMinSketch:
+    """Mergeable frequency sketch over 64-bit hashes
+
+    Estimates never undercount; with probability 1 - failure_probability a
+    value's estimate exceeds its true count by at most relative_error * total.
+    """
+
+    def __init__(self, width_bits: int = 16, depth: int = 4, seed: int = 0):
+        self.width_bits = width_bits
+        self.table = np.zeros((depth, 1 << width_bits), dtype=np.int64)
+        # Odd multipliers for multiply-shift hashing, one per row
+        rng = np.random.default_rng(seed)
+        self.multipliers = rng.integers(1, 1 << 63, depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.total = 0
+
+    @property
+    def relative_error(self) -> float:
+        return float(np.e / self.table.shape[1])
+
+    @property
+    def failure_probability(self) -> float:
+        return float(np.exp(-self.table.shape[0]))
+
+    def _indexes(self, hashes: np.ndarray, row: int) -> np.ndarray:
+        return ((hashes * self.multipliers[row]) >> np.uint64(64 - self.width_bits)).astype(np.int64)
+
+    def update_hashes(self, hashes: np.ndarray) -> None:
+        """Count precomputed 64-bit hashes"""
+        width = self.table.shape[1]
+        for row in range(self.table.shape[0]):
+            self.table[row] += np.bincount(self._indexes(hashes, row), minlength=width)
+        self.total += len(hashes)
+
+    def estimate_hashes(self, hashes: np.ndarray) -> np.ndarray:
+        """Estimated count of each hash"""
+        estimates = self.table[0][self._indexes(hashes, 0)]
+        for row in range(1, self.table.shape[0]):
+            np.minimum(estimates, self.table[row][self._indexes(hashes, row)], out=estimates)
+        return estimates
+
+    def merge(self, other: 'CountMinSketch') -> None:
+        """Fold another sketch with the same shape and seed into this one"""
+        self.table += other.table
+        self.total += other.total
+
+def heavy_hitters(values: pd.Series, k: int = 50, sketch: CountMinSketch = None,
+                  max_candidate_rows: int = 1 << 16, hashes: np.ndarray = None) -> tuple[pd.Series, int]:
+    """Most frequent non-null values, found with a count-min sketch instead of a full value_counts
+
+    Rows whose estimate reaches a threshold (at most the largest estimate, so
+    the heaviest values are always candidates) are counted exactly, so the
+    returned counts are exact. When more than max_candidate_rows rows qualify,
+    the candidates are ranked on an evenly spaced sample of that many rows and
+    only the 2k leading values are counted. Returns (value -> count, descending)
+    and an upper bound on the count of any value that is not listed. A caller
+    that already hashed the values passes the non-null values and hash_values(values).
+    """
+    if hashes is None:
+        values = values.dropna()
+        hashes = hash_values(values)
+    if len(values) == 0:
+        return pd.Series(dtype='int64'), 0
+    sketch = sketch or CountMinSketch()
+    sketch.update_hashes(hashes)
+    estimates = sketch.estimate_hashes(hashes)
+
+    # Rows per estimate, and how many rows have at least each estimate
+    rows_at = np.bincount(estimates)
+    # Rows of a value all share its estimate e, so rows / e lower-bounds the values at that level
+    levels = np.arange(len(rows_at))
+    values_at_least = np.cumsum((rows_at / np.maximum(levels, 1))[::-1])[::-1]
+    enough = np.nonzero(values_at_least >= 2 * k)[0]
+    # The highest estimate with at least 2k values above it, never above the largest estimate
+    threshold = int(enough[-1]) if len(enough) else 1
+    threshold = max(min(threshold, len(rows_at) - 1), 1)
+
+    candidates = np.nonzero(estimates >= threshold)[0]
+    sampled_out = 0
+    if len(candidates) > max_candidate_rows:
+        sample = candidates[np.linspace(0, len(candidates) - 1, max_candidate_rows).astype(np.int64)]
+        leaders = pd.Series(hashes[sample]).value_counts().index[:2 * k].to_numpy()
+        leading = np.isin(hashes[candidates], leaders)
+        # A value left out by the sample occurs at most as often as its estimate
+        if not leading.all():
+            sampled_out = int(estimates[candidates[~leading]].max())
+        candidates = candidates[leading]
+    counts = pd.Series(hashes[candidates]).value_counts()
+    top = counts.head(k)
+    first_row = pd.Series(candidates).groupby(hashes[candidates]).first()
+    result = pd.Series(top.to_numpy(), index=values.iloc[first_row[top.index].to_numpy()].to_numpy(), dtype='int64')
+    # An unlisted value stayed below the threshold, was left out by the sample or was outranked by the k-th value
+    unlisted_max = max(threshold - 1, sampled_out, int(counts.iloc[k]) if len(counts) > k else 0)
+    return result, unlisted_max
+
+class KLLSketch:
+    """Mergeable quantile sketch (KLL) over numeric values
+
+    Levels hold items of weight 2**level; a level over capacity is sorted and
+    every other item, from a random offset, is promoted to the next level.
+    """
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def rank_error(self) -> float:
+        """Normalized rank error of a single quantile at about 99% confidence"""
+        return 2.296 / self.k ** 0.9723
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, values: np.ndarray) -> None:
+        """Add values to the sketch; NaNs are ignored"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(self.levels[level])
+                # An odd item out stays behind so weights stay exact
+                keep = items[:len(items) % 2]
+                pairs = items[len(keep):]
+                promoted = pairs[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def merge(self, other: 'KLLSketch') -> None:
+        """Fold another sketch into this one"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+
+    def quantiles(self, fractions: list) -> list:
+        """Approximate values at the given fractions (0..1) of the sorted data"""
+        if self.n == 0:
+            return [float('nan')] * len(fractions)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype=np.int64)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        ranks = [min(max(fraction, 0.0), 1.0) * (cumulative[-1] - 1) for fraction in fractions]
+        return [float(items[np.searchsorted(cumulative, rank, side='right')]) for rank in ranks]
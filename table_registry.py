@@ -0,0 +1,183 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+import pandas as pd
+from csv_handler import CSVHandler
+from dtype_optimizer import DtypeOptimizer
+import instrumentation
+
+class LazyTable:
+    """A CSV file registered under a table name whose columns are parsed on first use
+
+    Registration only reads the header and a few sample rows, so the column list
+    and approximate dtypes are known up front. load() parses just the requested
+    columns with usecols, in one pass per call, and merges them into a cached
+    frame that later questions select from.
+    """
+
+    def __init__(self, name: str, path: str, sample_rows: int = 1000, optimize_dtypes: bool = True):
+        self.name = name
+        self.path = path
+        self.optimize_dtypes = optimize_dtypes
+        # Sample dtypes are pandas' inference; compact dtypes are only picked for the full column
+        head = pd.read_csv(path, nrows=sample_rows)
+        self.columns = head.columns.tolist()
+        self.sample = head.head(5)
+        self._sample_schema = {col: str(dtype) for col, dtype in head.dtypes.items()}
+        self.content_hash = CSVHandler.compute_content_hash(path)
+        # Number of data rows, known once any column has been loaded
+        self.n_rows = None
+        # Columns parsed so far, in the order they were loaded
+        self._frame = None
+        self._lock = threading.Lock()
+
+    @property
+    def schema(self) -> dict:
+        """Column -> dtype name; exact for loaded columns, inferred from the sample rows otherwise"""
+        frame = self._frame
+        loaded = frame.dtypes if frame is not None else {}
+        return {col: str(loaded[col]) if col in loaded else self._sample_schema[col] for col in self.columns}
+
+    @property
+    def loaded_columns(self) -> list:
+        frame = self._frame
+        return [col for col in self.columns if frame is not None and col in frame.columns]
+
+    @property
+    def nbytes(self) -> int:
+        frame = self._frame
+        loaded = int(frame.memory_usage(index=False, deep=True).sum()) if frame is not None else 0
+        return loaded + int(self.sample.memory_usage(index=True, deep=True).sum())
+
+    def load(self, columns: list) -> pd.DataFrame:
+        """Return a frame with the requested columns, parsing those not loaded yet
+
+        An empty column list still yields a frame of the right length (for row counts),
+        and a column requested twice appears twice.
+        """
+        unknown = [col for col in columns if col not in self.columns]
+        if unknown:
+            raise ValueError(f"Table {self.name} has no columns {', '.join(map(str, unknown))}")
+        with self._lock:
+            loaded = self._frame.columns if self._frame is not None else ()
+            missing = [col for col in dict.fromkeys(columns) if col not in loaded]
+            if not missing and self._frame is None:
+                # Nothing loaded yet: load the first column to learn the row count
+                missing = self.columns[:1]
+            if missing:
+                with instrumentation.span("column_load"):
+                    df = pd.read_csv(self.path, usecols=missing)[missing]
+                    if self.optimize_dtypes:
+                        df, _ = DtypeOptimizer.optimize(df)
+                # One concat per load instead of one insert per column, which would fragment the frame
+                self._frame = df if self._frame is None else pd.concat([self._frame, df], axis=1)
+                self.n_rows = len(df)
+                instrumentation.count("columns_loaded", len(missing))
+            frame = self._frame[list(columns)]
+        return frame
+
+class TableRegistry:
+    """Named CSV tables of one session, loaded column by column as queries need them
+
+    Columns are referenced either as "table.column" or, when only one of the
+    tables involved has a column of that name, by the bare column name.
+    """
+
+    def __init__(self, sample_rows: int = 1000):
+        self.sample_rows = sample_rows
+        self.tables = OrderedDict()
+
+    def register(self, path: str, name: Optional[str] = None) -> LazyTable:
+        """Register a CSV file; the table name defaults to the file name without extension"""
+        base = self._table_name(name or os.path.splitext(os.path.basename(path))[0])
+        name, suffix = base, 2
+        while name in self.tables:
+            name, suffix = f"{base}_{suffix}", suffix + 1
+        try:
+            table = LazyTable(name, path, sample_rows=self.sample_rows)
+        except Exception as e:
+            raise ValueError(f"Error registering {os.path.basename(path)}: {str(e)}")
+        self.tables[name] = table
+        return table
+
+    @staticmethod
+    def _table_name(text: str) -> str:
+        name = re.sub(r"\W+", "_", str(text)).strip("_").lower()
+        return name or "table"
+
+    def __getitem__(self, name: str) -> LazyTable:
+        if name not in self.tables:
+            raise ValueError(f"Unknown table {name}; registered tables: {', '.join(self.tables)}")
+        return self.tables[name]
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    @property
+    def default_table(self) -> str:
+        return next(iter(self.tables))
+
+    @property
+    def content_hash(self) -> str:
+        """Identifies the combined content of all tables and their names"""
+        digest = hashlib.sha256()
+        for name, table in self.tables.items():
+            digest.update(f"{name}={table.content_hash};".encode())
+        return digest.hexdigest()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(table.nbytes for table in self.tables.values())
+
+    def resolve(self, reference: str, among: Optional[list] = None) -> tuple[str, str]:
+        """Map a column reference to (table name, column name), searching the given tables"""
+        among = list(self.tables) if among is None else among
+        if "." in reference:
+            table, column = reference.split(".", 1)
+            if table in among and column in self.tables[table].columns:
+                return table, column
+        owners = [name for name in among if reference in self.tables[name].columns]
+        if len(owners) == 1:
+            return owners[0], reference
+        if owners:
+            raise ValueError(f"Column {reference} is ambiguous; use one of "
+                             f"{', '.join(f'{name}.{reference}' for name in owners)}")
+        raise ValueError(f"Unknown column {reference} in tables {', '.join(among)}")
+
+    def frame_for_columns(self, references: list) -> pd.DataFrame:
+        """Load the referenced columns, which must come from one table, named as referenced
+
+        Used for charts, whose VisualizationParams.columns can then stay unchanged.
+        """
+        resolved = [self.resolve(reference) for reference in references]
+        tables = {table for table, _ in resolved}
+        if len(tables) > 1:
+            raise ValueError(f"Chart columns come from different tables ({', '.join(sorted(tables))})")
+        table = tables.pop() if tables else self.default_table
+        # Load each column once, then select it once per reference (a chart may plot a column against itself)
+        frame = self.tables[table].load(list(dict.fromkeys(column for _, column in resolved)))
+        frame = frame[[column for _, column in resolved]]
+        frame.columns = list(references)
+        return frame
+
+    def catalog_text(self, sample_rows: int = 3) -> str:
+        """Table names, columns with dtypes and a few sample rows, for LLM prompts"""
+        text = "Tables:\n"
+        for name, table in self.tables.items():
+            rows = f", {table.n_rows} rows" if table.n_rows is not None else ""
+            text += f"\n{name} (file {os.path.basename(table.path)}{rows}):\n"
+            text += "".join(f"- {name}.{col} ({dtype})\n" for col, dtype in table.schema.items())
+            if sample_rows:
+                text += f"Sample rows:\n{table.sample.head(sample_rows).to_string()}\n"
+        return text
+
+    def info_text(self) -> str:
+        """Upload preview for a multi-file upload"""
+        text = f"Registered {len(self.tables)} tables. Columns are loaded when a question first needs them.\n"
+        for name, table in self.tables.items():
+            text += f"\n{name} ({os.path.basename(table.path)}), {len(table.columns)} columns:\n"
+            text += "".join(f"- {col} ({dtype})\n" for col, dtype in table.schema.items())
+        return text
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+from csv_handler import CSVHandler
+from dataset_profile import DatasetProfile
+
+def make_frame(n: int, start: int = 0, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2024-01-01", periods=n, freq="min").shift(start, freq="min")
+    price = rng.lognormal(3, 1, n).round(2)
+    price[rng.random(n) < 0.02] = np.nan
+    return pd.DataFrame({
+        "order_id": np.arange(start, start + n),
+        "order_date": dates.strftime("%Y-%m-%d %H:%M"),
+        "category": rng.choice(["Books", "Games", "Garden", "Toys"], n),
+        "customer": [f"c{value}" for value in rng.integers(0, n // 4, n)],
+        "price": price,
+        "quantity": rng.integers(1, 9, n),
+    })
+
+def assert_same_summary(profile: DatasetProfile, df: pd.DataFrame):
+    """The profile matches a fresh profile of df, up to rounding of merged means and stds and ties for top"""
+    fresh = DatasetProfile.from_dataframe(profile.content_hash, df)
+    assert list(profile.summary.index) == list(fresh.summary.index)
+    assert list(profile.summary.columns) == list(fresh.summary.columns)
+    for col in fresh.summary.columns:
+        for stat in fresh.summary.index:
+            merged, expected = profile.summary.at[stat, col], fresh.summary.at[stat, col]
+            if pd.isna(expected):
+                assert pd.isna(merged), (col, stat)
+            elif stat == "top":
+                # Any of several equally frequent values may be reported
+                assert (df[col] == merged).sum() == fresh.summary.at["freq", col], (col, merged, expected)
+            elif isinstance(expected, (float, np.floating)):
+                assert np.isclose(float(merged), float(expected), rtol=1e-9), (col, stat, merged, expected)
+            elif isinstance(expected, pd.Timestamp):
+                assert abs(merged - expected) < pd.Timedelta("1us"), (col, stat, merged, expected)
+            else:
+                assert merged == expected, (col, stat, merged, expected)
+    assert set(profile.value_counts) == set(fresh.value_counts)
+    for col, counts in fresh.value_counts.items():
+        assert profile.value_counts[col].sort_index().to_dict() == counts.sort_index().to_dict(), col
+    assert profile.schema == fresh.schema
+
+@pytest.fixture
+def grown_file(tmp_path):
+    """A CSV file, its full content and the content of its first 3000 rows, uploaded before the rest"""
+    path = tmp_path / "orders.csv"
+    make_frame(4000).to_csv(path, index=False)
+    content = path.read_bytes()
+    first = b"\n".join(content.split(b"\n")[:3001]) + b"\n"
+    return path, content, first
+
+def test_appended_rows_match_full_load(grown_file):
+    path, content, first = grown_file
+    handler = CSVHandler()
+    path.write_bytes(first)
+    df, _, profile = handler.load_csv(str(path), streaming=False)
+    path.write_bytes(content)
+    appended, _, appended_profile = handler.load_csv(str(path), streaming=False, previous_profile=profile,
+                                                     previous_df=df)
+    assert appended_profile.parent_hash == profile.content_hash
+    full, _, full_profile = handler.load_csv(str(path), streaming=False)
+    pd.testing.assert_frame_equal(appended, full)
+    assert appended_profile.content_hash == full_profile.content_hash
+    assert_same_summary(appended_profile, appended)
+
+def test_delta_file_matches_full_load(tmp_path):
+    handler = CSVHandler()
+    base, delta = make_frame(3000), make_frame(500, start=3000, seed=1)
+    base.to_csv(tmp_path / "base.csv", index=False)
+    delta.to_csv(tmp_path / "delta.csv", index=False)
+    pd.concat([base, delta], ignore_index=True).to_csv(tmp_path / "both.csv", index=False)
+    df, _, profile = handler.load_csv(str(tmp_path / "base.csv"), streaming=False)
+    combined, _, combined_profile = handler.append_csv(str(tmp_path / "delta.csv"), df, profile)
+    full, _, _ = handler.load_csv(str(tmp_path / "both.csv"), streaming=False)
+    pd.testing.assert_frame_equal(combined, full, check_categorical=False)
+    assert_same_summary(combined_profile, combined)
+
+def test_column_changing_kind_reloads_whole_file(grown_file):
+    path, content, first = grown_file
+    handler = CSVHandler()
+    path.write_bytes(first)
+    df, _, profile = handler.load_csv(str(path), streaming=False)
+    # An appended order id that is no longer numeric
+    path.write_bytes(content + b"X-1,2024-03-01 00:00,Toys,c1,9.5,1\n")
+    reloaded, _, reloaded_profile = handler.load_csv(str(path), streaming=False, previous_profile=profile,
+                                                     previous_df=df)
+    assert reloaded_profile.parent_hash is None
+    assert reloaded["order_id"].dtype == object
+    assert len(reloaded) == 4001
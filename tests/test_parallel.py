@@ -0,0 +1,54 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from csv_handler import CSVHandler
+from dataset_profile import DatasetProfile, ProfileBuilder
+from parallel import ByteRangeReader, split_byte_ranges
+
+@pytest.fixture
+def quoted_csv(tmp_path):
+    """CSV whose text fields contain newlines, commas and escaped quotes"""
+    rng = np.random.default_rng(0)
+    n = 2000
+    notes = np.array(['plain', 'two\nlines', 'he said "hi"\nthen left', 'a, b\n\nc', ''], dtype=object)
+    df = pd.DataFrame({
+        "id": np.arange(n),
+        "price": rng.random(n).round(4),
+        "note": notes[rng.integers(0, len(notes), n)],
+        "flag": rng.random(n) < 0.5,
+    })
+    path = tmp_path / "quoted.csv"
+    df.to_csv(path, index=False)
+    return str(path)
+
+@pytest.mark.parametrize("parts", [1, 2, 3, 7, 50])
+def test_byte_ranges_split_on_record_boundaries(quoted_csv, parts):
+    header_length, ranges = split_byte_ranges(quoted_csv, parts, block_size=64)
+    names = pd.read_csv(quoted_csv, nrows=0).columns.tolist()
+    assert ranges[0][0] == header_length
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    frames = [pd.read_csv(io.BufferedReader(ByteRangeReader(quoted_csv, start, end)), header=None, names=names)
+              for start, end in ranges]
+    pd.testing.assert_frame_equal(pd.concat(frames, ignore_index=True), pd.read_csv(quoted_csv))
+
+def test_parallel_parse_matches_serial(quoted_csv):
+    pd.testing.assert_frame_equal(CSVHandler.read_csv(quoted_csv, workers=4), pd.read_csv(quoted_csv))
+
+def test_parallel_profile_matches_serial(quoted_csv):
+    df = pd.read_csv(quoted_csv)
+    serial = DatasetProfile.from_dataframe("h", df)
+    parallel = DatasetProfile.from_dataframe("h", df, workers=4)
+    pd.testing.assert_frame_equal(parallel.summary, serial.summary)
+    assert parallel.column_stats.keys() == serial.column_stats.keys()
+
+def test_streamed_profile_over_processes_matches_serial(quoted_csv):
+    serial = ProfileBuilder("h")
+    for chunk in pd.read_csv(quoted_csv, chunksize=300):
+        serial.update(chunk)
+    serial = serial.build()
+    parallel = CSVHandler.stream_profile_parallel(quoted_csv, "h", workers=3, chunksize=300).build()
+    assert parallel.n_rows == serial.n_rows
+    for stat in ("count", "mean", "min", "max"):
+        assert np.isclose(parallel.summary.at[stat, "price"], serial.summary.at[stat, "price"])
+    assert parallel.value_counts["note"].sort_index().equals(serial.value_counts["note"].sort_index())
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from sketches import CountMinSketch, HyperLogLog, KLLSketch, TopValues, hash_values, heavy_hitters
+
+def zipf_values(n: int, seed: int = 0) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    return pd.Series([f"v{value}" for value in rng.zipf(1.3, n)])
+
+def test_hyperloglog_within_error_bound():
+    values = pd.Series(np.arange(200_000))
+    sketch = HyperLogLog()
+    sketch.update(values)
+    # Four standard errors
+    assert abs(sketch.estimate() - len(values)) <= 4 * sketch.relative_error * len(values)
+
+def test_hyperloglog_merge_matches_single_sketch():
+    values = pd.Series(np.arange(50_000) % 30_000)
+    whole, left, right = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    whole.update(values)
+    left.update(values.iloc[:25_000])
+    right.update(values.iloc[25_000:])
+    left.merge(right)
+    assert left.estimate() == whole.estimate()
+
+def test_hyperloglog_small_counts_are_exact():
+    sketch = HyperLogLog()
+    sketch.update(pd.Series(["a", "b", "c", "a"]))
+    assert sketch.estimate() == 3
+
+def test_top_values_counts_are_low_by_at_most_error():
+    values = zipf_values(100_000)
+    counter = TopValues(capacity=200)
+    for start in range(0, len(values), 10_000):
+        counter.update(values.iloc[start:start + 10_000])
+    true = values.value_counts()
+    assert not counter.exact
+    reported = counter.most_common()
+    assert (reported <= true[reported.index]).all()
+    assert (reported >= true[reported.index] - counter.error).all()
+    # Any value heavier than the error bound is still tracked
+    assert set(true[true > counter.error].index) <= set(reported.index)
+
+def test_top_values_exact_below_capacity():
+    values = pd.Series(list("aabbbc"))
+    counter = TopValues(capacity=10)
+    counter.update(values)
+    assert counter.exact and counter.error == 0
+    assert counter.most_common().to_dict() == {"b": 3, "a": 2, "c": 1}
+
+def test_count_min_never_undercounts():
+    values = zipf_values(200_000)
+    hashes = hash_values(values)
+    sketch = CountMinSketch(width_bits=10)
+    sketch.update_hashes(hashes)
+    true = values.value_counts()
+    estimates = pd.Series(sketch.estimate_hashes(hash_values(pd.Series(true.index))), index=true.index)
+    assert (estimates >= true).all()
+    within = (estimates - true) <= sketch.relative_error * sketch.total
+    # Each value exceeds the bound with probability at most failure_probability
+    assert within.mean() >= 1 - 2 * sketch.failure_probability
+
+def test_heavy_hitters_counts_are_exact_and_unlisted_bound_holds():
+    values = zipf_values(300_000, seed=1)
+    top, unlisted = heavy_hitters(values, k=20)
+    true = values.value_counts()
+    assert top.to_dict() == true[top.index].to_dict()
+    assert list(top.index) == list(true.index[:20])
+    assert true.drop(top.index).max() <= unlisted
+
+def test_heavy_hitters_lists_a_value_heavier_than_the_candidate_limit():
+    rng = np.random.default_rng(2)
+    values = pd.Series(np.where(rng.random(200_000) < 0.1, "direct", rng.integers(0, 100_000, 200_000).astype(str)))
+    top, unlisted = heavy_hitters(values, k=10, max_candidate_rows=1 << 12)
+    assert top.index[0] == "direct"
+    assert top.iloc[0] == (values == "direct").sum()
+    assert values.value_counts().drop(top.index).max() <= unlisted
+
+def test_kll_quantiles_within_rank_error():
+    rng = np.random.default_rng(3)
+    data = rng.lognormal(size=300_000)
+    sketch = KLLSketch()
+    for chunk in np.array_split(data, 30):
+        sketch.update(chunk)
+    ordered = np.sort(data)
+    fractions = [0.01, 0.25, 0.5, 0.75, 0.99]
+    for fraction, estimate in zip(fractions, sketch.quantiles(fractions)):
+        rank = np.searchsorted(ordered, estimate) / len(data)
+        assert abs(rank - fraction) <= sketch.rank_error
+
+def test_kll_merge_within_rank_error():
+    rng = np.random.default_rng(4)
+    data = rng.normal(size=200_000)
+    left, right = KLLSketch(seed=1), KLLSketch(seed=2)
+    left.update(data[:100_000])
+    right.update(data[100_000:])
+    left.merge(right)
+    median = left.quantiles([0.5])[0]
+    assert abs(np.searchsorted(np.sort(data), median) / len(data) - 0.5) <= left.rank_error
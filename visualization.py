@@ -1,71 +1,235 @@
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Optional
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.figure import Figure
 from models import VisualizationParams
 
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling
+
+    x must be sorted. The first and last points are always kept; every bucket in
+    between contributes the point forming the largest triangle with the point
+    kept from the previous bucket and the average of the next bucket.
+    """
+    n = len(x)
+    if n_out < 3 or n <= 2 * n_out:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start = edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
 class VisualizationGenerator:
     """Module for generating visualizations based on CSV data"""
-    
-    @staticmethod
-    def create_visualization(df: pd.DataFrame, params: VisualizationParams) -> plt.Figure:
-        """Generate a visualization based on the specified parameters"""
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
+
+    def __init__(self, histogram_threshold: int = 100000, scatter_threshold: int = 50000,
+                 line_threshold: int = 10000, line_points: int = 2000, max_categories: int = 20,
+                 hexbin_gridsize: int = 60, cache_size: int = 32):
+        """Configure when charts switch to their large-data rendering and the figure cache size
+
+        Above histogram_threshold rows histograms are binned with NumPy before
+        drawing, scatter plots above scatter_threshold become hexbin density plots,
+        and line charts above line_threshold are downsampled to line_points with
+        LTTB. Pie and bar charts show at most max_categories categories plus "Other".
+
+        Figures are built with the object-oriented Figure API and never registered
+        with pyplot's global figure manager, so rendering is thread-safe and a
+        figure is freed as soon as nothing references it. Up to cache_size
+        drawn figures are kept in pickled form, keyed by dataset hash and
+        parameters; every cache hit unpickles its own Figure, so callers never
+        share a figure that another thread may be drawing.
+        """
+        self.histogram_threshold = histogram_threshold
+        self.scatter_threshold = scatter_threshold
+        self.line_threshold = line_threshold
+        self.line_points = line_points
+        self.max_categories = max_categories
+        self.hexbin_gridsize = hexbin_gridsize
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _top_counts(self, series: pd.Series) -> pd.Series:
+        """Value counts limited to the most frequent categories plus an "Other" bucket"""
+        value_counts = series.value_counts()
+        if len(value_counts) <= self.max_categories:
+            return value_counts
+        top = value_counts.iloc[:self.max_categories]
+        top.index = top.index.astype(str)
+        return pd.concat([top, pd.Series({"Other": value_counts.iloc[self.max_categories:].sum()})])
+
+    def _top_group_means(self, df: pd.DataFrame, category: str, value: str) -> pd.Series:
+        """Mean of value per category for the most populated categories plus "Other" """
+        values = df[value].astype(np.float64) if df[value].dtype == np.float32 else df[value]
+        grouped = values.groupby(df[category], observed=True).agg(['sum', 'count'])
+        if len(grouped) <= self.max_categories:
+            return grouped['sum'] / grouped['count']
+        grouped = grouped.sort_values('count', ascending=False)
+        top, rest = grouped.iloc[:self.max_categories], grouped.iloc[self.max_categories:]
+        means = top['sum'] / top['count']
+        means.index = means.index.astype(str)
+        other = rest['sum'].sum() / rest['count'].sum() if rest['count'].sum() else np.nan
+        return pd.concat([means, pd.Series({"Other": other})])
+
+    def _draw_histogram(self, ax, series: pd.Series) -> None:
+        values = series.dropna()
+        if len(values) > self.histogram_threshold and pd.api.types.is_numeric_dtype(values.dtype):
+            # Bin in NumPy and draw 20 bars instead of handing every value to matplotlib
+            counts, edges = np.histogram(values.to_numpy(dtype=np.float64), bins=20)
+            ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge', edgecolor='black')
+            ax.grid(True)
+        else:
+            # Series.hist would look up pyplot's current figure, so draw on the axes directly
+            ax.hist(values.to_numpy(), bins=20, edgecolor='black')
+            ax.grid(True)
+
+    def _draw_scatter(self, ax, df: pd.DataFrame, x: str, y: str) -> None:
+        numeric = pd.api.types.is_numeric_dtype(df[x].dtype) and pd.api.types.is_numeric_dtype(df[y].dtype)
+        if len(df) > self.scatter_threshold and numeric:
+            # Density plot: cost and figure size no longer grow with the row count
+            points = df[[x, y]].dropna()
+            hexbin = ax.hexbin(points[x].to_numpy(dtype=np.float64), points[y].to_numpy(dtype=np.float64),
+                               gridsize=self.hexbin_gridsize, mincnt=1, cmap='viridis')
+            ax.figure.colorbar(hexbin, ax=ax, label="Count")
+        else:
+            df.plot.scatter(x=x, y=y, ax=ax)
+
+    def _draw_line(self, ax, df: pd.DataFrame, x: str, y: str) -> None:
+        data = df[[x, y]].dropna()
+        # Sort only the two plotted columns, and only when they are not already in order
+        if not data[x].is_monotonic_increasing:
+            data = data.iloc[np.argsort(data[x].to_numpy(), kind='stable')]
+        if len(data) > self.line_threshold and pd.api.types.is_numeric_dtype(data[y].dtype):
+            x_values = data[x]
+            if pd.api.types.is_datetime64_any_dtype(x_values.dtype):
+                x_numeric = x_values.to_numpy().astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+            elif pd.api.types.is_numeric_dtype(x_values.dtype):
+                x_numeric = x_values.to_numpy(dtype=np.float64)
+            else:
+                x_numeric = np.arange(len(data), dtype=np.float64)
+            keep = lttb_indices(x_numeric, data[y].to_numpy(dtype=np.float64), self.line_points)
+            data.iloc[keep].plot.line(x=x, y=y, ax=ax)
+        else:
+            data.plot.line(x=x, y=y, ax=ax, marker='o')
+
+    def create_visualization(self, df: pd.DataFrame, params: VisualizationParams,
+                             dataset_hash: Optional[str] = None) -> Figure:
+        """Generate a visualization based on the specified parameters
+
+        When dataset_hash identifies the content of df, the figure is memoized
+        under the hash and the parameters. Each call returns a figure of its own.
+        """
+        if dataset_hash is None:
+            return self._render(df, params)[0]
+
+        key = (dataset_hash, params.model_dump_json())
+        with self._lock:
+            pickled = self._cache.get(key)
+            if pickled is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+        if pickled is not None:
+            # Unpickling is a fraction of the cost of drawing and gives this caller a private copy
+            return pickle.loads(pickled)
+
+        fig, ok = self._render(df, params)
+        if not ok:
+            return fig
+        # Pickle before handing the figure out, while no other thread can be drawing it
+        pickled = pickle.dumps(fig)
+        with self._lock:
+            self._cache[key] = pickled
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return fig
+
+    def invalidate(self, dataset_hash: str) -> None:
+        """Drop every cached figure of a dataset"""
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == dataset_hash]:
+                del self._cache[key]
+
+    def cache_stats(self) -> dict:
+        """Figure cache size and hit/miss counters"""
+        with self._lock:
+            return {"entries": len(self._cache), "hits": self.cache_hits, "misses": self.cache_misses}
+
+    def _render(self, df: pd.DataFrame, params: VisualizationParams) -> tuple[Figure, bool]:
+        """Draw a new figure for the parameters; the flag is False if an error figure was drawn instead"""
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
         try:
             viz_type = params.visualization_type
             columns = params.columns
             title = params.title or f"Visualization of {', '.join(columns)}"
-            
+
             if viz_type == "histogram" and len(columns) >= 1:
-                df[columns[0]].hist(ax=ax, bins=20, edgecolor='black')
+                self._draw_histogram(ax, df[columns[0]])
                 ax.set_title(title or f"Histogram of {columns[0]}")
                 ax.set_xlabel(columns[0])
                 ax.set_ylabel("Frequency")
-            
+
             elif viz_type == "pie" and len(columns) >= 1:
-                value_counts = df[columns[0]].value_counts()
+                value_counts = self._top_counts(df[columns[0]])
                 wedges, texts, autotexts = ax.pie(
-                    value_counts, 
-                    labels=value_counts.index, 
+                    value_counts,
+                    labels=value_counts.index,
                     autopct='%1.1f%%',
                     textprops={'fontsize': 10}
                 )
                 ax.set_title(title or f"Distribution of {columns[0]}")
                 ax.axis('equal')
-            
+
             elif viz_type == "bar":
                 if len(columns) >= 2:
                     # Two columns: category and value
-                    df.groupby(columns[0])[columns[1]].mean().plot(kind='bar', ax=ax)
+                    self._top_group_means(df, columns[0], columns[1]).plot(kind='bar', ax=ax)
                     ax.set_title(title or f"Average {columns[1]} by {columns[0]}")
                     ax.set_xlabel(columns[0])
                     ax.set_ylabel(f"Average {columns[1]}")
                 elif len(columns) >= 1:
                     # One column: count by category
-                    df[columns[0]].value_counts().plot(kind='bar', ax=ax)
+                    self._top_counts(df[columns[0]]).plot(kind='bar', ax=ax)
                     ax.set_title(title or f"Count of {columns[0]}")
                     ax.set_xlabel(columns[0])
                     ax.set_ylabel("Count")
-            
+
             elif viz_type == "scatter" and len(columns) >= 2:
-                df.plot.scatter(x=columns[0], y=columns[1], ax=ax)
+                self._draw_scatter(ax, df, columns[0], columns[1])
                 ax.set_title(title or f"{columns[1]} vs {columns[0]}")
                 ax.set_xlabel(columns[0])
                 ax.set_ylabel(columns[1])
-            
+
             elif viz_type == "line" and len(columns) >= 2:
-                df.sort_values(by=columns[0]).plot.line(x=columns[0], y=columns[1], ax=ax, marker='o')
+                self._draw_line(ax, df, columns[0], columns[1])
                 ax.set_title(title or f"{columns[1]} over {columns[0]}")
                 ax.set_xlabel(columns[0])
                 ax.set_ylabel(columns[1])
-            
-            plt.tight_layout()
-            return fig
-        
+
+            fig.tight_layout()
+            return fig, True
+
         except Exception as e:
             # Handle visualization errors
-            plt.close(fig)
-            fig, ax = plt.subplots()
-            ax.text(0.5, 0.5, f"Error generating visualization: {str(e)}", 
+            fig = Figure()
+            ax = fig.subplots()
+            ax.text(0.5, 0.5, f"Error generating visualization: {str(e)}",
                     ha='center', va='center')
-            return fig 
\ No newline at end of file
+            return fig, False
\ No newline at end of file